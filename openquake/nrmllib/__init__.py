@@ -18,6 +18,8 @@ NRML base path
 """
 
 import os
+import time
+import threading
 from lxml import etree
 
 __version__ = "0.4.5"
@@ -32,7 +34,28 @@ SERIALIZE_NS_MAP = {None: NAMESPACE, 'gml': GML_NAMESPACE}
 
 _NRML_SCHEMA_FILE = 'nrml.xsd'
 
-_NRML_SCHEMA = None  # defined in assert_valid
+#: Wrapper used to compile a subset of the NRML schema; the common
+#: definitions are always included, the <nrml> root accepts any globally
+#: declared element of the included sub-schemas
+_SUB_SCHEMA_TMPL = '''\
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema"
+           xmlns="%(ns)s"
+           targetNamespace="%(ns)s"
+           elementFormDefault="qualified">
+    <xs:import namespace="%(gml_ns)s" schemaLocation="./gml/gmlsf.xsd"/>
+    <xs:include schemaLocation="./nrml_common.xsd"/>
+    <xs:include schemaLocation="./hazard/general.xsd"/>
+    <xs:include schemaLocation="./risk/general.xsd"/>
+%(includes)s
+    <xs:element name="nrml">
+        <xs:complexType>
+            <xs:sequence>
+                <xs:any namespace="##targetNamespace" processContents="strict"
+                        maxOccurs="unbounded"/>
+            </xs:sequence>
+        </xs:complexType>
+    </xs:element>
+</xs:schema>'''
 
 
 class InvalidFile(Exception):
@@ -47,28 +70,138 @@ def nrml_schema_file():
         os.path.abspath(os.path.dirname(__file__)),
         'schema', _NRML_SCHEMA_FILE)
 
+
+class SchemaRegistry(object):
+    """
+    Process-wide cache of compiled NRML schemas. Each schema is compiled
+    lazily the first time it is requested and then shared by all the
+    parsers; the registry is thread-safe.
+
+    The full NRML schema is returned by `.get()`; passing a list of
+    sub-schema paths, relative to the schema directory (for instance
+    `.get('hazard/site_model.xsd')`), returns a smaller schema
+    containing only the given definitions, which is faster to compile.
+
+    The attributes `hits`, `misses` and `compile_time` (in seconds)
+    keep track of the usage of the registry.
+    """
+    def __init__(self):
+        self._schemas = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.compile_time = 0.
+
+    def get(self, *sub_schemas):
+        """
+        :param sub_schemas: paths relative to the NRML schema directory
+        :returns: a :class:`lxml.etree.XMLSchema` instance
+        """
+        key = tuple(sorted(set(sub_schemas)))
+        with self._lock:
+            schema = self._schemas.get(key)
+            if schema is not None:
+                self.hits += 1
+                return schema
+            t0 = time.time()
+            schema = self._schemas[key] = self._compile(key)
+            self.compile_time += time.time() - t0
+            self.misses += 1
+            return schema
+
+    @staticmethod
+    def _compile(sub_schemas):
+        """
+        Compile the full NRML schema if `sub_schemas` is empty, otherwise
+        a wrapper schema including only the given sub-schemas.
+        """
+        fname = nrml_schema_file()
+        if not sub_schemas:
+            return etree.XMLSchema(etree.parse(fname))
+        includes = '\n'.join('    <xs:include schemaLocation="./%s"/>' % s
+                             for s in sub_schemas)
+        wrapper = _SUB_SCHEMA_TMPL % dict(
+            ns=NAMESPACE, gml_ns=GML_NAMESPACE, includes=includes)
+        # the base_url is needed to resolve the relative schema locations
+        return etree.XMLSchema(etree.XML(wrapper, base_url=fname))
+
+    def stats(self):
+        """
+        Return a dictionary with the usage counters of the registry
+        """
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses,
+                        compile_time=self.compile_time,
+                        schemas=len(self._schemas))
+
+    def clear(self):
+        """
+        Drop all the compiled schemas and reset the counters
+        """
+        with self._lock:
+            self._schemas.clear()
+            self.hits = 0
+            self.misses = 0
+            self.compile_time = 0.
+
+#: The registry shared by all the NRML parsers in the current process
+SCHEMA_REGISTRY = SchemaRegistry()
+
+
+def get_schema(*sub_schemas):
+    """
+    Return the compiled NRML schema (or a subset of it) from the
+    process-wide registry. See :class:`SchemaRegistry`.
+    """
+    return SCHEMA_REGISTRY.get(*sub_schemas)
+
 COMPATPARSER = etree.ETCompatXMLParser()
 
+#: Validation modes accepted by the parsers:
+#: 'eager' validates the whole document before parsing it,
+#: 'streaming' validates the document while parsing it, in a single pass,
+#: None skips the validation (only for trusted, already validated inputs)
+VALIDATION_MODES = ('eager', 'streaming', None)
 
-def assert_valid(source, parser=COMPATPARSER):
+
+def check_validation(validation):
     """
-    Raises a `lxml.etree.DocumentInvalid` error for invalid files.
-    NB: it works by keeping the whole tree in memory.
+    Make sure `validation` is one of the :data:`VALIDATION_MODES` and
+    return it.
+    """
+    if validation not in VALIDATION_MODES:
+        raise ValueError('Invalid validation mode %r, expected one of %s'
+                         % (validation, VALIDATION_MODES))
+    return validation
+
+
+def source_name(source):
+    """
+    Return the name of a source, to be used in error messages.
 
     :param source: a filename or a file-like object.
     """
-    global _NRML_SCHEMA
     if isinstance(source, basestring):
         fname = source
         if not os.path.exists(fname):
             raise IOError('[Errno 2] No such file or directory: %r' % fname)
     else:
         fname = getattr(source, 'name', '<%s>' % source.__class__.__name__)
-    if _NRML_SCHEMA is None:  # the nrml schema is parsed only once
-        _NRML_SCHEMA = etree.XMLSchema(etree.parse(nrml_schema_file()))
+    return fname
+
+
+def assert_valid(source, parser=COMPATPARSER):
+    """
+    Raises a `lxml.etree.DocumentInvalid` error for invalid files.
+    NB: it works by keeping the whole tree in memory.
+
+    :param source: a filename or a file-like object.
+    """
+    fname = source_name(source)
+    schema = get_schema()  # the nrml schema is parsed only once
     try:
         parsed = etree.parse(source, parser)
-        _NRML_SCHEMA.assertValid(parsed)
+        schema.assertValid(parsed)
     except Exception as e:
         raise InvalidFile('%s:%s' % (fname, e))
     return parsed
@@ -99,8 +232,56 @@ class NRMLFile(object):
         self._file.close()
 
 
-def iterparse_tree(source, events=('start', 'end')):
-    schema = etree.XMLSchema(etree.parse(nrml_schema_file()))
+def iterparse_tree(source, events=('start', 'end'), sub_schemas=(),
+                   prune_tags=(), tags=None):
+    """
+    Return an iterparse object validating the source against the NRML
+    schema (or a subset of it) taken from the shared schema registry.
+
+    :param source: a filename or a file-like object
+    :param events: the events to be generated by the iterparse
+    :param sub_schemas: paths of the sub-schemas to validate against;
+                        if empty, use the full NRML schema
+    :param prune_tags: if given, the iterparse object is wrapped with
+                       :func:`iter_pruned`; `events` must include 'end'
+    :param tags: if given, only the events of the elements with these tags
+                 are generated; the filtering is performed by lxml, so it
+                 is much faster than skipping the events in Python
+    """
+    schema = get_schema(*sub_schemas)
 
-    tree = etree.iterparse(source, events=events, schema=schema)
+    tree = etree.iterparse(source, events=events, schema=schema, tag=tags)
+    if prune_tags:
+        return iter_pruned(tree, prune_tags)
     return tree
+
+
+def prune(element):
+    """
+    Free the memory used by an element which has been completely processed,
+    by clearing it and deleting its previous siblings (the elements before
+    it with the same parent, possibly comments).
+
+    :param element: an :class:`lxml.etree._Element` instance
+    """
+    element.clear()
+    while element.getprevious() is not None:
+        del element.getparent()[0]
+
+
+def iter_pruned(tree, tags):
+    """
+    Iterate over an iterparse object by pruning the elements with the given
+    tags after their 'end' event, so that the memory occupation does not
+    grow with the size of the document. The pruning happens when the
+    iteration is resumed, i.e. after the caller has processed the element.
+
+    :param tree: an iterable over pairs (event, element), like the
+                 objects returned by :func:`iterparse_tree`
+    :param tags: the tags of the elements to prune
+    """
+    tags = frozenset(tags)
+    for event, element in tree:
+        yield event, element
+        if event == 'end' and element.tag in tags:
+            prune(element)
@@ -0,0 +1,156 @@
+# Copyright (c) 2010-2014, GEM Foundation.
+#
+# NRML is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NRML is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with NRML.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Formatting of the sequences of floats written by the hazard and risk
+writers. A sequence is formatted in a single operation: the format string
+of the whole sequence is built once (and cached) and applied to the tuple
+of values, and NumPy arrays are converted to Python floats with `tolist`,
+which is much faster than iterating over the array, unless the str of the
+NumPy scalars (the default format) differs from the str of the floats.
+
+The possible formats are None (the `str` of each value, i.e. the
+historical output of the writers), 'repr' (the shortest representation
+which can be read back exactly) and printf-style formats like '%.5E'.
+The writers accept a `float_format` argument, for instance::
+
+    HazardCurveXMLWriter(path, float_format='%.5E', **metadata)
+
+and when it is not given they use the default of each kind of output,
+listed in :data:`FLOAT_FORMATS`.
+"""
+
+import numpy
+
+#: The default formats of the floats written by the writers, by kind of
+#: output; they are never modified, a writer given a `float_format` uses
+#: it for all the kinds of output it writes
+FLOAT_FORMATS = {
+    'imls': None,
+    'poes': None,
+    'periods': None,
+    'losses': None,
+    'loss_ratios': None,
+    'average_losses': '%.4e',
+    'aggregate_losses': '%.4f',
+    'disagg_probs': None,
+    'rupture_coords': None,
+}
+
+# the str of a NumPy float64 is the str of the Python float before
+# NumPy 1.14 and its (slower) repr since then
+_FLOAT64_STR_IS_FLOAT_STR = str(numpy.float64(0.1 + 0.2)) == str(0.1 + 0.2)
+
+# cache (fmt, sep, number of values) -> format string of the sequence
+_SEQ_FORMATS = {}
+_MAX_SEQ_FORMATS = 1000
+
+
+def check_float_format(fmt):
+    """
+    :param fmt: None, 'repr' or a printf-style format like '%.5E'
+    :returns: `fmt`
+    :raises ValueError: if the format is invalid
+    """
+    if fmt not in (None, 'repr'):
+        try:
+            fmt % 1.0
+        except (TypeError, ValueError):
+            raise ValueError('Invalid float format %r' % (fmt,))
+    return fmt
+
+
+def printf_values(values, fmt=None):
+    """
+    Convert a sequence of floats into the arguments of a printf-style
+    operation.
+
+    :param values:
+        a sequence or a NumPy array of floats; arrays with more than one
+        dimension are flattened
+    :param fmt:
+        None, 'repr' or a printf-style format like '%.5E'
+    :returns:
+        a pair (format of a single value, list or tuple of values)
+    """
+    if isinstance(values, numpy.ndarray):
+        values = values.ravel()
+        if fmt is None and not (_FLOAT64_STR_IS_FLOAT_STR and
+                                values.dtype == numpy.float64):
+            # the str of the NumPy scalars (e.g. of a float32) differs
+            # from the str of the corresponding Python floats
+            values = list(values)
+        else:
+            values = values.tolist()
+    elif not isinstance(values, (list, tuple)):
+        values = list(values)
+    if fmt is None:
+        return '%s', values
+    elif fmt == 'repr':
+        return '%r', values
+    return fmt, values
+
+
+def format_floats(values, fmt=None, sep=' '):
+    """
+    Format a sequence of floats as a string.
+
+    :param values:
+        a sequence or a NumPy array of floats; arrays with more than one
+        dimension are flattened
+    :param fmt:
+        None, 'repr' or a printf-style format like '%.5E'
+    :param str sep:
+        the separator of the values
+
+    >>> format_floats([0.1, 1.0, 1E-9])
+    '0.1 1.0 1e-09'
+    >>> format_floats(numpy.array([[0.1, 0.2], [0.3, 0.4]]), '%.2E', ',')
+    '1.00E-01,2.00E-01,3.00E-01,4.00E-01'
+    """
+    value_fmt, values = printf_values(values, fmt)
+    return _seq_format(value_fmt, sep, len(values)) % tuple(values)
+
+
+def format_output(kind, values, float_format=None, sep=' '):
+    """
+    Format a sequence of floats with the given format or, if None, with
+    the default format of the given kind of output.
+
+    :param str kind: a key of :data:`FLOAT_FORMATS`
+    :param values: a sequence or a NumPy array of floats
+    :param float_format: None, 'repr' or a printf-style format
+    :param str sep: the separator of the values
+    """
+    if float_format is None:
+        float_format = FLOAT_FORMATS[kind]
+    return format_floats(values, float_format, sep)
+
+
+def _seq_format(fmt, sep, num_values):
+    """
+    :returns:
+        the format string for `num_values` values with format `fmt`
+        separated by `sep`
+    """
+    key = fmt, sep, num_values
+    try:
+        return _SEQ_FORMATS[key]
+    except KeyError:
+        if len(_SEQ_FORMATS) >= _MAX_SEQ_FORMATS:
+            _SEQ_FORMATS.clear()
+        seq_fmt = _SEQ_FORMATS[key] = sep.replace('%', '%%').join(
+            [fmt] * num_values)
+        return seq_fmt
@@ -0,0 +1,218 @@
+# Copyright (c) 2010-2014, GEM Foundation.
+#
+# NRML is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NRML is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with NRML.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+On-disk cache of parsed source models, so that the same source model
+XML files are not parsed again and again by repeated hazard jobs.
+
+The entries are pickled :class:`openquake.nrmllib.models.SourceModel`
+instances, keyed by the SHA1 digest of the XML content, by the version of
+nrmllib and by the version of the pickle format, so that a change in the
+file or an upgrade of the library automatically invalidates them. When the
+total size of the cache exceeds `max_size` the least recently used entries
+are evicted.
+"""
+
+import os
+import hashlib
+import tempfile
+import cPickle
+
+import openquake.nrmllib
+
+from openquake.nrmllib import models
+
+#: Default location of the cache, can be overridden with the environment
+#: variable NRML_CACHE_DIR
+DEFAULT_CACHE_DIR = os.environ.get(
+    'NRML_CACHE_DIR', os.path.expanduser('~/.cache/nrmllib/source_models'))
+
+#: Default maximum size of the cache, in bytes
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+#: Version of the layout of the pickled entries; bump it whenever the
+#: pickled classes change in an incompatible way (e.g. new `__slots__`)
+CACHE_FORMAT_VERSION = '2'
+
+_SUFFIX = '.pik'
+_BLOCK_SIZE = 1024 * 1024
+
+
+class SourceModelCache(object):
+    """
+    Directory of pickled source models with a LRU eviction policy.
+
+    :param str cache_dir:
+        The directory containing the cached source models; it is
+        created if it does not exist.
+    :param int max_size:
+        The maximum size of the cache, in bytes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def key(self, fname, variant=''):
+        """
+        :param str fname: the path of a source model file
+        :param str variant: a string identifying the parser options
+        :returns:
+            the hex digest of the nrmllib version, cache format version,
+            variant and file content
+        """
+        digest = hashlib.sha1(openquake.nrmllib.__version__)
+        digest.update(CACHE_FORMAT_VERSION)
+        digest.update(variant)
+        with open(fname, 'rb') as f:
+            for block in iter(lambda: f.read(_BLOCK_SIZE), ''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + _SUFFIX)
+
+    def get(self, fname, variant=''):
+        """
+        :param str fname: the path of a source model file
+        :param str variant: a string identifying the parser options
+        :returns:
+            the cached :class:`openquake.nrmllib.models.SourceModel`
+            or None if the file is not in the cache
+        """
+        return self._get(self.key(fname, variant))
+
+    def _get(self, key):
+        path = self._path(key)
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            return None
+        try:
+            with f:
+                src_model = cPickle.load(f)
+        except Exception:
+            # a truncated entry or one written by an incompatible version
+            # of the library (unpickling can raise almost anything)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        os.utime(path, None)  # mark the entry as recently used
+        return src_model
+
+    def put(self, fname, src_model, variant=''):
+        """
+        Store a source model in the cache, then evict the least recently
+        used entries if the cache is too big.
+
+        :param str fname: the path of the source model file
+        :param src_model: a :class:`openquake.nrmllib.models.SourceModel`
+        :param str variant: a string identifying the parser options
+        :returns:
+            a :class:`openquake.nrmllib.models.SourceModel` with the
+            sources in a list, since the original ones may be a generator
+        """
+        return self._put(self.key(fname, variant), src_model)
+
+    def _put(self, key, src_model):
+        src_model = models.SourceModel(src_model.name, list(src_model))
+        # write to a temporary file and rename it, so that concurrent
+        # processes never see a partially written entry
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            cPickle.dump(src_model, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, self._path(key))
+        self.evict()
+        return src_model
+
+    def load(self, fname, parse, variant=''):
+        """
+        :param str fname: the path of a source model file
+        :param parse: a callable returning the parsed source model
+        :param str variant: a string identifying the parser options
+        :returns:
+            the cached source model, or the result of `parse()`, which is
+            stored in the cache
+        """
+        key = self.key(fname, variant)  # hash the file only once
+        src_model = self._get(key)
+        if src_model is None:
+            src_model = self._put(key, parse())
+        return src_model
+
+    def invalidate(self, fname, variant=''):
+        """
+        Remove the entry corresponding to the given file, if any.
+
+        :param str fname: the path of a source model file
+        :param str variant: a string identifying the parser options
+        """
+        try:
+            os.remove(self._path(self.key(fname, variant)))
+        except OSError:
+            pass
+
+    def entries(self):
+        """
+        :returns:
+            a list of triples (access time, size, path) for the entries
+            of the cache, sorted from the least to the most recently used
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(_SUFFIX):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:  # removed by another process
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def size(self):
+        """
+        :returns: the total size of the cache entries, in bytes
+        """
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the size of the
+        cache is not larger than `max_size`.
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        Remove all the entries of the cache.
+        """
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
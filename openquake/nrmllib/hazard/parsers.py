@@ -20,28 +20,100 @@ data.
 See :module:`openquake.nrmllib.models`.
 """
 
+import re
+import math
 import decimal
 import json
+import operator
 import warnings
+import itertools
+import StringIO
+import multiprocessing
 from collections import OrderedDict
 
+import numpy
+from lxml import etree
+
 import openquake.nrmllib
 
 from openquake.nrmllib import models
 from openquake.nrmllib import utils
 
 
-def _xpath(elem, expr):
-    """Helper function for executing xpath queries on an XML element. This
-    function uses the default mapping of namespaces (which includes NRML and
+def _check_geometry(geometry):
+    """
+    :param str geometry: the `geometry` argument of a parser
+    :raises ValueError: if it is not in :data:`GEOMETRY_TYPES`
+    """
+    if geometry not in GEOMETRY_TYPES:
+        raise ValueError('Invalid geometry=%r, must be one of %s'
+                         % (geometry, GEOMETRY_TYPES))
+
+
+def _to_array(text, dims):
+    """
+    :param str text: the text of a <gml:pos> or <gml:posList> element
+    :param int dims: the number of dimensions of the points
+    :returns: a numpy array of shape (N, dims)
+    """
+    return numpy.array(text.split(), numpy.float64).reshape(-1, dims)
+
+
+def _compile_xpaths(**exprs):
+    """Helper function for compiling XPath expressions. The compiled
+    evaluators use the default mapping of namespaces (which includes NRML and
     GML).
 
-    :param str expr:
-        XPath expression.
-    :param elem:
-        A :class:`lxml.etree._Element` instance.
+    :param exprs:
+        A dictionary name -> XPath expression.
+    :returns:
+        A dictionary name -> :class:`lxml.etree.XPath` instance.
     """
-    return elem.xpath(expr, namespaces=openquake.nrmllib.PARSE_NS_MAP)
+    return dict((name, etree.XPath(
+                 expr, namespaces=openquake.nrmllib.PARSE_NS_MAP))
+                for name, expr in exprs.iteritems())
+
+
+#: Precompiled XPath evaluators used to parse the seismic sources; they
+#: only follow the child axis, so they do not scan whole subtrees
+_XPATHS = _compile_xpaths(
+    line_pos_list='./gml:LineString/gml:posList',
+    polygon_pos_list='./gml:Polygon/gml:exterior/gml:LinearRing/gml:posList',
+    point_pos='./gml:Point/gml:pos',
+    dip='./nrml:dip',
+    upper_seismo_depth='./nrml:upperSeismoDepth',
+    lower_seismo_depth='./nrml:lowerSeismoDepth',
+    top_edge='./nrml:faultTopEdge/gml:LineString/gml:posList',
+    bottom_edge='./nrml:faultBottomEdge/gml:LineString/gml:posList',
+    int_edges='./nrml:intermediateEdge/gml:LineString/gml:posList',
+    top_left='./nrml:topLeft',
+    top_right='./nrml:topRight',
+    bottom_left='./nrml:bottomLeft',
+    bottom_right='./nrml:bottomRight',
+    mag_scale_rel='./nrml:magScaleRel',
+    rupt_aspect_ratio='./nrml:ruptAspectRatio',
+    mfd='./nrml:truncGutenbergRichterMFD | ./nrml:incrementalMFD',
+    occur_rates='./nrml:occurRates',
+    nodal_planes='./nrml:nodalPlaneDist/nrml:nodalPlane',
+    hypo_depths='./nrml:hypoDepthDist/nrml:hypoDepth',
+    rake='./nrml:rake',
+    point_geometry='./nrml:pointGeometry',
+    area_geometry='./nrml:areaGeometry',
+    simple_geometry='./nrml:simpleFaultGeometry',
+    complex_geometry='./nrml:complexFaultGeometry',
+    surface='./nrml:surface',
+    planar_surfaces='./nrml:planarSurface',
+)
+
+#: Valid values for the `probabilities` argument of the SourceModelParser
+PROBABILITY_TYPES = ('decimal', 'float', 'array')
+
+#: Valid values for the `geometry` argument of the parsers
+GEOMETRY_TYPES = ('wkt', 'array')
+
+#: Absolute tolerance on the sum of the probabilities of a nodal plane or
+#: hypocentral depth distribution, when they are parsed as floats
+PROB_TOLERANCE = 1E-9
 
 
 class FaultGeometryParserMixin(object):
@@ -50,52 +122,70 @@ class FaultGeometryParserMixin(object):
     """
 
     @classmethod
-    def _parse_simple_geometry(cls, src_elem):
+    def _parse_simple_geometry(cls, src_elem, geometry='wkt'):
         """
         :param src_elem:
-            :class:`lxml.etree._Element` instance representing a geometry.
+            :class:`lxml.etree._Element` instance representing a
+            <simpleFaultGeometry>.
+        :param str geometry:
+            'wkt' to build the WKT of the fault trace, 'array' to build
+            an array of coordinates instead.
         :returns:
             Fully populated
             :class:`openquake.nrmllib.models.SimpleFaultGeometry` object.
         """
         simple_geom = models.SimpleFaultGeometry()
 
-        [gml_pos_list] = _xpath(src_elem, './/gml:posList')
-        coords = gml_pos_list.text.split()
-        simple_geom.wkt = utils.coords_to_linestr_wkt(coords, 2)
+        [gml_pos_list] = _XPATHS['line_pos_list'](src_elem)
+        if geometry == 'array':
+            simple_geom.coords = _to_array(gml_pos_list.text, 2)
+        else:
+            coords = gml_pos_list.text.split()
+            simple_geom.wkt = utils.coords_to_linestr_wkt(coords, 2)
 
         simple_geom.dip = float(
-            _xpath(src_elem, './/nrml:dip')[0].text)
+            _XPATHS['dip'](src_elem)[0].text)
         simple_geom.upper_seismo_depth = float(
-            _xpath(src_elem, './/nrml:upperSeismoDepth')[0].text)
+            _XPATHS['upper_seismo_depth'](src_elem)[0].text)
         simple_geom.lower_seismo_depth = float(
-            _xpath(src_elem, './/nrml:lowerSeismoDepth')[0].text)
+            _XPATHS['lower_seismo_depth'](src_elem)[0].text)
 
         return simple_geom
 
     @classmethod
-    def _parse_complex_geometry(cls, src_elem):
+    def _parse_complex_geometry(cls, src_elem, geometry='wkt'):
         """
         :param src_elem:
-            :class:`lxml.etree._Element` instance representing a geometry.
+            :class:`lxml.etree._Element` instance representing a
+            <complexFaultGeometry>.
+        :param str geometry:
+            'wkt' to build the WKT of the fault edges, 'array' to build
+            arrays of coordinates instead.
         :returns:
             Fully populated
             :class:`openquake.nrmllib.models.ComplexFaultGeometry` object.
         """
         complex_geom = models.ComplexFaultGeometry()
 
-        [top_edge] = _xpath(src_elem, './/nrml:faultTopEdge//gml:posList')
+        [top_edge] = _XPATHS['top_edge'](src_elem)
+        [bottom_edge] = _XPATHS['bottom_edge'](src_elem)
+        # Optional itermediate edges:
+        int_edges = _XPATHS['int_edges'](src_elem)
+
+        if geometry == 'array':
+            complex_geom.top_edge_coords = _to_array(top_edge.text, 3)
+            complex_geom.bottom_edge_coords = _to_array(bottom_edge.text, 3)
+            complex_geom.int_edges_coords = [
+                _to_array(edge.text, 3) for edge in int_edges]
+            return complex_geom
+
         top_coords = top_edge.text.split()
         complex_geom.top_edge_wkt = utils.coords_to_linestr_wkt(top_coords, 3)
 
-        [bottom_edge] = _xpath(
-            src_elem, './/nrml:faultBottomEdge//gml:posList')
         bottom_coords = bottom_edge.text.split()
         complex_geom.bottom_edge_wkt = utils.coords_to_linestr_wkt(
             bottom_coords, 3)
 
-        # Optional itermediate edges:
-        int_edges = _xpath(src_elem, './/nrml:intermediateEdge//gml:posList')
         for edge in int_edges:
             coords = edge.text.split()
             complex_geom.int_edges.append(
@@ -117,16 +207,16 @@ class FaultGeometryParserMixin(object):
         surface.strike = float(src_elem.get('strike'))
         surface.dip = float(src_elem.get('dip'))
         surface.top_left = cls._parse_point_geom(
-            _xpath(src_elem, './nrml:topLeft')[0]
+            _XPATHS['top_left'](src_elem)[0]
         )
         surface.top_right = cls._parse_point_geom(
-            _xpath(src_elem, './nrml:topRight')[0]
+            _XPATHS['top_right'](src_elem)[0]
         )
         surface.bottom_left = cls._parse_point_geom(
-            _xpath(src_elem, './nrml:bottomLeft')[0]
+            _XPATHS['bottom_left'](src_elem)[0]
         )
         surface.bottom_right = cls._parse_point_geom(
-            _xpath(src_elem, './nrml:bottomRight')[0]
+            _XPATHS['bottom_right'](src_elem)[0]
         )
         return surface
 
@@ -157,6 +247,26 @@ class SourceModelParser(FaultGeometryParserMixin):
 
     :param source:
         Filename or file-like object containing the XML data.
+    :param cache:
+        An optional :class:`openquake.nrmllib.hazard.cache.SourceModelCache`;
+        if given and the source is a filename, :meth:`parse` returns the
+        cached source model, if any, and stores the parsed one otherwise.
+    :param str probabilities:
+        How to represent the nodal plane and hypocentral depth
+        distributions: 'decimal' (the default) gives lists of
+        :class:`openquake.nrmllib.models.NodalPlane` and
+        :class:`openquake.nrmllib.models.HypocentralDepth` objects with
+        :class:`decimal.Decimal` probabilities; 'float' gives the same
+        objects with float probabilities; 'array' gives numpy structured
+        arrays with a float field for each attribute of the XML elements.
+        In the last two cases the probabilities of each distribution are
+        checked to sum to 1, within :data:`PROB_TOLERANCE`.
+    :param str geometry:
+        'wkt' (the default) to store the geometries as WKT strings, 'array'
+        to store the coordinates in numpy arrays, in the `coords` attribute
+        of the geometry objects (`top_edge_coords`, `bottom_edge_coords`
+        and `int_edges_coords` for complex faults); the WKT is then built
+        only when accessed.
     """
 
     _SM_TAG = '{%s}sourceModel' % openquake.nrmllib.NAMESPACE
@@ -166,8 +276,16 @@ class SourceModelParser(FaultGeometryParserMixin):
     _COMPLEX_TAG = '{%s}complexFaultSource' % openquake.nrmllib.NAMESPACE
     _CHAR_TAG = '{%s}characteristicFaultSource' % openquake.nrmllib.NAMESPACE
 
-    def __init__(self, source):
+    def __init__(self, source, cache=None, probabilities='decimal',
+                 geometry='wkt'):
+        if probabilities not in PROBABILITY_TYPES:
+            raise ValueError('Invalid probabilities=%r, must be one of %s'
+                             % (probabilities, PROBABILITY_TYPES))
+        _check_geometry(geometry)
         self.source = source
+        self.cache = cache
+        self.probabilities = probabilities
+        self.geometry = geometry
         self._parse_fn_map = {
             self._PT_TAG: self._parse_point_source,
             self._AREA_TAG: self._parse_area,
@@ -186,14 +304,9 @@ class SourceModelParser(FaultGeometryParserMixin):
             if event == 'end':
                 parse_fn = self._parse_fn_map.get(element.tag, None)
                 if parse_fn is not None:
+                    # the element is pruned by the tree when the iteration
+                    # is resumed
                     yield parse_fn(element)
-                    element.clear()
-                    while element.getprevious() is not None:
-                        # Delete previous sibling elements.
-                        # We need to loop here in case there are comments in
-                        # the input file which are considered siblings to
-                        # source elements.
-                        del element.getparent()[0]
 
     @classmethod
     def _set_common_attrs(cls, model, src_elem):
@@ -210,10 +323,10 @@ class SourceModelParser(FaultGeometryParserMixin):
         model.name = src_elem.get('name')
         model.trt = src_elem.get('tectonicRegion')
 
-        model.mag_scale_rel = _xpath(
-            src_elem, './nrml:magScaleRel')[0].text.strip()
-        model.rupt_aspect_ratio = float(_xpath(
-            src_elem, './nrml:ruptAspectRatio')[0].text)
+        model.mag_scale_rel = _XPATHS['mag_scale_rel'](
+            src_elem)[0].text.strip()
+        model.rupt_aspect_ratio = float(_XPATHS['rupt_aspect_ratio'](
+            src_elem)[0].text)
 
     @classmethod
     def _parse_mfd(cls, src_elem):
@@ -221,8 +334,7 @@ class SourceModelParser(FaultGeometryParserMixin):
         :param src_elem:
             :class:`lxml.etree._Element` instance representing a source.
         """
-        [mfd_elem] = _xpath(src_elem, ('.//nrml:truncGutenbergRichterMFD | '
-                                       './/nrml:incrementalMFD'))
+        [mfd_elem] = _XPATHS['mfd'](src_elem)
 
         if mfd_elem.tag == '{%s}truncGutenbergRichterMFD' % (
                 openquake.nrmllib.NAMESPACE):
@@ -238,22 +350,27 @@ class SourceModelParser(FaultGeometryParserMixin):
             mfd.min_mag = float(mfd_elem.get('minMag'))
             mfd.bin_width = float(mfd_elem.get('binWidth'))
 
-            [occur_rates] = _xpath(mfd_elem, './nrml:occurRates')
+            [occur_rates] = _XPATHS['occur_rates'](mfd_elem)
             mfd.occur_rates = [float(x) for x in occur_rates.text.split()]
 
         return mfd
 
-    @classmethod
-    def _parse_nodal_plane_dist(cls, src_elem):
+    def _parse_nodal_plane_dist(self, src_elem):
         """
         :param src_elem:
             :class:`lxml.etree._Element` instance representing a source.
         :returns:
-            `list` of :class:`openquake.nrmllib.models.NodalPlane` objects.
+            `list` of :class:`openquake.nrmllib.models.NodalPlane` objects,
+            or a numpy array if `probabilities` is 'array'.
         """
+        if self.probabilities != 'decimal':
+            return self._parse_float_dist(
+                src_elem, 'nodal_planes', models.NodalPlane,
+                ('probability', 'strike', 'dip', 'rake'))
+
         npd = []
 
-        for elem in _xpath(src_elem, './/nrml:nodalPlane'):
+        for elem in _XPATHS['nodal_planes'](src_elem):
             nplane = models.NodalPlane()
             nplane.probability = decimal.Decimal(elem.get('probability'))
             nplane.strike = float(elem.get('strike'))
@@ -264,18 +381,22 @@ class SourceModelParser(FaultGeometryParserMixin):
 
         return npd
 
-    @classmethod
-    def _parse_hypo_depth_dist(cls, src_elem):
+    def _parse_hypo_depth_dist(self, src_elem):
         """
         :param src_elem:
             :class:`lxml.etree._Element` instance representing a source.
         :returns:
             `list` of :class:`openquake.nrmllib.models.HypocentralDepth`
-            objects.
+            objects, or a numpy array if `probabilities` is 'array'.
         """
+        if self.probabilities != 'decimal':
+            return self._parse_float_dist(
+                src_elem, 'hypo_depths', models.HypocentralDepth,
+                ('probability', 'depth'))
+
         hdd = []
 
-        for elem in _xpath(src_elem, './/nrml:hypoDepth'):
+        for elem in _XPATHS['hypo_depths'](src_elem):
             hdepth = models.HypocentralDepth()
             hdepth.probability = decimal.Decimal(elem.get('probability'))
             hdepth.depth = float(elem.get('depth'))
@@ -284,8 +405,40 @@ class SourceModelParser(FaultGeometryParserMixin):
 
         return hdd
 
-    @classmethod
-    def _parse_point_source(cls, src_elem):
+    def _parse_float_dist(self, src_elem, xpath, model_cls, attrs):
+        """
+        Parse a distribution with float probabilities and check that they
+        sum to 1.
+
+        :param src_elem:
+            :class:`lxml.etree._Element` instance representing a source.
+        :param str xpath:
+            The name of the XPath evaluator returning the distribution nodes.
+        :param model_cls:
+            :class:`openquake.nrmllib.models.NodalPlane` or
+            :class:`openquake.nrmllib.models.HypocentralDepth`.
+        :param attrs:
+            The names of the attributes of the XML nodes, which are also
+            the attributes of `model_cls`; the first one is 'probability'.
+        :returns:
+            A `list` of `model_cls` instances or, if `probabilities` is
+            'array', a numpy structured array.
+        """
+        rows = [tuple(float(elem.get(attr)) for attr in attrs)
+                for elem in _XPATHS[xpath](src_elem)]
+        if self.probabilities == 'array':
+            dist = numpy.array(rows, [(attr, numpy.float64) for attr in attrs])
+        else:
+            dist = [model_cls(**dict(zip(attrs, row))) for row in rows]
+        total = math.fsum(row[0] for row in rows)
+        if abs(total - 1) > PROB_TOLERANCE:
+            raise ValueError(
+                'The probabilities of the %s distribution of source %s sum '
+                'to %s, not to 1' % (model_cls.__name__, src_elem.get('id'),
+                                     total))
+        return dist
+
+    def _parse_point_source(self, src_elem):
         """
         :param src_elem:
             :class:`lxml.etree._Element` instance representing a source.
@@ -294,28 +447,32 @@ class SourceModelParser(FaultGeometryParserMixin):
             object.
         """
         point = models.PointSource()
-        cls._set_common_attrs(point, src_elem)
+        self._set_common_attrs(point, src_elem)
 
         point_geom = models.PointGeometry()
         point.geometry = point_geom
 
-        [gml_pos] = _xpath(src_elem, './/gml:pos')
-        coords = gml_pos.text.split()
-        point_geom.wkt = 'POINT(%s)' % ' '.join(coords)
+        [geom_elem] = _XPATHS['point_geometry'](src_elem)
+        [gml_pos] = _XPATHS['point_pos'](geom_elem)
+        if self.geometry == 'array':
+            point_geom.coords = numpy.array(
+                gml_pos.text.split(), numpy.float64)
+        else:
+            coords = gml_pos.text.split()
+            point_geom.wkt = 'POINT(%s)' % ' '.join(coords)
 
         point_geom.upper_seismo_depth = float(
-            _xpath(src_elem, './/nrml:upperSeismoDepth')[0].text)
+            _XPATHS['upper_seismo_depth'](geom_elem)[0].text)
         point_geom.lower_seismo_depth = float(
-            _xpath(src_elem, './/nrml:lowerSeismoDepth')[0].text)
+            _XPATHS['lower_seismo_depth'](geom_elem)[0].text)
 
-        point.mfd = cls._parse_mfd(src_elem)
-        point.nodal_plane_dist = cls._parse_nodal_plane_dist(src_elem)
-        point.hypo_depth_dist = cls._parse_hypo_depth_dist(src_elem)
+        point.mfd = self._parse_mfd(src_elem)
+        point.nodal_plane_dist = self._parse_nodal_plane_dist(src_elem)
+        point.hypo_depth_dist = self._parse_hypo_depth_dist(src_elem)
 
         return point
 
-    @classmethod
-    def _parse_area(cls, src_elem):
+    def _parse_area(self, src_elem):
         """
         :param src_elem:
             :class:`lxml.etree._Element` instance representing a source.
@@ -324,30 +481,33 @@ class SourceModelParser(FaultGeometryParserMixin):
             object.
         """
         area = models.AreaSource()
-        cls._set_common_attrs(area, src_elem)
+        self._set_common_attrs(area, src_elem)
 
         area_geom = models.AreaGeometry()
         area.geometry = area_geom
 
-        [gml_pos_list] = _xpath(src_elem, './/gml:posList')
-        coords = gml_pos_list.text.split()
+        [geom_elem] = _XPATHS['area_geometry'](src_elem)
+        [gml_pos_list] = _XPATHS['polygon_pos_list'](geom_elem)
         # Area source polygon geometries are always 2-dimensional and on the
         # Earth's surface (depth == 0.0).
-        area_geom.wkt = utils.coords_to_poly_wkt(coords, 2)
+        if self.geometry == 'array':
+            area_geom.coords = _to_array(gml_pos_list.text, 2)
+        else:
+            coords = gml_pos_list.text.split()
+            area_geom.wkt = utils.coords_to_poly_wkt(coords, 2)
 
         area_geom.upper_seismo_depth = float(
-            _xpath(src_elem, './/nrml:upperSeismoDepth')[0].text)
+            _XPATHS['upper_seismo_depth'](geom_elem)[0].text)
         area_geom.lower_seismo_depth = float(
-            _xpath(src_elem, './/nrml:lowerSeismoDepth')[0].text)
+            _XPATHS['lower_seismo_depth'](geom_elem)[0].text)
 
-        area.mfd = cls._parse_mfd(src_elem)
-        area.nodal_plane_dist = cls._parse_nodal_plane_dist(src_elem)
-        area.hypo_depth_dist = cls._parse_hypo_depth_dist(src_elem)
+        area.mfd = self._parse_mfd(src_elem)
+        area.nodal_plane_dist = self._parse_nodal_plane_dist(src_elem)
+        area.hypo_depth_dist = self._parse_hypo_depth_dist(src_elem)
 
         return area
 
-    @classmethod
-    def _parse_simple(cls, src_elem):
+    def _parse_simple(self, src_elem):
         """
         :param src_elem:
             :class:`lxml.etree._Element` instance representing a source.
@@ -356,18 +516,18 @@ class SourceModelParser(FaultGeometryParserMixin):
             :class:`openquake.nrmllib.models.SimpleFaultSource` object.
         """
         simple = models.SimpleFaultSource()
-        cls._set_common_attrs(simple, src_elem)
+        self._set_common_attrs(simple, src_elem)
 
-        simple_geom = cls._parse_simple_geometry(src_elem)
+        [geom_elem] = _XPATHS['simple_geometry'](src_elem)
+        simple_geom = self._parse_simple_geometry(geom_elem, self.geometry)
         simple.geometry = simple_geom
-        simple.mfd = cls._parse_mfd(src_elem)
+        simple.mfd = self._parse_mfd(src_elem)
         simple.rake = float(
-            _xpath(src_elem, './/nrml:rake')[0].text)
+            _XPATHS['rake'](src_elem)[0].text)
 
         return simple
 
-    @classmethod
-    def _parse_complex(cls, src_elem):
+    def _parse_complex(self, src_elem):
         """
         :param src_elem:
             :class:`lxml.etree._Element` instance representing a source.
@@ -376,16 +536,16 @@ class SourceModelParser(FaultGeometryParserMixin):
             :class:`openquake.nrmllib.models.ComplexFaultSource` object.
         """
         complx = models.ComplexFaultSource()
-        cls._set_common_attrs(complx, src_elem)
-        complex_geom = cls._parse_complex_geometry(src_elem)
+        self._set_common_attrs(complx, src_elem)
+        [geom_elem] = _XPATHS['complex_geometry'](src_elem)
+        complex_geom = self._parse_complex_geometry(geom_elem, self.geometry)
         complx.geometry = complex_geom
-        complx.mfd = cls._parse_mfd(src_elem)
+        complx.mfd = self._parse_mfd(src_elem)
         complx.rake = float(
-            _xpath(src_elem, './/nrml:rake')[0].text)
+            _XPATHS['rake'](src_elem)[0].text)
         return complx
 
-    @classmethod
-    def _parse_characteristic(cls, src_elem):
+    def _parse_characteristic(self, src_elem):
         """
         :param src_elem:
             :class:`lxml.etree._Element` instance representing a source.
@@ -397,24 +557,26 @@ class SourceModelParser(FaultGeometryParserMixin):
         char.id = src_elem.get('id')
         char.name = src_elem.get('name')
         char.trt = src_elem.get('tectonicRegion')
-        char.rake = float(_xpath(src_elem, './nrml:rake')[0].text)
-        char.mfd = cls._parse_mfd(src_elem)
+        char.rake = float(_XPATHS['rake'](src_elem)[0].text)
+        char.mfd = self._parse_mfd(src_elem)
 
         # The `surface` can be either a simple fault surface, complex fault
         # surface, or a multi surface (consisting of 1 or more planar surfaces)
-        surface_elem = _xpath(src_elem, './nrml:surface')[0]
-        simple_surface = _xpath(surface_elem, './nrml:simpleFaultGeometry')
-        complex_surface = _xpath(surface_elem, './nrml:complexFaultGeometry')
-        multi_surface = _xpath(surface_elem, './nrml:planarSurface')
+        surface_elem = _XPATHS['surface'](src_elem)[0]
+        simple_surface = _XPATHS['simple_geometry'](surface_elem)
+        complex_surface = _XPATHS['complex_geometry'](surface_elem)
+        multi_surface = _XPATHS['planar_surfaces'](surface_elem)
 
         if simple_surface:
             [simple_surface] = simple_surface
-            char.surface = cls._parse_simple_geometry(simple_surface)
+            char.surface = self._parse_simple_geometry(
+                simple_surface, self.geometry)
         elif complex_surface:
             [complex_surface] = complex_surface
-            char.surface = cls._parse_complex_geometry(complex_surface)
+            char.surface = self._parse_complex_geometry(
+                complex_surface, self.geometry)
         elif multi_surface:
-            char.surface = [cls._parse_planar_surface(surf)
+            char.surface = [self._parse_planar_surface(surf)
                             for surf in multi_surface]
 
         return char
@@ -426,9 +588,19 @@ class SourceModelParser(FaultGeometryParserMixin):
         :returns:
             :class:`openquake.nrmllib.models.SourceModel` instance.
         """
+        if self.cache is not None and isinstance(self.source, basestring):
+            variant = '%s:%s' % (self.probabilities, self.geometry)
+            return self.cache.load(self.source, self._parse, variant)
+        return self._parse()
+
+    def _parse(self):
+        """
+        Parse the source XML content, yielding the sources lazily.
+        """
         src_model = models.SourceModel()
 
-        tree = openquake.nrmllib.iterparse_tree(self.source)
+        tree = openquake.nrmllib.iterparse_tree(
+            self.source, prune_tags=self._parse_fn_map)
 
         for event, element in tree:
             # Find the <sourceModel> element and get the 'name' attr.
@@ -444,6 +616,115 @@ class SourceModelParser(FaultGeometryParserMixin):
 
         return src_model
 
+    def parse_parallel(self, processes=None, shard_size=1000, ordered=True):
+        """
+        Parse the source model by splitting the <sourceModel> content at
+        source element boundaries in shards of `shard_size` sources, which
+        are validated and parsed in parallel by a pool of processes.
+
+        The whole XML content is read in memory, but the shards are
+        generated lazily while the workers consume them.
+
+        :param int processes:
+            Number of worker processes (by default the number of CPUs).
+        :param int shard_size:
+            Number of sources in each shard.
+        :param bool ordered:
+            If True (the default) the sources are returned in the same
+            order as in the file, otherwise in the order in which the
+            shards are completed, which gives a better throughput.
+        :returns:
+            :class:`openquake.nrmllib.models.SourceModel` instance.
+        """
+        with openquake.nrmllib.NRMLFile(self.source) as fh:
+            content = fh.read()
+        name, shards = _split_source_model(content, shard_size)
+        src_model = models.SourceModel(name)
+        src_model.sources = self._parallel_source_gen(
+            shards, processes, ordered)
+        return src_model
+
+    def _parallel_source_gen(self, shards, processes, ordered):
+        """
+        Returns a generator which yields the sources parsed by the workers.
+        """
+        pool = multiprocessing.Pool(processes)
+        imap = pool.imap if ordered else pool.imap_unordered
+        options = dict(probabilities=self.probabilities,
+                       geometry=self.geometry)
+        args = ((shard, options) for shard in shards)
+        try:
+            for sources in imap(_parse_shard, args):
+                for src in sources:
+                    yield src
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+
+#: Matches the end tag of the source elements, with an optional prefix
+_SOURCE_END_RE = re.compile(
+    r'</(?:\w+:)?(?:pointSource|areaSource|simpleFaultSource|'
+    r'complexFaultSource|characteristicFaultSource)\s*>')
+_SOURCE_MODEL_START_RE = re.compile(r'<(?:\w+:)?sourceModel\b[^>]*>')
+_SOURCE_MODEL_END_RE = re.compile(r'</(?:\w+:)?sourceModel\s*>')
+_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+
+
+def _split_source_model(content, shard_size):
+    """
+    Split the XML content of a source model into shards.
+
+    :param str content:
+        The XML content of a NRML source model.
+    :param int shard_size:
+        The number of sources per shard.
+    :returns:
+        a pair (source model name, shards) where the shards are lazily
+        generated complete NRML documents, each one containing at most
+        `shard_size` sources
+    """
+    start = _SOURCE_MODEL_START_RE.search(content)
+    if start is None:
+        raise ValueError('<sourceModel> element not found.')
+    end = _SOURCE_MODEL_END_RE.search(content, start.end())
+    if start.group().endswith('/>') or end is None:
+        # empty source model
+        sm_elem = openquake.nrmllib.etree.fromstring(content)[0]
+        return sm_elem.get('name'), iter([])
+    header = content[:start.end()]
+    footer = content[end.start():]
+    name = openquake.nrmllib.etree.fromstring(header + footer)[0].get('name')
+    body = _COMMENT_RE.sub('', content[start.end():end.start()])
+
+    def gen_shards():
+        pos = 0
+        for i, match in enumerate(_SOURCE_END_RE.finditer(body), 1):
+            if i % shard_size == 0:
+                yield header + body[pos:match.end()] + footer
+                pos = match.end()
+        if body[pos:].strip():
+            yield header + body[pos:] + footer
+    return name, gen_shards()
+
+
+def _parse_shard(args):
+    """
+    Parse a shard of a source model in a worker process; the NRML schema
+    is compiled once per worker, thanks to the schema registry.
+
+    :param args:
+        a pair (shard, options) where shard is a complete NRML source
+        model document and options is a dictionary of keyword arguments
+        for the :class:`SourceModelParser`
+    :returns: a list of source objects
+    """
+    shard, options = args
+    return list(SourceModelParser(StringIO.StringIO(shard), **options).parse())
+
 
 class SiteModelParser(object):
     """NRML site model parser. Reads site-specific parameters from a given
@@ -451,10 +732,15 @@ class SiteModelParser(object):
 
     :param source:
         Filename or file-like object containing the XML data.
+    :param str geometry:
+        'wkt' (the default) to store the site locations as WKT strings,
+        'array' to store them as numpy arrays in the `coords` attribute.
     """
 
-    def __init__(self, source):
+    def __init__(self, source, geometry='wkt'):
+        _check_geometry(geometry)
         self.source = source
+        self.geometry = geometry
 
     def parse(self):
         """Parse the site model XML content and generate
@@ -463,33 +749,33 @@ class SiteModelParser(object):
         :returns:
             A iterable of :class:`openquake.nrmllib.model.SiteModel` objects.
         """
-        tree = openquake.nrmllib.iterparse_tree(self.source,
-                                                events=('start', ))
+        site_tag = '{%s}site' % openquake.nrmllib.NAMESPACE
+        tree = openquake.nrmllib.iterparse_tree(
+            self.source, events=('end',),
+            sub_schemas=['hazard/site_model.xsd'], prune_tags=[site_tag])
 
         for _, element in tree:
-            if element.tag == '{%s}site' % openquake.nrmllib.NAMESPACE:
+            if element.tag == site_tag:
                 site = models.SiteModel()
                 site.vs30 = float(element.get('vs30'))
                 site.vs30_type = element.get('vs30Type').strip()
                 site.z1pt0 = float(element.get('z1pt0'))
                 site.z2pt5 = float(element.get('z2pt5'))
-                lonlat = dict(lon=element.get('lon').strip(),
-                              lat=element.get('lat').strip())
-                site.wkt = 'POINT(%(lon)s %(lat)s)' % lonlat
+                if self.geometry == 'array':
+                    site.coords = numpy.array(
+                        [element.get('lon'), element.get('lat')],
+                        numpy.float64)
+                else:
+                    lonlat = dict(lon=element.get('lon').strip(),
+                                  lat=element.get('lat').strip())
+                    site.wkt = 'POINT(%(lon)s %(lat)s)' % lonlat
 
                 yield site
 
-                # Now do some clean up to free memory.
-                while element.getprevious() is not None:
-                    # Delete previous sibling elements.
-                    # We need to loop here in case there are comments in
-                    # the input file which are considered siblings to
-                    # source elements.
-                    del element.getparent()[0]
-
 
 # notice that there must be at most one rupture per file because of the
-# constraint maxOccurs="1" in nrml.xsd
+# constraint maxOccurs="1" in nrml.xsd; the files are validated against
+# rupture.xsd only, so in any case only the first rupture is read
 class RuptureModelParser(FaultGeometryParserMixin):
 
     _SIMPLE_RUPT_TAG = '{%s}simpleFaultRupture' % openquake.nrmllib.NAMESPACE
@@ -549,7 +835,8 @@ class RuptureModelParser(FaultGeometryParserMixin):
             instance or
             :class:`openquake.nrmllib.models.ComplexFaultRuptureModel` instance
         """
-        tree = openquake.nrmllib.iterparse_tree(self.source)
+        tree = openquake.nrmllib.iterparse_tree(
+            self.source, sub_schemas=['hazard/rupture.xsd'])
         for _, element in tree:
             parse_fn = self._parse_fn_map.get(element.tag)
             if parse_fn:
@@ -572,9 +859,11 @@ class GMFScenarioParser(object):
         """
         Parse the source XML content for a GMF scenario.
         :returns:
-            an iterable over triples (imt, gmvs, location)
+            an iterable over triples (imt, gmvs, location), where gmvs
+            and location are strings like '{0.2,0.3}' and 'POINT(0.0 1.0)'
         """
-        tree = openquake.nrmllib.iterparse_tree(self.source, events=('end',))
+        tree = openquake.nrmllib.iterparse_tree(
+            self.source, events=('end',), prune_tags=[self._GMF_TAG])
         gmf = OrderedDict()  # (imt, location) -> gmvs
         point_value_list = []
         for _, element in tree:
@@ -583,11 +872,7 @@ class GMFScenarioParser(object):
                 point_value_list.append(
                     ['POINT(%(lon)s %(lat)s)' % a, a['gmv']])
             elif element.tag == self._GMF_TAG:
-                imt = a['IMT']
-                try:
-                    imt += '(%s)' % a['saPeriod']
-                except KeyError:
-                    pass
+                imt = _imt_string(a)
                 for point, value in point_value_list:
                     try:
                         values = gmf[point, imt]
@@ -599,10 +884,249 @@ class GMFScenarioParser(object):
         for (location, imt), gmvs in gmf.iteritems():
             yield imt, '{%s}' % ','.join(gmvs), location
 
+    def parse_arrays(self, dtype=numpy.float64):
+        """
+        Parse the source XML content for a GMF scenario into a matrix of
+        ground motion values for each IMT, with a row per site and a column
+        per realization (i.e. per <gmf> element). The <gmf> elements are
+        discarded as soon as they are read and the nodes are converted to
+        arrays directly, so the memory occupation is essentially the one
+        of the matrices. The sites are numbered in order of appearance;
+        a site missing from a <gmf> element has a ground motion value of
+        zero.
+
+        :param dtype:
+            the type of the ground motion values, numpy.float64 or
+            numpy.float32
+        :returns:
+            an ordered dictionary IMT -> (sites, gmvs), where sites is an
+            array of shape (N, 2) with the longitudes and latitudes of the
+            N sites and gmvs an array of shape (N, R), R being the number
+            of realizations
+        """
+        site_index = OrderedDict()  # imt -> _SiteIndex
+        columns = OrderedDict()  # imt -> [(sids, gmvs), ...]
+        for _, element in openquake.nrmllib.iterparse_tree(
+                self.source, events=('end',), prune_tags=[self._GMF_TAG],
+                tags=[self._GMF_TAG]):
+            imt = _imt_string(element.attrib)
+            if imt not in site_index:
+                site_index[imt] = _SiteIndex()
+                columns[imt] = []
+            lons, lats, gmvs = _gmf_arrays(element, dtype)
+            columns[imt].append((site_index[imt].indices(lons, lats), gmvs))
+        return OrderedDict(
+            (imt, (site_index[imt].sites(),
+                   _gmf_matrix(cols, len(site_index[imt]), dtype)))
+            for imt, cols in columns.iteritems())
+
+
+def _imt_string(attrib):
+    """
+    :param attrib: the attributes of a <gmf> or <hazardCurves> element
+    :returns: the IMT, including the period for SA, like 'SA(0.025)'
+    """
+    imt = attrib['IMT']
+    try:
+        imt += '(%s)' % attrib['saPeriod']
+    except KeyError:
+        pass
+    return imt
+
+
+# plain strings are much faster than the default smart strings
+_GMF_NODE_XPATHS = [
+    etree.XPath('nrml:node/@%s' % name, smart_strings=False,
+                namespaces=openquake.nrmllib.PARSE_NS_MAP)
+    for name in ('lon', 'lat', 'gmv')]
+
+
+def _gmf_arrays(element, dtype=numpy.float64):
+    """
+    :param element: a <gmf> element
+    :param dtype: the type of the ground motion values
+    :returns: the arrays of longitudes, latitudes and ground motion values
+              of the nodes, built without an object per node
+    """
+    lons, lats, gmvs = [xpath(element) for xpath in _GMF_NODE_XPATHS]
+    return (numpy.array(lons, numpy.float64),
+            numpy.array(lats, numpy.float64), numpy.array(gmvs, dtype))
+
+
+def _gmf_matrix(columns, num_sites, dtype=numpy.float64):
+    """
+    :param columns:
+        a list of pairs (site indices, ground motion values)
+    :param int num_sites:
+        the number of sites
+    :param dtype:
+        the type of the ground motion values
+    :returns:
+        an array of shape (num_sites, len(columns)), with zeros for the
+        missing values
+    """
+    gmvs = numpy.zeros((num_sites, len(columns)), dtype)
+    for col, (sids, values) in enumerate(columns):
+        gmvs[sids, col] = values
+    return gmvs
+
+
+class GMFEventBasedParser(object):
+    """
+    Parser for the ground motion fields written by
+    :class:`openquake.nrmllib.hazard.writers.EventBasedGMFXMLWriter`.
+    The <gmf> elements are read one at the time and their nodes are
+    converted to arrays directly, without building an object per node.
+
+    :param source: a filename or a file-like object
+    """
+    _GMF_SET_TAG = '{%s}gmfSet' % openquake.nrmllib.NAMESPACE
+    _GMF_TAG = '{%s}gmf' % openquake.nrmllib.NAMESPACE
+
+    def __init__(self, source):
+        self.source = source
+
+    def _iter_gmfs(self):
+        """
+        Generate the <gmf> elements, pruning them after use.
+        """
+        tags = [self._GMF_SET_TAG, self._GMF_TAG]
+        for _, element in openquake.nrmllib.iterparse_tree(
+                self.source, events=('end',), prune_tags=tags, tags=tags):
+            if element.tag == self._GMF_TAG:
+                yield element
+
+    def parse(self):
+        """
+        Parse the source XML content for an event based calculation.
+
+        :returns:
+            an iterable over :class:`openquake.nrmllib.models.GMFData`
+            objects, one for each <gmf> element, with the IMT as a string
+            like 'SA(0.025)', the rupture id (or None) and the arrays of
+            longitudes, latitudes and ground motion values of the nodes
+        """
+        for element in self._iter_gmfs():
+            yield models.GMFData(
+                _imt_string(element.attrib), element.get('ruptureId'),
+                *_gmf_arrays(element))
+
+    def parse_arrays(self, dtype=numpy.float64):
+        """
+        Parse the source XML content into a matrix of ground motion values
+        for each IMT, with a row per site and a column per <gmf> element.
+        The sites are numbered in order of appearance; a site missing from
+        a <gmf> element has a ground motion value of zero.
+
+        :param dtype:
+            the type of the ground motion values, numpy.float64 or
+            numpy.float32
+        :returns:
+            a pair (sites, gmfs), where sites is an array of shape (N, 2)
+            with the longitudes and latitudes of the N sites and gmfs is an
+            ordered dictionary IMT -> (rupture_ids, gmvs), with rupture_ids
+            a list of R rupture ids (None if missing) and gmvs an array of
+            shape (N, R)
+        """
+        site_index = _SiteIndex()
+        rupture_ids = OrderedDict()  # imt -> [rupture_id, ...]
+        columns = OrderedDict()  # imt -> [(sids, gmvs), ...]
+        for element in self._iter_gmfs():
+            imt = _imt_string(element.attrib)
+            lons, lats, gmvs = _gmf_arrays(element, dtype)
+            rupture_ids.setdefault(imt, []).append(element.get('ruptureId'))
+            columns.setdefault(imt, []).append(
+                (site_index.indices(lons, lats), gmvs))
+        return site_index.sites(), OrderedDict(
+            (imt, (rupture_ids[imt],
+                   _gmf_matrix(cols, len(site_index), dtype)))
+            for imt, cols in columns.iteritems())
+
+
+class _SiteIndex(object):
+    """
+    Index of sites numbered in order of appearance. The lookup of the
+    sites is vectorized: the sites are encoded as complex numbers
+    lon + i * lat, kept sorted and searched with `numpy.searchsorted`.
+    """
+
+    def __init__(self):
+        self._keys = numpy.zeros(0, numpy.complex128)  # sorted keys
+        self._indices = numpy.zeros(0, int)  # the index of each sorted key
+        self._new_keys = []  # the arrays of new keys, in order
+
+    def __len__(self):
+        return len(self._keys)
+
+    def indices(self, lons, lats):
+        """
+        :param lons: an array of longitudes
+        :param lats: an array of latitudes
+        :returns: the array of the indices of the sites, adding the sites
+                  never seen before to the index
+        """
+        keys = lons + 1j * lats
+        pos = numpy.searchsorted(self._keys, keys)
+        found = pos < len(self._keys)
+        found[found] = self._keys[pos[found]] == keys[found]
+        if not found.all():
+            new_keys, first = numpy.unique(keys[~found], return_index=True)
+            new_keys = new_keys[numpy.argsort(first)]
+            self._new_keys.append(new_keys)
+            keys_ = numpy.concatenate([self._keys, new_keys])
+            indices = numpy.concatenate([
+                self._indices,
+                numpy.arange(len(self._keys), len(keys_))])
+            order = numpy.argsort(keys_)
+            self._keys, self._indices = keys_[order], indices[order]
+            pos = numpy.searchsorted(self._keys, keys)
+        return self._indices[pos]
+
+    def sites(self):
+        """
+        :returns: an array of shape (N, 2) with the longitudes and
+                  latitudes of the sites, in order of appearance
+        """
+        keys = numpy.concatenate([numpy.zeros(0, numpy.complex128)]
+                                 + self._new_keys)
+        return numpy.column_stack([keys.real, keys.imag])
+
+
+class _GrowingArray(object):
+    """
+    A 2-D array of floats with a fixed number of columns and a number of
+    rows growing geometrically as rows are appended.
+
+    :param int ncols: the number of columns
+    :param int size: the initial number of allocated rows
+    """
+
+    def __init__(self, ncols, size=1024):
+        self.array = numpy.empty((size, ncols))
+        self.nrows = 0
+
+    def append(self, row):
+        """
+        Append a row, i.e. a sequence of `ncols` floats.
+        """
+        if self.nrows == len(self.array):
+            self.array.resize((2 * self.nrows, self.array.shape[1]),
+                              refcheck=False)
+        self.array[self.nrows] = row
+        self.nrows += 1
+
+    def toarray(self):
+        """
+        :returns: the array of the appended rows, with shape (nrows, ncols)
+        """
+        self.array.resize((self.nrows, self.array.shape[1]), refcheck=False)
+        return self.array
+
 
 class HazardCurveXMLParser(object):
     _CURVES_TAG = '{%s}hazardCurves' % openquake.nrmllib.NAMESPACE
     _CURVE_TAG = '{%s}hazardCurve' % openquake.nrmllib.NAMESPACE
+    _IMLS_TAG = '{%s}IMLs' % openquake.nrmllib.NAMESPACE
 
     def __init__(self, source):
         self.source = source
@@ -613,32 +1137,448 @@ class HazardCurveXMLParser(object):
         :returns:
             Populated :class:`openquake.nrmllib.models.HazardCurveModel` object
         """
-        tree = openquake.nrmllib.iterparse_tree(self.source)
+        tree = openquake.nrmllib.iterparse_tree(
+            self.source, prune_tags=[self._CURVE_TAG])
         hc_iter = self._parse(tree)
         header = hc_iter.next()
         return models.HazardCurveModel(data_iter=hc_iter, **header)
 
     def _parse(self, tree):
-        header = OrderedDict()
         for event, element in tree:
             if element.tag == self._CURVES_TAG and event == 'start':
-                a = element.attrib
-                header['statistics'] = a.get('statistics')
-                header['quantile_value'] = a.get('quantileValue')
-                header['smlt_path'] = a.get('sourceModelTreePath')
-                header['gsimlt_path'] = a.get('gsimTreePath')
-                header['imt'] = a['IMT']
-                header['investigation_time'] = a['investigationTime']
-                header['sa_period'] = a.get('saPeriod')
-                header['sa_damping'] = a.get('saDamping')
-                header['imls'] = map(float, element[0].text.split())
-                yield header
+                yield _hazard_curves_header(
+                    element, map(float, element[0].text.split()))
             elif element.tag == self._CURVE_TAG and event == 'end':
-                point, poes = element
-                x, y = [float(v) for v in point[0].text.split()]
-                location = models.Location(x, y)
-                poes_array = map(float, poes.text.split())
-                yield models.HazardCurveData(location, poes_array)
+                yield _hazard_curve_data(element)
+
+    def parse_arrays(self):
+        """
+        Parse the source XML content into arrays, without building an
+        object for each curve. The elements are discarded as soon as they
+        are read, so the memory occupation is essentially the one of the
+        arrays.
+
+        :returns:
+            a tuple (imls, lons, lats, poes) of float64 arrays with shapes
+            (L,), (N,), (N,) and (N, L) respectively, N being the number of
+            curves and L the number of IMLs
+        :raises ValueError:
+            if the number of poEs of a curve is not L, or if the file
+            contains several <hazardCurves> blocks
+        """
+        imls = None
+        for event, element in openquake.nrmllib.iterparse_tree(
+                self.source, events=('end',), prune_tags=[self._CURVE_TAG]):
+            if element.tag == self._IMLS_TAG:
+                if imls is not None:
+                    raise ValueError('%s contains several <hazardCurves>, '
+                                     'use MultiHazardCurveXMLParser'
+                                     % self.source)
+                imls = numpy.fromstring(element.text, sep=' ')
+                locations = _GrowingArray(2)
+                poes = _GrowingArray(len(imls))
+            elif element.tag == self._CURVE_TAG:
+                point, poes_elem = element
+                locations.append(numpy.fromstring(point[0].text, sep=' '))
+                poes.append(_poes_array(poes_elem, len(imls), self.source))
+        if imls is None:
+            raise ValueError('%s contains no <hazardCurves>' % self.source)
+        locations = locations.toarray()
+        return (imls, locations[:, 0].copy(), locations[:, 1].copy(),
+                poes.toarray())
+
+
+class MultiHazardCurveXMLParser(object):
+    """
+    Parser for the files written by
+    :class:`openquake.nrmllib.hazard.writers.MultiHazardCurveXMLWriter`,
+    containing several <hazardCurves> blocks, typically one per IMT.
+
+    :param source: a filename or a file-like object
+    """
+    _CURVES_TAG = '{%s}hazardCurves' % openquake.nrmllib.NAMESPACE
+    _CURVE_TAG = '{%s}hazardCurve' % openquake.nrmllib.NAMESPACE
+    _IMLS_TAG = '{%s}IMLs' % openquake.nrmllib.NAMESPACE
+
+    def __init__(self, source):
+        self.source = source
+
+    def parse(self):
+        """
+        Parse the source XML content in a single pass. As with
+        `itertools.groupby`, the curves of a model must be consumed before
+        requesting the next model, otherwise they are skipped.
+
+        :returns:
+            an iterator over :class:`openquake.nrmllib.models.HazardCurveModel`
+            objects, one per <hazardCurves> block, generating their curves
+            lazily
+        """
+        tree = openquake.nrmllib.iterparse_tree(
+            self.source, prune_tags=[self._CURVE_TAG, self._CURVES_TAG])
+        for _, items in itertools.groupby(self._parse(tree),
+                                          operator.itemgetter(0)):
+            _, header = next(items)
+            yield models.HazardCurveModel(
+                data_iter=(curve for _, curve in items), **header)
+
+    def _parse(self, tree):
+        """
+        Generate pairs (block index, header) and (block index, curve) in
+        the order of the document.
+        """
+        index = -1
+        for event, element in tree:
+            if element.tag == self._CURVES_TAG and event == 'start':
+                index += 1
+                curves = element
+            elif element.tag == self._IMLS_TAG and event == 'end':
+                yield index, _hazard_curves_header(
+                    curves, map(float, element.text.split()))
+            elif element.tag == self._CURVE_TAG and event == 'end':
+                yield index, _hazard_curve_data(element)
+
+    def parse_arrays(self):
+        """
+        Parse the source XML content into arrays, without building an
+        object for each curve.
+
+        :returns:
+            an ordered dictionary imt -> (imls, poes), where imt is the
+            IMT of a <hazardCurves> block (including the period for SA,
+            as in 'SA(0.025)'), imls an array of shape (L,) and poes an
+            array of shape (N, L)
+        :raises ValueError:
+            if the number of poEs of a curve is not L, or if several
+            blocks have the same IMT
+        """
+        arrays = OrderedDict()
+        for event, element in openquake.nrmllib.iterparse_tree(
+                self.source, events=('end',),
+                prune_tags=[self._CURVE_TAG, self._CURVES_TAG]):
+            if element.tag == self._IMLS_TAG:
+                imt = _imt_string(element.getparent().attrib)
+                if imt in arrays:
+                    raise ValueError('Several <hazardCurves> with IMT=%s in '
+                                     '%s' % (imt, self.source))
+                imls = numpy.fromstring(element.text, sep=' ')
+                poes = _GrowingArray(len(imls))
+                arrays[imt] = imls, poes
+            elif element.tag == self._CURVE_TAG:
+                poes.append(_poes_array(element[1], len(imls), self.source))
+        return OrderedDict((imt, (imls, poes.toarray()))
+                           for imt, (imls, poes) in arrays.iteritems())
+
+
+def _hazard_curves_header(element, imls):
+    """
+    :param element: a <hazardCurves> element
+    :param imls: the list of IMLs of the curves
+    :returns:
+        an ordered dictionary with the arguments of a
+        :class:`openquake.nrmllib.models.HazardCurveModel`
+    """
+    a = element.attrib
+    header = OrderedDict()
+    header['statistics'] = a.get('statistics')
+    header['quantile_value'] = a.get('quantileValue')
+    header['smlt_path'] = a.get('sourceModelTreePath')
+    header['gsimlt_path'] = a.get('gsimTreePath')
+    header['imt'] = a['IMT']
+    header['investigation_time'] = a['investigationTime']
+    header['sa_period'] = a.get('saPeriod')
+    header['sa_damping'] = a.get('saDamping')
+    header['imls'] = imls
+    return header
+
+
+def _hazard_curve_data(element):
+    """
+    :param element: a <hazardCurve> element
+    :returns: a :class:`openquake.nrmllib.models.HazardCurveData`
+    """
+    point, poes = element
+    x, y = [float(v) for v in point[0].text.split()]
+    location = models.Location(x, y)
+    poes_array = map(float, poes.text.split())
+    return models.HazardCurveData(location, poes_array)
+
+
+def _poes_array(element, num_imls, source):
+    """
+    :param element: a <poEs> element
+    :param int num_imls: the expected number of poEs
+    :param source: the parsed file, for the error message
+    :returns: a float64 array with the poEs
+    """
+    poes = numpy.fromstring(element.text, sep=' ')
+    if len(poes) != num_imls:
+        raise ValueError('Expected %d poEs, got %d, line %d of %s'
+                         % (num_imls, len(poes), element.sourceline, source))
+    return poes
+
+
+class DisaggXMLParser(object):
+    """
+    Parser for the disaggregation matrices written by
+    :class:`openquake.nrmllib.hazard.writers.DisaggXMLWriter`, both in
+    dense and sparse form.
+
+    :param source: a filename or a file-like object
+    """
+    _MATRICES_TAG = '{%s}disaggMatrices' % openquake.nrmllib.NAMESPACE
+    _MATRIX_TAG = '{%s}disaggMatrix' % openquake.nrmllib.NAMESPACE
+
+    #: Maps the XML attributes of <disaggMatrices> to metadata keywords
+    _ATTR_MAP = OrderedDict([
+        ('statistics', 'statistics'),
+        ('quantileValue', 'quantile_value'),
+        ('sourceModelTreePath', 'smlt_path'),
+        ('gsimTreePath', 'gsimlt_path'),
+        ('IMT', 'imt'),
+        ('investigationTime', 'investigation_time'),
+        ('saPeriod', 'sa_period'),
+        ('saDamping', 'sa_damping'),
+        ('lon', 'lon'),
+        ('lat', 'lat'),
+    ])
+
+    #: Maps the bin edge attributes of <disaggMatrices> to metadata keywords
+    _BIN_EDGE_ATTR_MAP = OrderedDict([
+        ('magBinEdges', 'mag_bin_edges'),
+        ('distBinEdges', 'dist_bin_edges'),
+        ('lonBinEdges', 'lon_bin_edges'),
+        ('latBinEdges', 'lat_bin_edges'),
+        ('epsBinEdges', 'eps_bin_edges'),
+    ])
+
+    # plain strings are much faster than the default smart strings, which
+    # keep a reference to their parent element
+    _INDICES = etree.XPath('nrml:prob/@index', smart_strings=False,
+                           namespaces=openquake.nrmllib.PARSE_NS_MAP)
+    _VALUES = etree.XPath('nrml:prob/@value', smart_strings=False,
+                          namespaces=openquake.nrmllib.PARSE_NS_MAP)
+
+    def __init__(self, source):
+        self.source = source
+
+    def parse(self):
+        """
+        Parse the source XML content. The matrices are read lazily, one at
+        the time, and their elements are discarded as soon as they have
+        been converted.
+
+        :returns:
+            a :class:`openquake.nrmllib.models.DisaggModel` object,
+            generating :class:`openquake.nrmllib.models.DisaggMatrix`
+            objects with dense N-dimensional arrays (the cells missing in
+            a sparse matrix are zeros)
+        """
+        tree = openquake.nrmllib.iterparse_tree(
+            self.source, prune_tags=[self._MATRIX_TAG])
+        for event, element in tree:
+            if event == 'start' and element.tag == self._MATRICES_TAG:
+                metadata = self._parse_metadata(element)
+                break
+        else:
+            raise ValueError('<disaggMatrices> element not found.')
+        return models.DisaggModel(data_iter=self._parse_matrices(tree),
+                                  **metadata)
+
+    @classmethod
+    def _parse_metadata(cls, element):
+        """
+        :param element: a <disaggMatrices> element
+        :returns: a dictionary with the metadata of the matrices
+        """
+        metadata = {}
+        for attr, kw in cls._ATTR_MAP.iteritems():
+            metadata[kw] = element.get(attr)
+        for attr, kw in cls._BIN_EDGE_ATTR_MAP.iteritems():
+            value = element.get(attr)
+            if value is not None:
+                value = numpy.fromstring(value, sep=',')
+            metadata[kw] = value
+        trts = element.get('tectonicRegionTypes')
+        if trts is not None:
+            trts = [trt.strip() for trt in trts.split(',')]
+        metadata['tectonic_region_types'] = trts
+        return metadata
+
+    def _parse_matrices(self, tree):
+        """
+        Generate a :class:`openquake.nrmllib.models.DisaggMatrix` for each
+        <disaggMatrix> element.
+        """
+        for event, element in tree:
+            if event == 'end' and element.tag == self._MATRIX_TAG:
+                yield self._parse_matrix(element)
+
+    def _parse_matrix(self, element):
+        """
+        Build the dense matrix of a <disaggMatrix> element. The indices and
+        the values of all the <prob> elements are extracted with two XPath
+        queries and converted to arrays in a single step.
+        """
+        dims = tuple(int(d) for d in element.get('dims').split(','))
+        indices = numpy.fromstring(
+            ','.join(self._INDICES(element)), int, sep=',')
+        values = numpy.array(self._VALUES(element), numpy.float64)
+        if len(indices) != len(values) * len(dims):
+            raise ValueError('Invalid indices for dims=%s, line %d of %s'
+                             % (element.get('dims'), element.sourceline,
+                                self.source))
+        matrix = numpy.zeros(dims)
+        try:
+            matrix[tuple(indices.reshape(-1, len(dims)).T)] = values
+        except IndexError:
+            raise ValueError('Index out of dims=%s, line %d of %s'
+                             % (element.get('dims'), element.sourceline,
+                                self.source))
+        return models.DisaggMatrix(
+            matrix, element.get('type').split(','),
+            float(element.get('poE')), float(element.get('iml')))
+
+
+class SESXMLParser(object):
+    """
+    Parser for the stochastic event sets written by
+    :class:`openquake.nrmllib.hazard.writers.SESXMLWriter`.
+
+    The ruptures are read one at the time and the parsed elements are
+    discarded as soon as possible, so that a large file can be scanned
+    in constant memory. Only the scalar attributes of the ruptures are
+    decoded while parsing: the elements describing the geometry are kept
+    aside and converted to arrays the first time the geometry of a rupture
+    is accessed (they are freed with the rupture).
+
+    :param source: a filename or a file-like object
+    """
+    _COLLECTION_TAG = ('{%s}stochasticEventSetCollection'
+                       % openquake.nrmllib.NAMESPACE)
+    _SES_TAG = '{%s}stochasticEventSet' % openquake.nrmllib.NAMESPACE
+    _RUPTURE_TAG = '{%s}rupture' % openquake.nrmllib.NAMESPACE
+    _MESH_TAG = '{%s}mesh' % openquake.nrmllib.NAMESPACE
+    _PLANAR_SURFACE_TAG = '{%s}planarSurface' % openquake.nrmllib.NAMESPACE
+    _SEED_RE = re.compile(r'^rupture seed=(\d+)$')
+
+    def __init__(self, source):
+        self.source = source
+
+    def parse(self):
+        """
+        Parse the source XML content.
+
+        :returns:
+            a :class:`openquake.nrmllib.models.SESCollection` object,
+            generating :class:`openquake.nrmllib.models.SES` objects, which
+            in turn generate :class:`openquake.nrmllib.models.SESRupture`
+            objects. The event sets share the same stream of ruptures, so
+            they must be consumed in order, as the groups returned by
+            `itertools.groupby`.
+        """
+        tree = openquake.nrmllib.iterparse_tree(
+            self.source, prune_tags=[self._SES_TAG, self._RUPTURE_TAG],
+            tags=[self._COLLECTION_TAG, self._SES_TAG, self._RUPTURE_TAG])
+        for event, element in tree:
+            if element.tag == self._COLLECTION_TAG:
+                sm_lt_path = element.get('sourceModelTreePath')
+                break
+        else:
+            raise ValueError('<stochasticEventSetCollection> element not '
+                             'found.')
+        return models.SESCollection(sm_lt_path, self._parse_ses(tree))
+
+    def _parse_ses(self, tree):
+        """
+        Generate a :class:`openquake.nrmllib.models.SES` for each
+        <stochasticEventSet> element.
+        """
+        for event, element in tree:
+            if event == 'start' and element.tag == self._SES_TAG:
+                ses = models.SES(int(element.get('id')),
+                                 float(element.get('investigationTime')),
+                                 self._parse_ruptures(tree))
+                yield ses
+                for _ in ses:  # skip the ruptures not read by the caller
+                    pass
+
+    def _parse_ruptures(self, tree):
+        """
+        Generate a :class:`openquake.nrmllib.models.SESRupture` for each
+        <rupture> element, until the end of the current event set.
+        """
+        for event, element in tree:
+            if event == 'start':
+                continue
+            elif element.tag == self._RUPTURE_TAG:
+                yield self._parse_rupture(element)
+            elif element.tag == self._SES_TAG:
+                break
+
+    def _parse_rupture(self, element):
+        """
+        :param element: a <rupture> element
+        :returns: a :class:`openquake.nrmllib.models.SESRupture` object
+        """
+        seed = None
+        geometry = []
+        for child in element:
+            if child.tag is etree.Comment:
+                match = self._SEED_RE.match(child.text.strip())
+                if match:
+                    seed = int(match.group(1))
+            else:
+                geometry.append(child)
+        # detach the geometry from the rupture, which is going to be pruned
+        for child in geometry:
+            element.remove(child)
+        a = element.attrib
+        return models.SESRupture(
+            a['id'], float(a['magnitude']), float(a['strike']),
+            float(a['dip']), float(a['rake']), a['tectonicRegion'],
+            is_from_fault_source=geometry[0].tag == self._MESH_TAG,
+            is_multi_surface=len(geometry) > 1,
+            load_geometry=lambda: self._parse_geometry(geometry),
+            seed=seed)
+
+    def _parse_geometry(self, geometry):
+        """
+        :param geometry:
+            a list with a <mesh> element or with <planarSurface> elements
+        :returns:
+            a dictionary with the geometry attributes of
+            :class:`openquake.nrmllib.models.SESRupture`
+        """
+        attrs = dict.fromkeys(models.SESRupture.GEOMETRY_ATTRS)
+        if geometry[0].tag == self._MESH_TAG:
+            mesh = geometry[0]
+            shape = int(mesh.get('rows')), int(mesh.get('cols'))
+            nodes = numpy.array(
+                [(n.get('row'), n.get('col'), n.get('lon'), n.get('lat'),
+                  n.get('depth')) for n in mesh], numpy.float64)
+            coords = numpy.zeros((3,) + shape)
+            rows, cols = nodes[:, 0].astype(int), nodes[:, 1].astype(int)
+            if len(nodes) != shape[0] * shape[1] or (
+                    rows.max() >= shape[0] or cols.max() >= shape[1]):
+                raise ValueError('Invalid mesh, line %d of %s'
+                                 % (mesh.sourceline, self.source))
+            coords[:, rows, cols] = nodes[:, 2:].T
+            attrs['lons'], attrs['lats'], attrs['depths'] = coords
+        else:
+            # the corners of each surface, in the order top left, top
+            # right, bottom left, bottom right, as required by the schema
+            corners = numpy.array(
+                [(c.get('lon'), c.get('lat'), c.get('depth'))
+                 for surface in geometry for c in surface], numpy.float64)
+            if len(geometry) > 1:
+                attrs['lons'], attrs['lats'], attrs['depths'] = (
+                    corners.T.copy())
+            else:
+                for name, corner in zip(models.SESRupture.GEOMETRY_ATTRS[3:],
+                                        corners.tolist()):
+                    attrs[name] = tuple(corner)
+        return attrs
 
 
 def HazardCurveParser(*args, **kwargs):
@@ -649,10 +1589,145 @@ def HazardCurveParser(*args, **kwargs):
     return HazardCurveXMLParser(*args, **kwargs)
 
 
+#: Number of bytes read at once by :class:`_JSONStream`
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+class _JSONStream(object):
+    """
+    Incremental reader of a JSON document, built on the `raw_decode` method
+    of the decoder of the json module: the file is read in chunks and the
+    values are decoded one at the time by the C scanner, so that a large
+    document is never kept in memory.
+
+    :param fh: a file-like object open for reading
+    :param int chunk_size: the number of bytes read at once
+    """
+    _WS = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self, fh, chunk_size=JSON_CHUNK_SIZE):
+        self.fh = fh
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read(self):
+        """
+        Read a chunk from the file, discarding the consumed part of the
+        buffer.
+        """
+        chunk = self.fh.read(self.chunk_size)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+
+    def peek(self):
+        """
+        Skip the whitespace and return the next character, without
+        consuming it.
+        """
+        while True:
+            self.pos = self._WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            elif self.eof:
+                raise ValueError('Unexpected end of the JSON document')
+            self._read()
+
+    def expect(self, chars):
+        """
+        Consume the next character, which must be one of `chars`.
+
+        :returns: the character
+        """
+        char = self.peek()
+        if char not in chars:
+            raise ValueError('Expected one of %r in the JSON document, got %r'
+                             % (chars, char))
+        self.pos += 1
+        return char
+
+    def value(self):
+        """
+        Decode the next JSON value.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+            else:
+                # a number at the end of the buffer may be truncated
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            self._read()
+
+
+def _iter_feature_collection(fh, chunk_size=JSON_CHUNK_SIZE):
+    """
+    Read a GeoJSON FeatureCollection incrementally.
+
+    :param fh: a file-like object open for reading
+    :param int chunk_size: the number of bytes read at once
+    :returns:
+        an iterator over pairs (name, value) for the members of the
+        collection, in the order of the document; instead of the member
+        `features`, a pair ('feature', feature) is generated for each
+        feature, as soon as it is decoded
+    """
+    stream = _JSONStream(fh, chunk_size)
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+    while True:
+        name = stream.value()
+        if not isinstance(name, basestring):
+            raise ValueError('Invalid member name %r in the GeoJSON document'
+                             % (name,))
+        stream.expect(':')
+        if name == 'features':
+            stream.expect('[')
+            if stream.peek() == ']':
+                stream.expect(']')
+            else:
+                while True:
+                    yield 'feature', stream.value()
+                    if stream.expect(',]') == ']':
+                        break
+        else:
+            yield name, stream.value()
+        if stream.expect(',}') == '}':
+            return
+
+
+def _is_seekable(fh):
+    """
+    :param fh: a file-like object open for reading
+    :returns: True if `fh` can be rewound with `seek`
+    """
+    try:
+        fh.seek(fh.tell())
+    except (AttributeError, IOError, ValueError):
+        return False
+    return True
+
+
 class HazardCurveGeoJSONParser(object):
     """
     Parser for reading hazard curve data from a GeoJSON.
     Has the same interface and output as the :class:`HazardCurveXMLParser`.
+
+    The document is read incrementally and the curves are generated one
+    feature at the time. Since the writers put the metadata after the
+    features, the metadata are read in a first pass, in which the features
+    are decoded and discarded; file-like sources are then rewound with
+    `seek`. Sources which cannot be rewound, like pipes, sockets and HTTP
+    responses, are read in a single pass keeping the features in memory.
     """
 
     def __init__(self, source):
@@ -663,11 +1738,66 @@ class HazardCurveGeoJSONParser(object):
         Read hazard curve data from a GeoJSON source into a
         :class:`openquake.nrmllib.models.HazardCurveModel`.
         """
-        metadata = OrderedDict()
-        with openquake.nrmllib.NRMLFile(self.source) as fh:
-            data = json.load(fh)
+        metadata, features = self._read()
+        return models.HazardCurveModel(
+            data_iter=self._parse_curves(features), **metadata)
+
+    def parse_arrays(self):
+        """
+        Read hazard curve data from a GeoJSON source into arrays, without
+        building an object for each curve.
+
+        :returns:
+            a triple (metadata, locations, poes), where metadata is the
+            dictionary of the attributes of a
+            :class:`openquake.nrmllib.models.HazardCurveModel`, locations
+            is an array of shape (N, 2) with the longitudes and latitudes
+            of the curves and poes is an array of shape (N, L), L being the
+            number of IMLs
+        :raises ValueError:
+            if the metadata do not contain the IMLs
+        """
+        metadata, features = self._read()
+        if metadata['imls'] is None:
+            raise ValueError('Missing IMLs in the oqmetadata of %s'
+                             % self.source)
+        locations = _GrowingArray(2)
+        poes = _GrowingArray(len(metadata['imls']))
+        for feature in features:
+            locations.append(feature['geometry']['coordinates'])
+            poes.append(feature['properties']['poEs'])
+        return metadata, locations.toarray(), poes.toarray()
+
+    def _read(self):
+        """
+        Read the `oqmetadata` member of the document.
+
+        :returns:
+            a pair (metadata, features), where metadata is a dictionary
+            with the hazard curve metadata and features an iterator over
+            the features of the document
+        """
+        if isinstance(self.source, (basestring, buffer)):
+            with open(self.source) as fh:
+                oqmetadata = self._read_oqmetadata(fh)
+            features = self._parse_features()
+        elif _is_seekable(self.source):
+            start = self.source.tell()
+            oqmetadata = self._read_oqmetadata(self.source)
+            self.source.seek(start)
+            features = self._parse_features()
+        else:
+            oqmetadata = None
+            features = []
+            for name, value in _iter_feature_collection(self.source):
+                if name == 'feature':
+                    features.append(value)
+                elif name == 'oqmetadata':
+                    oqmetadata = value
+            if oqmetadata is None:
+                raise ValueError('Missing oqmetadata in the GeoJSON document')
+            features = iter(features)
 
-        oqmetadata = data['oqmetadata']
         metadata = {}
         metadata['statistics'] = oqmetadata.get('statistics')
         metadata['quantile_value'] = oqmetadata.get('quantileValue')
@@ -678,14 +1808,35 @@ class HazardCurveGeoJSONParser(object):
         metadata['sa_period'] = oqmetadata.get('saPeriod')
         metadata['sa_damping'] = oqmetadata.get('saDamping')
         metadata['imls'] = oqmetadata.get('IMLs')
+        return metadata, features
+
+    @staticmethod
+    def _read_oqmetadata(fh):
+        """
+        :param fh: a file-like object open for reading
+        :returns: the `oqmetadata` member of the document
+        """
+        for name, value in _iter_feature_collection(fh):
+            if name == 'oqmetadata':
+                return value
+        raise ValueError('Missing oqmetadata in the GeoJSON document')
 
-        features = data['features']
+    def _parse_features(self):
+        """
+        Generate the features of the document.
+        """
+        with openquake.nrmllib.NRMLFile(self.source) as fh:
+            for name, value in _iter_feature_collection(fh):
+                if name == 'feature':
+                    yield value
 
-        data_iter = []
+    @staticmethod
+    def _parse_curves(features):
+        """
+        Generate a :class:`openquake.nrmllib.models.HazardCurveData` for
+        each feature.
+        """
         for feature in features:
             lon, lat = feature['geometry']['coordinates']
             loc = models.Location(lon, lat)
-            curve = models.HazardCurveData(loc, feature['properties']['poEs'])
-            data_iter.append(curve)
-
-        return models.HazardCurveModel(data_iter=data_iter, **metadata)
+            yield models.HazardCurveData(loc, feature['properties']['poEs'])
@@ -17,18 +17,20 @@
 Classes for serializing various NRML XML artifacts.
 """
 
-import json
 import numpy
 import StringIO
 import tokenize
 
 from lxml import etree
+from xml.sax.saxutils import quoteattr
 from collections import OrderedDict
-from itertools import izip
+from itertools import chain, izip
 
 import openquake.nrmllib
 from openquake.nrmllib import NRMLFile
-from openquake.nrmllib import models, node
+from openquake.nrmllib import models, node, writers
+from openquake.nrmllib.floatformat import (
+    format_output, check_float_format, printf_values, FLOAT_FORMATS)
 
 
 SM_TREE_PATH = 'sourceModelTreePath'
@@ -173,11 +175,22 @@ class HazardCurveXMLWriter(BaseCurveWriter):
     The following parameters are optional:
         * sa_period: Only used with imt = 'SA'.
         * sa_damping: Only used with imt = 'SA'.
+
+    :param float_format:
+        The format of the IMLs and of the PoEs, see
+        :mod:`openquake.nrmllib.floatformat`; if None the default formats
+        are used.
     """
 
+    def __init__(self, dest, float_format=None, **metadata):
+        super(HazardCurveXMLWriter, self).__init__(dest, **metadata)
+        self.float_format = check_float_format(float_format)
+
     def serialize(self, data):
         """
-        Write a sequence of hazard curves to the specified file.
+        Write a sequence of hazard curves to the specified file. The curves
+        are written one at the time, so that the memory occupation does
+        not depend on the number of curves.
 
         :param data:
             Iterable of hazard curve data. Each datum must be an object with
@@ -190,11 +203,11 @@ class HazardCurveXMLWriter(BaseCurveWriter):
         with NRMLFile(self.dest, 'w') as fh:
             root = etree.Element('nrml',
                                  nsmap=openquake.nrmllib.SERIALIZE_NS_MAP)
-            self.add_hazard_curves(root, self.metadata, data)
-
-            fh.write(etree.tostring(
-                root, pretty_print=True, xml_declaration=True,
-                encoding='UTF-8'))
+            hazard_curves = self._hazard_curves_elem(
+                root, self.metadata, self.float_format)
+            _write_streaming(fh, root, hazard_curves,
+                             lambda indent: _gen_hazard_curves(
+                                 data, indent, self.float_format))
 
     def add_hazard_curves(self, root, metadata, data):
         """
@@ -203,12 +216,8 @@ class HazardCurveXMLWriter(BaseCurveWriter):
         `serialize` and the constructor for a description of `data`
         and `metadata`, respectively.
         """
-        hazard_curves = etree.SubElement(root, 'hazardCurves')
-
-        _set_metadata(hazard_curves, metadata, _ATTR_MAP)
-
-        imls_elem = etree.SubElement(hazard_curves, 'IMLs')
-        imls_elem.text = ' '.join([str(x) for x in metadata['imls']])
+        hazard_curves = self._hazard_curves_elem(
+            root, metadata, self.float_format)
         gml_ns = openquake.nrmllib.SERIALIZE_NS_MAP['gml']
 
         for hc in data:
@@ -217,19 +226,138 @@ class HazardCurveXMLWriter(BaseCurveWriter):
             gml_pos = etree.SubElement(gml_point, '{%s}pos' % gml_ns)
             gml_pos.text = '%s %s' % (hc.location.x, hc.location.y)
             poes_elem = etree.SubElement(hc_elem, 'poEs')
-            poes_elem.text = ' '.join([str(x) for x in hc.poes])
+            poes_elem.text = format_output(
+                'poes', hc.poes, self.float_format)
+
+    @staticmethod
+    def _hazard_curves_elem(root, metadata, float_format=None):
+        """
+        Add to `root` a <hazardCurves> element with the given `metadata`
+        and its <IMLs> child, formatted with `float_format`.
+
+        :returns: the <hazardCurves> element
+        """
+        hazard_curves = etree.SubElement(root, 'hazardCurves')
+
+        _set_metadata(hazard_curves, metadata, _ATTR_MAP)
+
+        imls_elem = etree.SubElement(hazard_curves, 'IMLs')
+        imls_elem.text = format_output(
+            'imls', metadata['imls'], float_format)
+        return hazard_curves
+
+
+#: Template for a <hazardCurve> element, with the same layout produced
+#: by `etree.tostring(pretty_print=True)`
+_HAZARD_CURVE_TMPL = """\
+%(indent)s<hazardCurve>
+%(indent)s  <gml:Point>
+%(indent)s    <gml:pos>%(x)s %(y)s</gml:pos>
+%(indent)s  </gml:Point>
+%(indent)s  <poEs>%(poes)s</poEs>
+%(indent)s</hazardCurve>
+"""
+
+
+def _gen_hazard_curves(data, indent, float_format=None):
+    """
+    Generate the XML strings of the <hazardCurve> elements.
+
+    :param data:
+        Iterable of hazard curve data, see
+        :meth:`HazardCurveXMLWriter.serialize`.
+    :param str indent:
+        The indentation of the <hazardCurve> elements.
+    :param float_format:
+        The format of the PoEs, or None for the default one.
+    """
+    for hc in data:
+        yield _HAZARD_CURVE_TMPL % dict(
+            indent=indent, x=hc.location.x, y=hc.location.y,
+            poes=format_output('poes', hc.poes, float_format))
+
+
+#: Text of the comment marking the position of the streamed children
+_PLACEHOLDER = 'nrmllib streaming placeholder'
+
+
+def _split_at_placeholder(root, parent, **kwargs):
+    """
+    Serialize the pretty printed XML document `root` with a placeholder
+    comment as the last child of the `parent` element and split the result
+    at the placeholder.
+
+    :param root:
+        An :class:`lxml.etree._Element` instance, the root of the document.
+    :param parent:
+        A descendant of `root`.
+    :param kwargs:
+        Extra arguments for `etree.tostring`.
+    :returns:
+        A triple (head, indent, tail), where head is the XML before the
+        placeholder (ending with a newline), indent the indentation of the
+        children of `parent` and tail the XML after the placeholder.
+    """
+    placeholder = etree.Comment(_PLACEHOLDER)
+    parent.append(placeholder)
+    try:
+        xml = etree.tostring(root, pretty_print=True, **kwargs)
+    finally:
+        parent.remove(placeholder)
+    head, tail = xml.split('<!--%s-->\n' % _PLACEHOLDER)
+    head, indent = head.rsplit('\n', 1)
+    return head + '\n', indent, tail
+
+
+def _write_streaming(fh, root, parent, gen_children):
+    """
+    Write the pretty printed XML document `root` on the file `fh`, with the
+    XML strings generated by `gen_children` as the last children of the
+    `parent` element. The children are written as soon as they are
+    generated, so they are never kept in memory all together.
+
+    The document is serialized with a placeholder comment as the last
+    child of `parent`, which is then replaced by the generated strings;
+    so the output is the same produced by `etree.tostring` as long as
+    `gen_children` generates the children with the same layout.
+
+    :param fh:
+        A file-like object open for writing.
+    :param root:
+        An :class:`lxml.etree._Element` instance, the root of the document.
+    :param parent:
+        A descendant of `root`.
+    :param gen_children:
+        A function taking the indentation string of the children and
+        returning an iterable over the XML strings of the children, each
+        one ending with a newline.
+    """
+    head, indent, tail = _split_at_placeholder(
+        root, parent, xml_declaration=True, encoding='UTF-8')
+    fh.write(head)
+    for child in gen_children(indent):
+        fh.write(child)
+    fh.write(tail)
 
 
 class HazardCurveGeoJSONWriter(BaseCurveWriter):
     """
     Writes hazard curves to GeoJSON. Has the same constructor and interface as
-    :class:`HazardCurveXMLWriter`.
+    :class:`HazardCurveXMLWriter`, plus the options `compact` and
+    `float_format` of :class:`openquake.nrmllib.writers.StreamingGeoJSONWriter`
+    (a non-indented output is selected with `compact=True`).
     """
 
+    def __init__(self, dest, compact=False, float_format=None, **metadata):
+        super(HazardCurveGeoJSONWriter, self).__init__(dest, **metadata)
+        self.compact = compact
+        self.float_format = writers.check_geojson_float_format(float_format)
+
     def serialize(self, data):
         """
         Write the hazard curves to the given as GeoJSON. The GeoJSON format
-        is customized to contain various bits of metadata.
+        is customized to contain various bits of metadata. The curves are
+        written as soon as they are consumed from `data`.
 
         See :meth:`HazardCurveXMLWriter.serialize` for expected input.
         """
@@ -243,50 +371,51 @@ class HazardCurveGeoJSONWriter(BaseCurveWriter):
                 else:
                     oqmetadata[_ATTR_MAP.get(key)] = str(value)
 
-        features = []
-        feature_coll = {
-            'type': 'FeatureCollection',
-            'features': features,
-            'oqtype': 'HazardCurve',
-            'oqnrmlversion': '0.4',
-            'oqmetadata': oqmetadata,
-        }
-        for hc in data:
-            poes = list(hc.poes)
-            lon = hc.location.x
-            lat = hc.location.y
-
-            feature = {
-                'type': 'Feature',
-                'geometry': {
-                    'type': 'Point',
-                    'coordinates': [float(lon), float(lat)],
-                },
-                'properties': {'poEs': list(poes)},
-            }
-            features.append(feature)
+        features = ({
+            'type': 'Feature',
+            'geometry': {
+                'type': 'Point',
+                'coordinates': [float(hc.location.x), float(hc.location.y)],
+            },
+            'properties': {'poEs': list(hc.poes)},
+        } for hc in data)
 
         with NRMLFile(self.dest, 'w') as fh:
-            json.dump(feature_coll, fh, sort_keys=True, indent=4,
-                      separators=(',', ': '))
+            _geojson_writer(fh, self.compact, self.float_format).serialize(
+                features, oqtype='HazardCurve', oqnrmlversion='0.4',
+                oqmetadata=oqmetadata)
+
+
+def _geojson_writer(fh, compact, float_format):
+    """
+    :returns:
+        a :class:`openquake.nrmllib.writers.StreamingGeoJSONWriter`
+        writing on `fh`, indented with 4 spaces unless `compact` is true
+    """
+    return writers.StreamingGeoJSONWriter(
+        fh, indent=None if compact else 4, float_format=float_format)
 
 
 class MultiHazardCurveXMLWriter(object):
     """
     A serializer of multiple hazard curve set having multiple
-    metadata. It uses
-    :class:`openquake.nrmllib.hazard.writers.HazardCurveXMLWriter` to
-    actually serialize the single set of curves.
+    metadata. It writes a <hazardCurves> element per set, with the
+    same layout of
+    :class:`openquake.nrmllib.hazard.writers.HazardCurveXMLWriter`.
 
     :attr str dest:
          The path of the filename to be written, or a file-like object
     :attr metadata_set:
          Iterable over metadata suitable to create instances of
          :class:`openquake.nrmllib.hazard.writers.HazardCurveXMLWriter`
+    :attr float_format:
+         The format of the IMLs and of the PoEs, see
+         :class:`openquake.nrmllib.hazard.writers.HazardCurveXMLWriter`
     """
-    def __init__(self, dest, metadata_set):
+    def __init__(self, dest, metadata_set, float_format=None):
         self.dest = dest
         self.metadata_set = metadata_set
+        self.float_format = check_float_format(float_format)
 
         for metadata in metadata_set:
             _validate_hazard_metadata(metadata)
@@ -294,6 +423,10 @@ class MultiHazardCurveXMLWriter(object):
     def serialize(self, curve_set):
         """
         Write a set of sequence of hazard curves to the specified file.
+        The sets and their curves are consumed lazily and written one at
+        the time, so that the memory occupation does not depend on the
+        number of curves.
+
         :param curve_set:
 
            Iterable over sequence of curves. Each element returned by
@@ -304,13 +437,30 @@ class MultiHazardCurveXMLWriter(object):
         with NRMLFile(self.dest, 'w') as fh:
             root = etree.Element('nrml',
                                  nsmap=openquake.nrmllib.SERIALIZE_NS_MAP)
-            for metadata, curve_data in zip(self.metadata_set, curve_set):
-                writer = HazardCurveXMLWriter(self.dest, **metadata)
-                writer.add_hazard_curves(root, metadata, curve_data)
+            _write_streaming(fh, root, root,
+                             lambda _indent: self._gen_blocks(curve_set))
 
-            fh.write(etree.tostring(
-                root, pretty_print=True, xml_declaration=True,
-                encoding='UTF-8'))
+    def _gen_blocks(self, curve_set):
+        """
+        Generate the XML strings of the <hazardCurves> elements.
+
+        :param curve_set:
+            See :meth:`serialize`.
+        """
+        for metadata, data in izip(self.metadata_set, curve_set):
+            # serialize a document with the <hazardCurves> element only,
+            # then strip the root tags; the indentation is the same
+            root = etree.Element('nrml',
+                                 nsmap=openquake.nrmllib.SERIALIZE_NS_MAP)
+            hazard_curves = HazardCurveXMLWriter._hazard_curves_elem(
+                root, metadata, self.float_format)
+            head, curve_indent, tail = _split_at_placeholder(
+                root, hazard_curves)
+            yield head.split('\n', 1)[1]
+            for curve in _gen_hazard_curves(
+                    data, curve_indent, self.float_format):
+                yield curve
+            yield tail.rsplit('\n', 2)[0] + '\n'
 
 
 def gen_gmfs(gmf_set):
@@ -404,7 +554,11 @@ class EventBasedGMFXMLWriter(object):
             node.node_to_nrml(gmf_container, dest)
 
 
-def rupture_to_element(rupture, parent=None):
+# parser of the <node> elements generated by _gen_mesh_nodes
+_MESH_PARSER = etree.XMLParser(remove_blank_text=True)
+
+
+def rupture_to_element(rupture, parent=None, float_format=None):
     """
     Convert a rupture object into an Element object.
 
@@ -413,13 +567,94 @@ def rupture_to_element(rupture, parent=None):
     :param parent:
         if None a new element is created, otherwise a sub element is
         attached to the parent.
+    :param float_format:
+        the format of the coordinates, or None for the default one
     """
-    if parent is None:
-        rup_elem = etree.Element('rupture')
-    else:
-        rup_elem = etree.SubElement(parent, 'rupture')
+    rup_elem, mesh_elem = _rupture_skeleton(rupture, float_format)
+    if mesh_elem is not None:
+        # parsing the formatted nodes is much faster than building them
+        # one by one
+        mesh_elem.extend(list(etree.fromstring(
+            '<mesh>%s</mesh>' % _format_mesh_nodes(
+                rupture.rupture, '', float_format),
+            _MESH_PARSER)))
+    if parent is not None:
+        parent.append(rup_elem)
+    return rup_elem
 
-    rup_elem.append(etree.Comment('rupture seed=%d' % rupture.seed))
+
+def _rupture_to_xml(rupture, float_format=None):
+    """
+    Convert a rupture object into a pretty printed XML string, the same
+    returned by `etree.tostring(rupture_to_element(rupture),
+    pretty_print=True)`. The nodes of the mesh of a rupture from a fault
+    source are formatted at once, without creating an element for each
+    of them.
+
+    :param rupture:
+        must have attributes .rupture, .tag and .seed
+    :param float_format:
+        the format of the coordinates, or None for the default one
+    """
+    rup_elem, mesh_elem = _rupture_skeleton(rupture, float_format)
+    if mesh_elem is None:
+        return etree.tostring(rup_elem, pretty_print=True)
+    head, indent, tail = _split_at_placeholder(rup_elem, mesh_elem)
+    return head + _format_mesh_nodes(
+        rupture.rupture, indent, float_format) + tail
+
+
+def _format_mesh_nodes(rup, indent, float_format=None):
+    """
+    Format all the <node> elements of the mesh of a rupture in a single
+    printf-style operation, with the given format or, if None, with the
+    default format of the 'rupture_coords' kind of
+    :data:`openquake.nrmllib.floatformat.FLOAT_FORMATS`.
+
+    :param rup:
+        a rupture from a fault source, with 2D `lons`, `lats` and `depths`
+    :param str indent:
+        the indentation of the <node> elements
+    :param float_format:
+        the format of the coordinates, or None
+    :returns:
+        the XML string of the nodes, one per line
+    """
+    fmt = float_format or FLOAT_FORMATS['rupture_coords']
+    fmts = []
+    coords = []
+    for coord in (rup.lons, rup.lats, rup.depths):
+        if not isinstance(coord, numpy.ndarray):  # nested lists
+            coord = numpy.asarray(coord).ravel().tolist()
+        coord_fmt, values = printf_values(coord, fmt)
+        fmts.append(coord_fmt)
+        coords.append(values)
+    num_rows, num_cols = numpy.shape(rup.lons)
+    rows = numpy.repeat(numpy.arange(num_rows), num_cols).tolist()
+    cols = numpy.tile(numpy.arange(num_cols), num_rows).tolist()
+    line = '%s<node row="%%d" col="%%d" lon="%s" lat="%s" depth="%s"/>\n' % (
+        indent.replace('%', '%%'), fmts[0], fmts[1], fmts[2])
+    cells = tuple(chain.from_iterable(izip(rows, cols, *coords)))
+    return (line * len(rows)) % cells
+
+
+def _rupture_skeleton(rupture, float_format=None):
+    """
+    Build the <rupture> element of a rupture object, except for the
+    nodes of the mesh of a rupture from a fault source.
+
+    :param rupture:
+        must have attributes .rupture, .tag and .seed
+    :param float_format:
+        the format of the coordinates of the corners, or None for the
+        default one
+    :returns:
+        a pair (rupture element, mesh element), where the mesh element is
+        None if the rupture is not from a fault source
+    """
+    rup_elem = etree.Element('rupture')
+    if rupture.seed is not None:  # None for ruptures read from a file
+        rup_elem.append(etree.Comment('rupture seed=%d' % rupture.seed))
 
     rup = rupture.rupture
     rup_elem.set('id', rupture.tag)
@@ -435,24 +670,16 @@ def rupture_to_element(rupture, parent=None):
         # points
         mesh_elem = etree.SubElement(rup_elem, 'mesh')
 
-        # we assume the mesh components (lons, lats, depths)
-        # are of uniform shape
-        for i, row in enumerate(rup.lons):
-            for j, col in enumerate(row):
-                node_elem = etree.SubElement(mesh_elem, 'node')
-                node_elem.set('row', str(i))
-                node_elem.set('col', str(j))
-                node_elem.set('lon', str(rup.lons[i][j]))
-                node_elem.set('lat', str(rup.lats[i][j]))
-                node_elem.set(
-                    'depth', str(rup.depths[i][j]))
-        try:
-            # if we never entered the loop above, it's possible
-            # that i and j will be undefined
-            mesh_elem.set('rows', str(i + 1))
-            mesh_elem.set('cols', str(j + 1))
-        except NameError:
+        # the mesh components (lons, lats, depths) must be 2D and
+        # of uniform shape
+        shape = numpy.shape(rup.lons)
+        if len(shape) != 2 or not shape[0] or not shape[1]:
             raise ValueError('Invalid rupture mesh')
+        if numpy.shape(rup.lats) != shape or numpy.shape(rup.depths) != shape:
+            raise ValueError('Invalid rupture mesh')
+        mesh_elem.set('rows', str(shape[0]))
+        mesh_elem.set('cols', str(shape[1]))
+        return rup_elem, mesh_elem
     else:
         # rupture is from a multi surface fault source
         if rup.is_multi_surface:
@@ -483,11 +710,8 @@ def rupture_to_element(rupture, parent=None):
                         ('topRight', top_right),
                         ('bottomLeft', bottom_left),
                         ('bottomRight', bottom_right)):
-
-                    corner_elem = etree.SubElement(ps_elem, el_name)
-                    corner_elem.set('lon', str(corner[0]))
-                    corner_elem.set('lat', str(corner[1]))
-                    corner_elem.set('depth', str(corner[2]))
+                    _set_corner(etree.SubElement(ps_elem, el_name), corner,
+                                float_format)
 
         else:
             # rupture is from a point or area source
@@ -505,12 +729,26 @@ def rupture_to_element(rupture, parent=None):
                     ('topRight', rup.top_right_corner),
                     ('bottomLeft', rup.bottom_left_corner),
                     ('bottomRight', rup.bottom_right_corner)):
+                _set_corner(etree.SubElement(ps_elem, el_name), corner,
+                            float_format)
+    return rup_elem, None
 
-                corner_elem = etree.SubElement(ps_elem, el_name)
-                corner_elem.set('lon', str(corner[0]))
-                corner_elem.set('lat', str(corner[1]))
-                corner_elem.set('depth', str(corner[2]))
-    return rup_elem
+
+def _set_corner(corner_elem, corner, float_format=None):
+    """
+    Set the coordinates of a corner of a planar surface, with the given
+    format or, if None, with the default format of the 'rupture_coords'
+    kind of :data:`openquake.nrmllib.floatformat.FLOAT_FORMATS`.
+
+    :param corner_elem: a <topLeft>, <topRight>, ... element
+    :param corner: a triple (lon, lat, depth)
+    :param float_format: the format of the coordinates, or None
+    """
+    fmt = float_format or FLOAT_FORMATS['rupture_coords']
+    for name, value in zip(('lon', 'lat', 'depth'), corner):
+        if fmt is not None:
+            value = repr(float(value)) if fmt == 'repr' else fmt % value
+        corner_elem.set(name, str(value))
 
 
 class SESXMLWriter(object):
@@ -524,12 +762,18 @@ class SESXMLWriter(object):
     :param gsim_lt_path:
         GSIM logic tree branch identifier of the logic tree realization which
         produced this collection of stochastic event sets.
+    :param float_format:
+        The format of the coordinates of the ruptures, see
+        :mod:`openquake.nrmllib.floatformat`; if None the default format
+        is used.
     """
     # gsim_lt_path is there only for backward compatibility, it is scheduled
     # for complete removal (MS)
-    def __init__(self, dest, sm_lt_path, gsim_lt_path=None):
+    def __init__(self, dest, sm_lt_path, gsim_lt_path=None,
+                 float_format=None):
         self.dest = dest
         self.sm_lt_path = sm_lt_path
+        self.float_format = check_float_format(float_format)
 
     def serialize(self, data):
         """
@@ -586,6 +830,9 @@ class SESXMLWriter(object):
             * bottom right
 
             Each of these should be a triple of `lon`, `lat`, `depth`.
+
+        The ruptures are written as soon as they are generated, so that
+        only one of them is kept in memory at the time.
         """
         with NRMLFile(self.dest, 'w') as fh:
             root = etree.Element('nrml',
@@ -593,20 +840,59 @@ class SESXMLWriter(object):
             ses_container = etree.SubElement(
                 root, 'stochasticEventSetCollection')
             ses_container.set(SM_TREE_PATH, self.sm_lt_path)
-            for ses in data:
-                ruptures = list(ses)
-                if not ruptures:  # empty SES, don't export it
-                    continue
-                ses_elem = etree.SubElement(
-                    ses_container, 'stochasticEventSet')
-                ses_elem.set('id', str(ses.ordinal or 1))
-                ses_elem.set('investigationTime', str(ses.investigation_time))
-                for rupture in ruptures:
-                    rupture_to_element(rupture, ses_elem)
+            ses_ruptures = _gen_ses_ruptures(data)
+            try:
+                first = ses_ruptures.next()
+            except StopIteration:  # no ruptures at all
+                fh.write(etree.tostring(
+                    root, pretty_print=True, xml_declaration=True,
+                    encoding='UTF-8'))
+                return
+            _write_streaming(
+                fh, root, ses_container, lambda indent: _gen_ses(
+                    chain([first], ses_ruptures), indent, self.float_format))
+
+
+def _gen_ses_ruptures(data):
+    """
+    Generate pairs (ses, ruptures) for the non-empty stochastic event sets
+    in `data`, where `ruptures` is an iterator over the ruptures of `ses`.
+    An empty SES is detected by looking ahead for its first rupture, so
+    the ruptures are never collected in a list.
+    """
+    for ses in data:
+        ruptures = iter(ses)
+        try:
+            first = ruptures.next()
+        except StopIteration:  # empty SES, don't export it
+            continue
+        yield ses, chain([first], ruptures)
 
-            fh.write(etree.tostring(
-                root, pretty_print=True, xml_declaration=True,
-                encoding='UTF-8'))
+
+def _gen_ses(ses_ruptures, indent, float_format=None):
+    """
+    Generate the XML strings of the <stochasticEventSet> elements.
+
+    :param ses_ruptures:
+        An iterable over pairs (ses, ruptures), see :func:`_gen_ses_ruptures`.
+    :param str indent:
+        The indentation of the <stochasticEventSet> elements.
+    :param float_format:
+        The format of the coordinates, or None for the default one.
+    """
+    for ses, ruptures in ses_ruptures:
+        ses_elem = etree.Element('stochasticEventSet')
+        ses_elem.set('id', str(ses.ordinal or 1))
+        ses_elem.set('investigationTime', str(ses.investigation_time))
+        head, rup_indent, tail = _split_at_placeholder(ses_elem, ses_elem)
+        yield indent + head
+        rup_indent = indent + rup_indent
+        for rupture in ruptures:
+            # each rupture is serialized on its own and indented
+            xml = _rupture_to_xml(rupture, float_format)
+            yield rup_indent + xml[:-1].replace(
+                '\n', '\n' + rup_indent) + '\n'
+        yield indent + tail
 
 
 class HazardMapWriter(object):
@@ -690,12 +976,21 @@ class HazardMapGeoJSONWriter(HazardMapWriter):
     GeoJSON implementation of a :class:`HazardMapWriter`. Serializes hazard
     maps as FeatureCollection artifacts with additional hazard map metadata.
 
-    See :class:`HazardMapWriter` for information about constructor parameters.
+    See :class:`HazardMapWriter` for information about constructor parameters;
+    `compact` and `float_format` are the options of
+    :class:`openquake.nrmllib.writers.StreamingGeoJSONWriter` (a non-indented
+    output is selected with `compact=True`).
     """
 
+    def __init__(self, dest, compact=False, float_format=None, **metadata):
+        super(HazardMapGeoJSONWriter, self).__init__(dest, **metadata)
+        self.compact = compact
+        self.float_format = writers.check_geojson_float_format(float_format)
+
     def serialize(self, data):
         """
-        Serialize hazard map data to GeoJSON.
+        Serialize hazard map data to GeoJSON. The nodes are written as soon
+        as they are consumed from `data`.
 
         See :meth:`HazardMapWriter.serialize` for details about the expected
         input.
@@ -705,29 +1000,19 @@ class HazardMapGeoJSONWriter(HazardMapWriter):
             if value is not None:
                 oqmetadata[_ATTR_MAP.get(key)] = str(value)
 
-        features = []
-        feature_coll = {
-            'type': 'FeatureCollection',
-            'features': features,
-            'oqtype': 'HazardMap',
-            'oqnrmlversion': '0.4',
-            'oqmetadata': oqmetadata,
-        }
-
-        for lon, lat, iml in data:
-            feature = {
-                'type': 'Feature',
-                'geometry': {
-                    'type': 'Point',
-                    'coordinates': [float(lon), float(lat)],
-                },
-                'properties': {'iml': float(iml)},
-            }
-            features.append(feature)
+        features = ({
+            'type': 'Feature',
+            'geometry': {
+                'type': 'Point',
+                'coordinates': [float(lon), float(lat)],
+            },
+            'properties': {'iml': float(iml)},
+        } for lon, lat, iml in data)
 
         with NRMLFile(self.dest, 'w') as fh:
-            json.dump(feature_coll, fh, sort_keys=True, indent=4,
-                      separators=(',', ': '))
+            _geojson_writer(fh, self.compact, self.float_format).serialize(
+                features, oqtype='HazardMap', oqnrmlversion='0.4',
+                oqmetadata=oqmetadata)
 
 
 class DisaggXMLWriter(object):
@@ -761,6 +1046,17 @@ class DisaggXMLWriter(object):
 
         * sa_period: Only used with imt = 'SA'.
         * sa_damping: Only used with imt = 'SA'.
+    :param threshold:
+        If None (the default) every cell of the matrices is written;
+        otherwise only the cells with a value greater than `threshold`
+        (for instance 0, to skip the zeros) are written, i.e. the matrices
+        are stored in sparse form. Since a <disaggMatrix> must contain at
+        least a <prob>, the first cell is written if no cell is above the
+        threshold.
+    :param float_format:
+        The format of the probabilities, see
+        :mod:`openquake.nrmllib.floatformat`; if None the default format
+        is used.
     """
 
     #: Maps metadata keywords to XML attribute names for bin edge information
@@ -785,13 +1081,19 @@ class DisaggXMLWriter(object):
         ('TRT', 'tectonic_region_types'),
     ])
 
-    def __init__(self, dest, **metadata):
+    def __init__(self, dest, threshold=None, float_format=None, **metadata):
         self.dest = dest
+        self.threshold = threshold
+        self.float_format = check_float_format(float_format)
         self.metadata = metadata
         _validate_hazard_metadata(self.metadata)
 
     def serialize(self, data):
         """
+        Write the matrices to the specified file. The matrices are consumed
+        lazily and the <prob> elements are formatted in chunks, so that the
+        memory occupation does not depend on the size of the matrices.
+
         :param data:
             A sequence of data where each datum has the following attributes:
 
@@ -819,36 +1121,87 @@ class DisaggXMLWriter(object):
             _set_metadata(diss_matrices, self.metadata, self.BIN_EDGE_ATTR_MAP,
                           transform=transform)
 
-            for result in data:
-                diss_matrix = etree.SubElement(diss_matrices, 'disaggMatrix')
-
-                # Check that we have bin edges defined for each dimension label
-                # (mag, dist, lon, lat, eps, TRT)
-                for label in result.dim_labels:
-                    bin_edge_attr = self.DIM_LABEL_TO_BIN_EDGE_MAP.get(label)
-                    assert self.metadata.get(bin_edge_attr) is not None, (
-                        "Writer is missing '%s' metadata" % bin_edge_attr
-                    )
-
-                result_type = ','.join(result.dim_labels)
-                diss_matrix.set('type', result_type)
-
-                dims = ','.join([str(x) for x in result.matrix.shape])
-                diss_matrix.set('dims', dims)
-
-                diss_matrix.set('poE', str(result.poe))
-                diss_matrix.set('iml', str(result.iml))
-
-                for idxs, value in numpy.ndenumerate(result.matrix):
-                    prob = etree.SubElement(diss_matrix, 'prob')
+            _write_streaming(fh, root, diss_matrices,
+                             lambda indent: self._gen_matrices(data, indent))
 
-                    index = ','.join([str(x) for x in idxs])
-                    prob.set('index', index)
-                    prob.set('value', str(value))
+    def _gen_matrices(self, data, indent):
+        """
+        Generate the XML strings of the <disaggMatrix> elements.
 
-            fh.write(etree.tostring(
-                root, pretty_print=True, xml_declaration=True,
-                encoding='UTF-8'))
+        :param data:
+            See :meth:`serialize`.
+        :param str indent:
+            The indentation of the <disaggMatrix> elements.
+        """
+        for result in data:
+            # Check that we have bin edges defined for each dimension label
+            # (mag, dist, lon, lat, eps, TRT)
+            for label in result.dim_labels:
+                bin_edge_attr = self.DIM_LABEL_TO_BIN_EDGE_MAP.get(label)
+                assert self.metadata.get(bin_edge_attr) is not None, (
+                    "Writer is missing '%s' metadata" % bin_edge_attr
+                )
+
+            yield '%s<disaggMatrix type=%s dims=%s poE=%s iml=%s>\n' % (
+                indent, quoteattr(','.join(result.dim_labels)),
+                quoteattr(','.join([str(x) for x in result.matrix.shape])),
+                quoteattr(str(result.poe)), quoteattr(str(result.iml)))
+            for probs in _gen_probs(result.matrix, self.threshold,
+                                    indent + '  ', self.float_format):
+                yield probs
+            yield '%s</disaggMatrix>\n' % indent
+
+
+#: Number of <prob> elements formatted at once by :func:`_gen_probs`
+DISAGG_CHUNK_SIZE = 10000
+
+
+def _gen_probs(matrix, threshold, indent, float_format=None,
+               chunk_size=DISAGG_CHUNK_SIZE):
+    """
+    Generate the XML strings of the <prob> elements of a disaggregation
+    matrix, `chunk_size` elements at the time. The cells of each chunk are
+    selected and their indices computed with NumPy, then formatted with a
+    single printf-style operation. The indices and the values are converted
+    separately, so that the values keep the dtype of the matrix.
+
+    :param matrix:
+        An N-dimensional array.
+    :param threshold:
+        If not None, only the cells with a value greater than `threshold`
+        are generated (but at least one).
+    :param str indent:
+        The indentation of the <prob> elements.
+    :param float_format:
+        The format of the probabilities, or None for the default one.
+    """
+    if not matrix.size:  # nothing to write, not even the first cell
+        return
+    flat = matrix.ravel()
+    fmt = float_format or FLOAT_FORMATS['disagg_probs']
+    value_fmt, _ = printf_values(flat[:0], fmt)
+    line = '%s<prob index="%s" value="%s"/>\n' % (
+        indent.replace('%', '%%'), ','.join(['%d'] * matrix.ndim), value_fmt)
+    num_probs = 0
+    for start in xrange(0, len(flat), chunk_size):
+        values = flat[start:start + chunk_size]
+        if threshold is None:
+            positions = numpy.arange(start, start + len(values))
+        else:
+            selected = values > threshold
+            positions = start + numpy.flatnonzero(selected)
+            values = values[selected]
+        if not len(values):
+            continue
+        columns = [index.tolist() for index in
+                   numpy.unravel_index(positions, matrix.shape)]
+        columns.append(printf_values(values, fmt)[1])
+        cells = tuple(chain.from_iterable(izip(*columns)))
+        yield (line * len(values)) % cells
+        num_probs += len(values)
+    if not num_probs:  # the schema requires at least a <prob>
+        yield line % tuple(
+            [0] * matrix.ndim + printf_values(flat[:1], fmt)[1])
 
 
 class ScenarioGMFXMLWriter(object):
@@ -896,10 +1249,16 @@ class UHSXMLWriter(BaseCurveWriter):
                computed
         * periods: A list of SA (Spectral Acceleration) period values, sorted
                    ascending order
+
+    :param float_format:
+        The format of the periods and of the IMLs, see
+        :mod:`openquake.nrmllib.floatformat`; if None the default formats
+        are used.
     """
 
-    def __init__(self, dest, **metadata):
+    def __init__(self, dest, float_format=None, **metadata):
         super(UHSXMLWriter, self).__init__(dest, **metadata)
+        self.float_format = check_float_format(float_format)
 
         if self.metadata.get('poe') is None:
             raise ValueError('`poe` keyword arg is required')
@@ -940,8 +1299,8 @@ class UHSXMLWriter(BaseCurveWriter):
             _set_metadata(uh_spectra, self.metadata, _ATTR_MAP)
 
             periods_elem = etree.SubElement(uh_spectra, 'periods')
-            periods_elem.text = ' '.join([str(x)
-                                          for x in self.metadata['periods']])
+            periods_elem.text = format_output(
+                'periods', self.metadata['periods'], self.float_format)
 
             for uhs in data:
                 uhs_elem = etree.SubElement(uh_spectra, 'uhs')
@@ -949,13 +1308,29 @@ class UHSXMLWriter(BaseCurveWriter):
                 gml_pos = etree.SubElement(gml_point, '{%s}pos' % gml_ns)
                 gml_pos.text = '%s %s' % (uhs.location.x, uhs.location.y)
                 imls_elem = etree.SubElement(uhs_elem, 'IMLs')
-                imls_elem.text = ' '.join([str(x) for x in uhs.imls])
+                imls_elem.text = format_output(
+                    'imls', uhs.imls, self.float_format)
 
             fh.write(etree.tostring(
                 root, pretty_print=True, xml_declaration=True,
                 encoding='UTF-8'))
 
 
+def _dist_attribs(dist):
+    """
+    :param dist:
+        A nodal plane or hypocentral depth distribution, either as a list of
+        model objects or as a numpy structured array, as returned by the
+        :class:`openquake.nrmllib.hazard.parsers.SourceModelParser`.
+    :returns:
+        A list of `OrderedDict` of XML element attributes.
+    """
+    if isinstance(dist, numpy.ndarray):
+        return [OrderedDict((name, str(row[name]))
+                            for name in dist.dtype.names) for row in dist]
+    return [item.attrib for item in dist]
+
+
 class SourceModelXMLWriter(object):
     """
     Writes source model XML from a given
@@ -1052,11 +1427,11 @@ class SourceModelXMLWriter(object):
             :mod:`openquake.nrmllib.models`.
         """
         npd = etree.SubElement(elem, 'nodalPlaneDist')
-        for np in src.nodal_plane_dist:
+        for attrib in _dist_attribs(src.nodal_plane_dist):
             etree.SubElement(
                 npd,
                 'nodalPlane',
-                attrib=np.attrib
+                attrib=attrib
             )
 
     def _append_hdd(self, elem, src):
@@ -1071,11 +1446,11 @@ class SourceModelXMLWriter(object):
             :mod:`openquake.nrmllib.models`.
         """
         hdd = etree.SubElement(elem, 'hypoDepthDist')
-        for hd in src.hypo_depth_dist:
+        for attrib in _dist_attribs(src.hypo_depth_dist):
             etree.SubElement(
                 hdd,
                 'hypoDepth',
-                attrib=hd.attrib
+                attrib=attrib
             )
 
     def _append_area(self, src_model_elem, src):
@@ -1100,11 +1475,14 @@ class SourceModelXMLWriter(object):
         exterior = etree.SubElement(poly, '{%s}exterior' % GML_NS)
         linearring = etree.SubElement(exterior, '{%s}LinearRing' % GML_NS)
         poslist = etree.SubElement(linearring, '{%s}posList' % GML_NS)
-        coords = self._coords_from_geom(src.geometry.wkt)
-        # Since the polygon froms a closed ring, but is not usually modeled as
-        # such, remove the last vertex; in POLYGON WKT, we expect the last
-        # vertex should be a duplicate of the first.
-        coords.pop()
+        if src.geometry.coords is not None:
+            coords = src.geometry.coords.tolist()
+        else:
+            coords = self._coords_from_geom(src.geometry.wkt)
+            # Since the polygon froms a closed ring, but is not usually
+            # modeled as such, remove the last vertex; in POLYGON WKT, we
+            # expect the last vertex should be a duplicate of the first.
+            coords.pop()
         poslist.text = ' '.join([' '.join([str(x) for x in pt])
                                  for pt in coords])
         upp_seis_depth = etree.SubElement(area_geom_elem, 'upperSeismoDepth')
@@ -1141,7 +1519,10 @@ class SourceModelXMLWriter(object):
         pt_geom_elem = etree.SubElement(pt_elem, 'pointGeometry')
         point = etree.SubElement(pt_geom_elem, '{%s}Point' % GML_NS)
         pos = etree.SubElement(point, '{%s}pos' % GML_NS)
-        [coord] = self._coords_from_geom(src.geometry.wkt)
+        if src.geometry.coords is not None:
+            coord = src.geometry.coords.tolist()
+        else:
+            [coord] = self._coords_from_geom(src.geometry.wkt)
         pos.text = ' '.join([str(x) for x in coord])
         upp_seis_depth = etree.SubElement(pt_geom_elem, 'upperSeismoDepth')
         upp_seis_depth.text = str(src.geometry.upper_seismo_depth)
@@ -1157,7 +1538,7 @@ class SourceModelXMLWriter(object):
         self._append_npd(pt_elem, src)
         self._append_hdd(pt_elem, src)
 
-    def _append_fault_edge(self, edge_elem, wkt):
+    def _append_fault_edge(self, edge_elem, wkt, coords=None):
         """
         Append a <gml:LineString> geometry element to the given ``edge_elem``,
         where the geometry is defined by ``wkt``.
@@ -1166,10 +1547,16 @@ class SourceModelXMLWriter(object):
             An instance of :class:`lxml.etree._Element`.
         :param str wkt:
             A LINESTRING represented as WKT.
+        :param coords:
+            A numpy array with the coordinates of the LINESTRING; if given,
+            ``wkt`` is ignored.
         """
         linestring = etree.SubElement(edge_elem, '{%s}LineString' % GML_NS)
         poslist = etree.SubElement(linestring, '{%s}posList' % GML_NS)
-        coords = self._coords_from_geom(wkt)
+        if coords is not None:
+            coords = coords.tolist()
+        else:
+            coords = self._coords_from_geom(wkt)
         poslist.text = ' '.join([' '.join([str(x) for x in pt])
                                  for pt in coords])
 
@@ -1184,7 +1571,10 @@ class SourceModelXMLWriter(object):
             :class:`openquake.nrmllib.models.SimpleFaultGeometry`.
         """
         simple_geom = etree.SubElement(elem, 'simpleFaultGeometry')
-        self._append_fault_edge(simple_geom, geometry.wkt)
+        if geometry.coords is not None:
+            self._append_fault_edge(simple_geom, None, geometry.coords)
+        else:
+            self._append_fault_edge(simple_geom, geometry.wkt)
         dip = etree.SubElement(simple_geom, 'dip')
         dip.text = str(geometry.dip)
         upp_seis_depth = etree.SubElement(simple_geom, 'upperSeismoDepth')
@@ -1205,14 +1595,26 @@ class SourceModelXMLWriter(object):
         complex_geom = etree.SubElement(elem, 'complexFaultGeometry')
         # top edge
         top_edge = etree.SubElement(complex_geom, 'faultTopEdge')
-        self._append_fault_edge(top_edge, geometry.top_edge_wkt)
+        if geometry.top_edge_coords is not None:
+            self._append_fault_edge(top_edge, None, geometry.top_edge_coords)
+        else:
+            self._append_fault_edge(top_edge, geometry.top_edge_wkt)
         # intermedate edges
-        for edge in geometry.int_edges:
-            edge_elem = etree.SubElement(complex_geom, 'intermediateEdge')
-            self._append_fault_edge(edge_elem, edge)
+        if geometry.int_edges_coords is not None:
+            for edge in geometry.int_edges_coords:
+                edge_elem = etree.SubElement(complex_geom, 'intermediateEdge')
+                self._append_fault_edge(edge_elem, None, edge)
+        else:
+            for edge in geometry.int_edges:
+                edge_elem = etree.SubElement(complex_geom, 'intermediateEdge')
+                self._append_fault_edge(edge_elem, edge)
         # bottom edge
         bottom_edge = etree.SubElement(complex_geom, 'faultBottomEdge')
-        self._append_fault_edge(bottom_edge, geometry.bottom_edge_wkt)
+        if geometry.bottom_edge_coords is not None:
+            self._append_fault_edge(
+                bottom_edge, None, geometry.bottom_edge_coords)
+        else:
+            self._append_fault_edge(bottom_edge, geometry.bottom_edge_wkt)
 
     def _append_complex(self, src_model_elem, src):
         """
@@ -21,6 +21,41 @@ serializers.
 from collections import OrderedDict
 from collections import namedtuple
 
+from openquake.nrmllib import utils
+from openquake.nrmllib.node import with_slots
+
+
+class _LazyWKT(object):
+    """
+    Descriptor for the WKT attribute of a geometry which can be backed by a
+    numpy array of coordinates: in that case the WKT is built from the
+    array each time it is accessed. Setting the WKT discards the array.
+
+    :param str wkt_slot:
+        The slot where a WKT set explicitly is stored.
+    :param str coords_slot:
+        The slot containing the array of coordinates (or None).
+    :param to_wkt:
+        Function converting the array of coordinates into WKT.
+    """
+
+    def __init__(self, wkt_slot, coords_slot, to_wkt):
+        self.wkt_slot = wkt_slot
+        self.coords_slot = coords_slot
+        self.to_wkt = to_wkt
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        coords = getattr(obj, self.coords_slot)
+        if coords is None:
+            return getattr(obj, self.wkt_slot)
+        return self.to_wkt(coords)
+
+    def __set__(self, obj, wkt):
+        setattr(obj, self.wkt_slot, wkt)
+        setattr(obj, self.coords_slot, None)
+
 
 class SourceModel(object):
     """Simple container for source objects, plus metadata.
@@ -41,10 +76,12 @@ class SourceModel(object):
         return iter(self.sources)
 
 
+@with_slots
 class SeismicSource(object):
     """
     General base class for seismic sources.
     """
+    __slots__ = ('id', 'name', 'trt')
 
     def __init__(self, id=None, name=None, trt=None):
         self.id = id
@@ -63,6 +100,7 @@ class SeismicSource(object):
         ])
 
 
+@with_slots
 class PointSource(SeismicSource):
     """Basic object representation of a Point Source.
 
@@ -88,6 +126,8 @@ class PointSource(SeismicSource):
         `list` of :class:`HypocentralDepth` instances which make up a
         Hypocentral Depth Distribution.
     """
+    __slots__ = ('geometry', 'mag_scale_rel', 'rupt_aspect_ratio', 'mfd',
+                 'nodal_plane_dist', 'hypo_depth_dist')
 
     def __init__(self, id=None, name=None, trt=None, geometry=None,
                  mag_scale_rel=None, rupt_aspect_ratio=None, mfd=None,
@@ -101,6 +141,7 @@ class PointSource(SeismicSource):
         self.hypo_depth_dist = hypo_depth_dist
 
 
+@with_slots
 class PointGeometry(object):
     """Basic object representation of a geometry for a :class:`PointSource`.
 
@@ -110,15 +151,24 @@ class PointGeometry(object):
         Upper seismogenic depth.
     :param float lower_seismo_depth:
         Lower siesmogenic depth.
+    :param coords:
+        Optional numpy array with the longitude and latitude of the point;
+        if given, the WKT is built from it when accessed.
     """
+    __slots__ = ('_wkt', 'upper_seismo_depth', 'lower_seismo_depth',
+                 'coords')
+
+    wkt = _LazyWKT('_wkt', 'coords', utils.array_to_point_wkt)
 
     def __init__(self, wkt=None, upper_seismo_depth=None,
-                 lower_seismo_depth=None):
+                 lower_seismo_depth=None, coords=None):
         self.wkt = wkt
         self.upper_seismo_depth = upper_seismo_depth
         self.lower_seismo_depth = lower_seismo_depth
+        self.coords = coords
 
 
+@with_slots
 class AreaSource(PointSource):
     """Basic object representation of an Area Source.
 
@@ -144,8 +194,10 @@ class AreaSource(PointSource):
         `list` of :class:`HypocentralDepth` instances which make up a
         Hypocentral Depth Distribution.
     """
+    __slots__ = ()
 
 
+@with_slots
 class AreaGeometry(PointGeometry):
     """Basic object representation of a geometry for a :class:`PointSource`.
 
@@ -155,9 +207,17 @@ class AreaGeometry(PointGeometry):
         Upper seismogenic depth.
     :param float lower_seismo_depth:
         Lower siesmogenic depth.
+    :param coords:
+        Optional numpy array of shape (N, 2) with the longitudes and
+        latitudes of the vertices of the polygon, without repeating the
+        first one; if given, the WKT is built from it when accessed.
     """
+    __slots__ = ()
 
+    wkt = _LazyWKT('_wkt', 'coords', utils.array_to_poly_wkt)
 
+
+@with_slots
 class SimpleFaultSource(SeismicSource):
     """Basic object representation of a Simple Fault Source.
 
@@ -179,6 +239,8 @@ class SimpleFaultSource(SeismicSource):
     :param float rake:
         Rake angle.
     """
+    __slots__ = ('geometry', 'mag_scale_rel', 'rupt_aspect_ratio', 'mfd',
+                 'rake')
 
     def __init__(self, id=None, name=None, trt=None, geometry=None,
                  mag_scale_rel=None, rupt_aspect_ratio=None, mfd=None,
@@ -191,6 +253,7 @@ class SimpleFaultSource(SeismicSource):
         self.rake = rake
 
 
+@with_slots
 class SimpleFaultGeometry(object):
     """Basic object representation of a geometry for a
     :class:`SimpleFaultSource`.
@@ -201,14 +264,24 @@ class SimpleFaultGeometry(object):
         Upper seismogenic depth.
     :param float lower_seismo_depth:
         Lower siesmogenic depth.
+    :param coords:
+        Optional numpy array of shape (N, 2) with the longitudes and
+        latitudes of the fault trace; if given, the WKT is built from it
+        when accessed.
     """
+    __slots__ = ('_wkt', 'dip', 'upper_seismo_depth', 'lower_seismo_depth',
+                 'coords')
+
+    wkt = _LazyWKT('_wkt', 'coords', utils.array_to_linestr_wkt)
 
     def __init__(self, id=None, name=None, wkt=None, dip=None,
-                 upper_seismo_depth=None, lower_seismo_depth=None):
+                 upper_seismo_depth=None, lower_seismo_depth=None,
+                 coords=None):
         self.wkt = wkt
         self.dip = dip
         self.upper_seismo_depth = upper_seismo_depth
         self.lower_seismo_depth = lower_seismo_depth
+        self.coords = coords
 
     # a string representation useful for tests and debugging
     def __str__(self):
@@ -217,9 +290,10 @@ wkt=%(wkt)s,
 dip=%(dip)s,
 upper_seismo_depth=%(upper_seismo_depth)s,
 lower_seismo_depth=%(lower_seismo_depth)s)
-''' % vars(self)
+''' % dict(self.__getstate__(), wkt=self.wkt)
 
 
+@with_slots
 class ComplexFaultSource(SimpleFaultSource):
     """Basic object representation of a Complex Fault Source.
 
@@ -241,8 +315,10 @@ class ComplexFaultSource(SimpleFaultSource):
     :param float rake:
         Rake angle.
     """
+    __slots__ = ()
 
 
+@with_slots
 class ComplexFaultGeometry(object):
     """Basic object representation of a geometry for a
     :class:`ComplexFaultSource`.
@@ -257,13 +333,35 @@ class ComplexFaultGeometry(object):
         fault edge (each is a LINESTRING).
 
         This parameter is optional.
+    :param top_edge_coords, bottom_edge_coords:
+        Optional numpy arrays of shape (N, 3) with the longitudes, latitudes
+        and depths of the top and bottom edges; if given, the corresponding
+        WKT is built from them when accessed.
+    :param int_edges_coords:
+        Optional `list` of numpy arrays of shape (N, 3), one for each
+        intermediate edge; if given, `int_edges` is built from it when
+        accessed.
     """
+    __slots__ = ('_top_edge_wkt', '_bottom_edge_wkt', '_int_edges',
+                 'top_edge_coords', 'bottom_edge_coords', 'int_edges_coords')
+
+    top_edge_wkt = _LazyWKT(
+        '_top_edge_wkt', 'top_edge_coords', utils.array_to_linestr_wkt)
+    bottom_edge_wkt = _LazyWKT(
+        '_bottom_edge_wkt', 'bottom_edge_coords', utils.array_to_linestr_wkt)
+    int_edges = _LazyWKT(
+        '_int_edges', 'int_edges_coords',
+        lambda edges: [utils.array_to_linestr_wkt(edge) for edge in edges])
 
     def __init__(self, top_edge_wkt=None, bottom_edge_wkt=None,
-                 int_edges=None):
+                 int_edges=None, top_edge_coords=None,
+                 bottom_edge_coords=None, int_edges_coords=None):
         self.top_edge_wkt = top_edge_wkt
         self.bottom_edge_wkt = bottom_edge_wkt
         self.int_edges = int_edges if int_edges is not None else []
+        self.top_edge_coords = top_edge_coords
+        self.bottom_edge_coords = bottom_edge_coords
+        self.int_edges_coords = int_edges_coords
 
     # a string representation useful for tests and debugging
     def __str__(self):
@@ -271,9 +369,11 @@ class ComplexFaultGeometry(object):
 top_edge_wkt=%(top_edge_wkt)s,
 bottom_edge_wkt=%(bottom_edge_wkt)s,
 int_edges=%(int_edges)s
-''' % vars(self)
+''' % dict(top_edge_wkt=self.top_edge_wkt,
+           bottom_edge_wkt=self.bottom_edge_wkt, int_edges=self.int_edges)
 
 
+@with_slots
 class IncrementalMFD(object):
     """Basic object representation of an Incremental Magnitude Frequency
     Distribtion.
@@ -285,6 +385,7 @@ class IncrementalMFD(object):
     :param list occur_rates:
         `list` of occurrence rates (`float` values).
     """
+    __slots__ = ('min_mag', 'bin_width', 'occur_rates')
 
     def __init__(self, min_mag=None, bin_width=None, occur_rates=None):
         self.min_mag = min_mag
@@ -302,6 +403,7 @@ class IncrementalMFD(object):
         ])
 
 
+@with_slots
 class TGRMFD(object):
     """Basic object representation of a Truncated Gutenberg-Richter Magnitude
     Frequency Distribution.
@@ -316,6 +418,7 @@ class TGRMFD(object):
     :param float max_mag:
         The highest possible magnitude for this MFD.
     """
+    __slots__ = ('a_val', 'b_val', 'min_mag', 'max_mag')
 
     def __init__(self, a_val=None, b_val=None, min_mag=None, max_mag=None):
         self.a_val = a_val
@@ -336,6 +439,7 @@ class TGRMFD(object):
         ])
 
 
+@with_slots
 class NodalPlane(object):
     """Basic object representation of a single node in a Nodal Plane
     Distribution.
@@ -350,6 +454,7 @@ class NodalPlane(object):
     :param float rake:
         Rake angle.
     """
+    __slots__ = ('probability', 'strike', 'dip', 'rake')
 
     def __init__(self, probability=None, strike=None, dip=None, rake=None):
         self.probability = probability
@@ -370,6 +475,7 @@ class NodalPlane(object):
         ])
 
 
+@with_slots
 class HypocentralDepth(object):
     """Basic object representation of a single node in a Hypocentral Depth
     Distribution.
@@ -380,6 +486,7 @@ class HypocentralDepth(object):
     :param float depth:
         Depth (in km).
     """
+    __slots__ = ('probability', 'depth')
 
     def __init__(self, probability=None, depth=None):
         self.probability = probability
@@ -396,6 +503,7 @@ class HypocentralDepth(object):
         ])
 
 
+@with_slots
 class SiteModel(object):
     """Basic object representation of a single node in a model of site-specific
     parameters.
@@ -411,15 +519,22 @@ class SiteModel(object):
         Depth to shear wave velocity of 2.5 km/s. Units km.
     :param wkt:
         Well-known text (POINT) represeting the location of these parameters.
+    :param coords:
+        Optional numpy array with the longitude and latitude of the site;
+        if given, the WKT is built from it when accessed.
     """
+    __slots__ = ('vs30', 'vs30_type', 'z1pt0', 'z2pt5', '_wkt', 'coords')
+
+    wkt = _LazyWKT('_wkt', 'coords', utils.array_to_point_wkt)
 
     def __init__(self, vs30=None, vs30_type=None, z1pt0=None, z2pt5=None,
-                 wkt=None):
+                 wkt=None, coords=None):
         self.vs30 = vs30
         self.vs30_type = vs30_type
         self.z1pt0 = z1pt0
         self.z2pt5 = z2pt5
         self.wkt = wkt
+        self.coords = coords
 
 
 class SimpleFaultRuptureModel(object):
@@ -462,6 +577,7 @@ class ComplexFaultRuptureModel(SimpleFaultRuptureModel):
     """
 
 
+@with_slots
 class CharacteristicSource(SeismicSource):
     """
     Basic object representation of a characteristic fault source.
@@ -481,6 +597,8 @@ class CharacteristicSource(SeismicSource):
         A :class:`SimpleFaultGeometry`, :class:`ComplexFaultGeometry`, or a
         list of :class:`PlanarSurface` objects.
     """
+    __slots__ = ('mfd', 'rake', 'surface')
+
     def __init__(self, id=None, name=None, trt=None, mfd=None, rake=None,
                  surface=None):
         super(CharacteristicSource, self).__init__(id=id, name=name, trt=trt)
@@ -489,6 +607,7 @@ class CharacteristicSource(SeismicSource):
         self.surface = surface
 
 
+@with_slots
 class PlanarSurface(object):
     """
     :param strike:
@@ -499,6 +618,9 @@ class PlanarSurface(object):
         Corner points of the planar surface, represented by :class:`Point`
         objects.
     """
+    __slots__ = ('strike', 'dip', 'top_left', 'top_right', 'bottom_left',
+                 'bottom_right')
+
     def __init__(self, strike=None, dip=None, top_left=None, top_right=None,
                  bottom_left=None, bottom_right=None):
         self.strike = strike
@@ -509,6 +631,7 @@ class PlanarSurface(object):
         self.bottom_right = bottom_right
 
 
+@with_slots
 class Point(object):
     """
     A simple representation of longitude, latitude, and depth.
@@ -520,6 +643,7 @@ class Point(object):
     :param depth:
         Depth
     """
+    __slots__ = ('longitude', 'latitude', 'depth')
 
     def __init__(self, longitude=None, latitude=None, depth=None):
         self.longitude = longitude
@@ -554,3 +678,165 @@ class HazardCurveModel(object):
 
 HazardCurveData = namedtuple('HazardCurveData', 'location poes')
 Location = namedtuple('Location', 'x y')
+
+
+class DisaggModel(object):
+    """
+    Simple container for disaggregation matrices. The accepted arguments
+    are::
+
+        * investigation_time
+        * imt
+        * lon
+        * lat
+        * statistics
+        * quantile_value
+        * smlt_path
+        * gsimlt_path
+        * sa_period
+        * sa_damping
+        * mag_bin_edges, dist_bin_edges, lon_bin_edges, lat_bin_edges,
+          eps_bin_edges (optional), arrays of floats
+        * tectonic_region_types (optional), a list of strings
+        * data_iter (optional), an iterable returning
+          :class:`DisaggMatrix` objects.
+    """
+
+    def __init__(self, **metadata):
+        self._data_iter = metadata.pop('data_iter', ())
+        self.metadata = metadata
+        vars(self).update(metadata)
+
+    def __iter__(self):
+        return self._data_iter
+
+
+DisaggMatrix = namedtuple('DisaggMatrix', 'matrix dim_labels poe iml')
+GMFData = namedtuple('GMFData', 'imt rupture_id lons lats gmvs')
+
+
+class SESCollection(object):
+    """
+    Simple container for a collection of stochastic event sets.
+
+    :param str sm_lt_path:
+        Source model logic tree branch identifier of the realization which
+        produced the collection.
+    :param data_iter:
+        An iterable returning :class:`SES` objects.
+    """
+
+    def __init__(self, sm_lt_path, data_iter=()):
+        self.sm_lt_path = sm_lt_path
+        self._data_iter = data_iter
+
+    def __iter__(self):
+        return iter(self._data_iter)
+
+
+class SES(object):
+    """
+    Simple container for a stochastic event set.
+
+    :param int ordinal:
+        The ordinal of the event set in the collection.
+    :param float investigation_time:
+        Investigation time (in years) of the event set.
+    :param data_iter:
+        An iterable returning :class:`SESRupture` objects.
+    """
+
+    def __init__(self, ordinal, investigation_time, data_iter=()):
+        self.ordinal = ordinal
+        self.investigation_time = investigation_time
+        self._data_iter = data_iter
+
+    def __iter__(self):
+        return iter(self._data_iter)
+
+
+class _LazyGeometry(object):
+    """
+    Descriptor for an attribute describing the geometry of a
+    :class:`SESRupture`. All the geometry attributes are decoded together,
+    by calling the `load_geometry` function of the rupture, the first time
+    one of them is accessed.
+
+    :param str name:
+        The name of the attribute.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        if obj._geometry is None:
+            obj._geometry = obj._load_geometry()
+            obj._load_geometry = None
+        return obj._geometry[self.name]
+
+
+class SESRupture(object):
+    """
+    A rupture of a stochastic event set, with the attributes expected by
+    :class:`openquake.nrmllib.hazard.writers.SESXMLWriter`.
+
+    The geometry of the rupture is described by the attributes in
+    `GEOMETRY_ATTRS`: the 2D arrays `lons`, `lats` and `depths` of the mesh
+    if the rupture is from a fault source, the 1D arrays of the corners of
+    the surfaces if it is a multi surface, otherwise the corners of the
+    planar surface as (lon, lat, depth) triples; the other attributes are
+    None. The geometry is loaded only when accessed, so that the ruptures
+    can be filtered by their scalar attributes without decoding it.
+
+    :param str tag:
+        The identifier of the rupture.
+    :param float magnitude:
+        The magnitude of the rupture.
+    :param float strike, dip, rake:
+        The angles of the rupture.
+    :param str tectonic_region_type:
+        The tectonic region type of the rupture.
+    :param bool is_from_fault_source:
+        True if the geometry is a mesh.
+    :param bool is_multi_surface:
+        True if the geometry is made of several planar surfaces.
+    :param load_geometry:
+        A function returning a dictionary with the values of the
+        attributes in `GEOMETRY_ATTRS`.
+    :param int seed:
+        The seed used to generate the rupture, or None if unknown.
+    """
+    GEOMETRY_ATTRS = ('lons', 'lats', 'depths',
+                      'top_left_corner', 'top_right_corner',
+                      'bottom_left_corner', 'bottom_right_corner')
+
+    lons = _LazyGeometry('lons')
+    lats = _LazyGeometry('lats')
+    depths = _LazyGeometry('depths')
+    top_left_corner = _LazyGeometry('top_left_corner')
+    top_right_corner = _LazyGeometry('top_right_corner')
+    bottom_left_corner = _LazyGeometry('bottom_left_corner')
+    bottom_right_corner = _LazyGeometry('bottom_right_corner')
+
+    def __init__(self, tag, magnitude, strike, dip, rake,
+                 tectonic_region_type, is_from_fault_source,
+                 is_multi_surface, load_geometry, seed=None):
+        self.tag = tag
+        self.magnitude = magnitude
+        self.strike = strike
+        self.dip = dip
+        self.rake = rake
+        self.tectonic_region_type = tectonic_region_type
+        self.is_from_fault_source = is_from_fault_source
+        self.is_multi_surface = is_multi_surface
+        self.seed = seed
+        self._load_geometry = load_geometry
+        self._geometry = None
+
+    @property
+    def rupture(self):
+        # the writer reads the attributes of the rupture from `.rupture`
+        return self
@@ -203,6 +203,8 @@ import cStringIO
 import ConfigParser
 from contextlib import contextmanager
 
+import numpy
+
 from openquake import nrmllib
 from openquake.nrmllib.writers import StreamingXMLWriter
 try:
@@ -211,25 +213,47 @@ except ImportError:
     from xml import etree
 
 
+def _equal(source, target):
+    """
+    Compare two slot values, which can be numpy arrays or lists of arrays.
+    """
+    try:
+        return bool(source == target)
+    except ValueError:  # the truth value of an array is ambiguous
+        if isinstance(source, list) and isinstance(target, list):
+            return len(source) == len(target) and all(
+                _equal(s, t) for s, t in zip(source, target))
+        return numpy.array_equal(source, target)
+
+
 ## this is duplicated from hazardlib to avoid a dependency
 def with_slots(cls):
     """
     Decorator for a class with __slots__. It automatically defines
-    the methods __eq__, __ne__, assert_equal, __getstate__ and __setstate__
+    the methods __eq__, __ne__, assert_equal, __getstate__ and __setstate__.
+    The slots of the base classes are taken into account, so that the
+    decorator can be used on class hierarchies.
     """
+    def _slots(klass):
+        return [slot for base in reversed(klass.__mro__)
+                for slot in base.__dict__.get('__slots__', ())]
+
     def _compare(self, other):
-        for slot in self.__class__.__slots__:
+        for slot in _slots(self.__class__):
             source = getattr(self, slot)
             target = getattr(other, slot)
-            yield slot, source, target, source == target
+            yield slot, source, target, _equal(source, target)
 
     def __eq__(self, other):
-        """True if self and other have the same slots"""
+        """True if self and other have the same class and slots"""
+        if other.__class__ is not self.__class__:
+            return NotImplemented
         return all(eq for slot, source, target, eq in _compare(self, other))
 
     def __ne__(self, other):
-        """True if self and other have different slots"""
-        return not self.__eq__(other)
+        """True if self and other have a different class or slots"""
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
 
     def assert_equal(self, other):
         """Check if self and other have the same slots"""
@@ -241,11 +265,11 @@ def with_slots(cls):
     def __getstate__(self):
         """Return a dictionary with the slots"""
         return dict((slot, getattr(self, slot))
-                    for slot in self.__class__.__slots__)
+                    for slot in _slots(self.__class__))
 
     def __setstate__(self, state):
         """Set the slots"""
-        for slot in self.__class__.__slots__:
+        for slot in _slots(self.__class__):
             setattr(self, slot, state[slot])
 
     cls.__slots__  # raise an AttributeError for missing slots
@@ -18,6 +18,8 @@
 Module containing parsers for risk input artifacts.
 """
 
+import numpy
+
 from lxml import etree
 from collections import namedtuple
 
@@ -72,11 +74,18 @@ class ExposureModelParser(object):
 
     :param source:
         Filename or file-like object containing the XML data.
+    :param validation:
+        'eager' (the default) validates the whole document at instantiation
+        time; 'streaming' validates it while iterating, so that the file is
+        read only once (an :class:`openquake.nrmllib.InvalidFile` error may
+        then be raised during the iteration); None skips the validation.
     """
 
-    def __init__(self, source):
+    def __init__(self, source, validation='eager'):
         self._source = source
-        openquake.nrmllib.assert_valid(self._source)
+        self._validation = openquake.nrmllib.check_validation(validation)
+        if validation == 'eager':
+            openquake.nrmllib.assert_valid(self._source)
 
         # contains the data of the node currently parsed.
         self._meta = None
@@ -85,12 +94,55 @@ class ExposureModelParser(object):
         """
         Parse the document iteratively.
         """
+        for element in self._asset_elements():
+            yield self._to_asset_data(element)
 
-        schema = etree.XMLSchema(etree.parse(
-            openquake.nrmllib.nrml_schema_file()))
-
-        for event, element in etree.iterparse(
-                self._source, events=('start', 'end'), schema=schema):
+    def iter_chunks(self, size=1000):
+        """
+        Parse the document iteratively and yield lists of (at most)
+        `size` `AssetData` instances. The memory occupation does not
+        depend on the size of the document, since the parsed elements
+        are discarded as soon as they are converted.
+        """
+        chunk = []
+        for element in self._asset_elements():
+            chunk.append(self._to_asset_data(element))
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _asset_elements(self):
+        """
+        Generate the <asset> elements, by setting the exposure metadata
+        as soon as they are read; the document is validated while parsing
+        only in 'streaming' mode, since in 'eager' mode it has been
+        validated already.
+        """
+        if self._validation == 'streaming':
+            schema = openquake.nrmllib.get_schema()
+        else:
+            schema = None
+
+        try:
+            for element in self._parse(schema):
+                yield element
+        except etree.XMLSyntaxError as e:
+            raise openquake.nrmllib.InvalidFile(
+                '%s:%s' % (openquake.nrmllib.source_name(self._source), e))
+
+    def _parse(self, schema):
+        """
+        Parse the document with the given schema (or None) and yield
+        the <asset> elements.
+        """
+        tree = etree.iterparse(
+            self._source, events=('start', 'end'), schema=schema)
+        # the <asset> elements and their previous siblings (assets and
+        # possibly comments) are discarded as soon as they are processed
+        for event, element in openquake.nrmllib.iter_pruned(
+                tree, ['%sasset' % NRML]):
 
             # exposure metadata
             if event == 'start' and element.tag == '%sexposureModel' % NRML:
@@ -131,31 +183,183 @@ class ExposureModelParser(object):
 
             # asset data
             elif event == 'end' and element.tag == '%sasset' % NRML:
-                if element.get('area') is not None:
-                    area = float(element.get('area'))
-                else:
-                    area = None
+                yield element
 
-                if element.get('number') is not None:
-                    number = float(element.get('number'))
-                else:
-                    number = None
+    def _to_asset_data(self, element):
+        """
+        Convert an <asset> element into an `AssetData` instance.
+        """
+        if element.get('area') is not None:
+            area = float(element.get('area'))
+        else:
+            area = None
+
+        if element.get('number') is not None:
+            number = float(element.get('number'))
+        else:
+            number = None
+
+        point_elem = element.find('%slocation' % NRML)
+
+        return AssetData(
+            exposure_metadata=self._meta,
+            site=Site(float(point_elem.get("lon")),
+                      float(point_elem.get("lat"))),
+            asset_ref=element.get('id'),
+            taxonomy=element.get('taxonomy'),
+            area=area,
+            number=number,
+            costs=_to_costs(element),
+            occupancy=_to_occupancy(element))
+
+    def to_arrays(self, chunk_size=10000):
+        """
+        Parse the whole document into a structured numpy array, without
+        instantiating `AssetData` objects. The array is built in chunks
+        of `chunk_size` assets and has the following fields:
 
-                point_elem = element.find('%slocation' % NRML)
+        * asset_ref: the asset ID
+        * taxonomy: an index in the taxonomies table
+        * lon, lat, number, area
+        * value-<cost type>, retrofitted-<cost type>,
+          deductible-<cost type>, limit-<cost type> for each cost type
+        * occupants-<period> for each occupancy period
 
-                site_data = AssetData(
-                    exposure_metadata=self._meta,
-                    site=Site(float(point_elem.get("lon")),
-                              float(point_elem.get("lat"))),
-                    asset_ref=element.get('id'),
-                    taxonomy=element.get('taxonomy'),
-                    area=area,
-                    number=number,
-                    costs=_to_costs(element),
-                    occupancy=_to_occupancy(element))
-                del element
+        Missing values are stored as NaN.
 
-                yield site_data
+        :returns: an `ExposureArrays` instance
+        """
+        taxonomies = {}  # taxonomy -> index
+        columns = _ColumnChunks(chunk_size)
+        for element in self._asset_elements():
+            if not columns.nrows:  # first asset, the cost types are known
+                for cost_type in self._meta.conversions.cost_types:
+                    for field in _COST_FIELDS:
+                        columns.add_column('%s-%s' % (field, cost_type.name))
+            taxonomy = element.get('taxonomy')
+            try:
+                taxonomy_idx = taxonomies[taxonomy]
+            except KeyError:
+                taxonomy_idx = taxonomies[taxonomy] = len(taxonomies)
+            point_elem = element.find('%slocation' % NRML)
+            row = columns.new_row(element.get('id'))
+            row['taxonomy'] = taxonomy_idx
+            row['lon'] = point_elem.get('lon')
+            row['lat'] = point_elem.get('lat')
+            for name in ('number', 'area'):
+                value = element.get(name)
+                if value is not None:
+                    row[name] = value
+            for otag in element.findall('.//%scost' % NRML):
+                cost_type = otag.get('type')
+                for field, attr in zip(_COST_FIELDS, _COST_ATTRS):
+                    value = otag.get(attr)
+                    if value is not None:
+                        row['%s-%s' % (field, cost_type)] = value
+            for otag in element.findall('.//%soccupancy' % NRML):
+                row['occupants-%s' % otag.get('period')] = otag.get(
+                    'occupants')
+
+        cost_types = self._meta.conversions.cost_types if self._meta else []
+        periods = [name[len('occupants-'):] for name in columns.names
+                   if name.startswith('occupants-')]
+        return ExposureArrays(
+            exposure_metadata=self._meta,
+            assets=columns.to_array(),
+            taxonomies=sorted(taxonomies, key=taxonomies.get),
+            cost_types=cost_types,
+            occupancy_periods=periods)
+
+
+_COST_FIELDS = ('value', 'retrofitted', 'deductible', 'limit')
+_COST_ATTRS = ('value', 'retrofitted', 'deductible', 'insuranceLimit')
+
+ExposureArrays = namedtuple(
+    "ExposureArrays",
+    "exposure_metadata assets taxonomies cost_types occupancy_periods")
+
+
+class _ColumnChunks(object):
+    """
+    Accumulate the columns of a structured array in chunks of preallocated
+    numpy arrays. Columns can be added at any moment: the rows read
+    before the column was known are filled with NaN.
+    """
+    _FIXED = [('taxonomy', numpy.uint32), ('lon', numpy.float64),
+              ('lat', numpy.float64), ('number', numpy.float64),
+              ('area', numpy.float64)]
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.names = []  # names of the variable columns
+        self.chunks = []  # list of pairs (asset_refs, {name: array})
+        self.nrows = 0
+        self._refs = []
+        self._arrays = {}
+
+    def _new_array(self, dtype=numpy.float64):
+        array = numpy.empty(self.chunk_size, dtype)
+        if dtype is numpy.float64:
+            array.fill(numpy.nan)
+        return array
+
+    def add_column(self, name):
+        """Register a new float column"""
+        self.names.append(name)
+        if self._refs:  # a chunk is open
+            self._arrays[name] = self._new_array()
+
+    def new_row(self, asset_ref):
+        """
+        Start a new row and return it as a dictionary-like object
+        (assigned strings are converted to the column type)
+        """
+        if len(self._refs) == self.chunk_size:
+            self._flush()
+        if not self._refs:  # open a new chunk
+            for name, dtype in self._FIXED:
+                self._arrays[name] = self._new_array(dtype)
+            for name in self.names:
+                self._arrays[name] = self._new_array()
+        self._refs.append(asset_ref)
+        self.nrows += 1
+        return self
+
+    def __setitem__(self, name, value):
+        if name not in self._arrays:
+            self.add_column(name)
+        self._arrays[name][len(self._refs) - 1] = value
+
+    def _flush(self):
+        """Store the current chunk and start a new one"""
+        n = len(self._refs)
+        if n:
+            self.chunks.append((numpy.array(self._refs), dict(
+                (name, array[:n]) for name, array in self._arrays.items())))
+        self._refs = []
+        self._arrays = {}
+
+    def to_array(self):
+        """Build the final structured array from the chunks"""
+        self._flush()
+        if not self.chunks:
+            refs = numpy.array([], dtype=str)
+        else:
+            refs = numpy.concatenate([refs for refs, _ in self.chunks])
+        dtype = [('asset_ref', refs.dtype)] + self._FIXED + [
+            (name, numpy.float64) for name in self.names]
+        array = numpy.zeros(len(refs), dtype)
+        array['asset_ref'] = refs
+        start = 0
+        for chunk_refs, arrays in self.chunks:
+            stop = start + len(chunk_refs)
+            for name, _ in dtype[1:]:
+                if name in arrays:
+                    array[name][start:stop] = arrays[name]
+                else:  # column introduced after this chunk
+                    array[name][start:stop] = numpy.nan
+            start = stop
+        return array
 
 
 def _to_occupancy(element):
@@ -203,6 +407,17 @@ def _to_costs(element):
     return costs
 
 
+def _parse_tree(source, validation):
+    """
+    Parse the full document in a single pass, validating it unless
+    `validation` is None.
+    """
+    if openquake.nrmllib.check_validation(validation) is None:
+        return etree.parse(source, openquake.nrmllib.COMPATPARSER)
+    # assert_valid returns the validated tree, no need to parse it again
+    return openquake.nrmllib.assert_valid(source)
+
+
 class VulnerabilityModelParser(object):
     """
     Vulnerability model parser. This class is implemented as a generator.
@@ -212,13 +427,14 @@ class VulnerabilityModelParser(object):
 
     :param source:
         Filename or file-like object containing the XML data.
+    :param validation:
+        'eager' or 'streaming' (equivalent here, the document is
+        validated while it is parsed) or None to skip the validation.
     """
 
-    def __init__(self, source):
+    def __init__(self, source, validation='eager'):
         self._source = source
-        openquake.nrmllib.assert_valid(self._source)
-
-        self._vulnerability_model = etree.parse(self._source).getroot()
+        self._vulnerability_model = _parse_tree(source, validation).getroot()
 
     def __iter__(self):
         """
@@ -303,12 +519,14 @@ class FragilityModelParser(object):
 
     :param source:
         Filename or file-like object containing the XML data.
+    :param validation:
+        'eager' or 'streaming' (equivalent here, the document is
+        validated while it is parsed) or None to skip the validation.
     """
 
-    def __init__(self, source):
+    def __init__(self, source, validation='eager'):
         self._source = source
-        openquake.nrmllib.assert_valid(self._source)
-        self._fragility_model = etree.parse(self._source).getroot()
+        self._fragility_model = _parse_tree(source, validation).getroot()
         self.limit_states = None
 
     def __iter__(self):
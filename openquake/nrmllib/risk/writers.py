@@ -19,13 +19,13 @@ Module containing writers for risk output artifacts.
 """
 
 import itertools
-import json
 
 from lxml import etree
 
 import openquake.nrmllib
 
-from openquake.nrmllib import NRMLFile
+from openquake.nrmllib import NRMLFile, writers
+from openquake.nrmllib.floatformat import format_output, check_float_format
 
 
 class LossCurveXMLWriter(object):
@@ -61,12 +61,16 @@ class LossCurveXMLWriter(object):
         Attribute describing how the value of the assets has been measured.
     :param bool insured:
         True if it is an insured loss curve
+    :param str float_format:
+        The format of all the floats of the curves, see
+        :mod:`openquake.nrmllib.floatformat`; if None the default formats
+        are used.
     """
 
     def __init__(self, dest, investigation_time, loss_type,
                  source_model_tree_path=None, gsim_tree_path=None,
                  statistics=None, quantile_value=None, unit=None,
-                 insured=False):
+                 insured=False, float_format=None):
 
         validate_hazard_metadata(gsim_tree_path, source_model_tree_path,
                                  statistics, quantile_value)
@@ -80,6 +84,7 @@ class LossCurveXMLWriter(object):
         self._loss_type = loss_type
         self._source_model_tree_path = source_model_tree_path
         self._insured = insured
+        self._float_format = check_float_format(float_format)
 
         self._loss_curves = None
 
@@ -133,23 +138,28 @@ class LossCurveXMLWriter(object):
                 loss_curve.set("assetRef", curve.asset_ref)
 
                 poes = etree.SubElement(loss_curve, "poEs")
-                poes.text = " ".join([str(p) for p in curve.poes])
+                poes.text = format_output(
+                    'poes', curve.poes, self._float_format)
 
                 losses = etree.SubElement(loss_curve, "losses")
-                losses.text = " ".join([str(p) for p in curve.losses])
+                losses.text = format_output(
+                    'losses', curve.losses, self._float_format)
 
                 if curve.loss_ratios is not None:
                     loss_ratios = etree.SubElement(loss_curve, "lossRatios")
 
-                    loss_ratios.text = " ".join(
-                        [str(p) for p in curve.loss_ratios])
+                    loss_ratios.text = format_output(
+                        'loss_ratios', curve.loss_ratios, self._float_format)
 
                 losses = etree.SubElement(loss_curve, "averageLoss")
-                losses.text = "%.4e" % curve.average_loss
+                losses.text = format_output(
+                    'average_losses', [curve.average_loss], self._float_format)
 
                 if curve.stddev_loss is not None:
                     losses = etree.SubElement(loss_curve, "stdDevLoss")
-                    losses.text = "%.4e" % curve.stddev_loss
+                    losses.text = format_output(
+                        'average_losses', [curve.stddev_loss],
+                        self._float_format)
 
             output.write(etree.tostring(
                 root, pretty_print=True, xml_declaration=True,
@@ -217,11 +227,16 @@ class AggregateLossCurveXMLWriter(object):
     :param float quantile_value:
         When serializing loss curves produced from quantile hazard inputs,
         it describes the quantile value.
+    :param str float_format:
+        The format of all the floats of the curve, see
+        :mod:`openquake.nrmllib.floatformat`; if None the default formats
+        are used.
     """
 
     def __init__(self, dest, investigation_time, loss_type,
                  source_model_tree_path=None, gsim_tree_path=None,
-                 statistics=None, quantile_value=None, unit=None):
+                 statistics=None, quantile_value=None, unit=None,
+                 float_format=None):
 
         validate_hazard_metadata(gsim_tree_path, source_model_tree_path,
                                  statistics, quantile_value)
@@ -234,6 +249,7 @@ class AggregateLossCurveXMLWriter(object):
         self._investigation_time = investigation_time
         self._loss_type = loss_type
         self._source_model_tree_path = source_model_tree_path
+        self._float_format = check_float_format(float_format)
 
     def serialize(self, data):
         """
@@ -291,17 +307,20 @@ class AggregateLossCurveXMLWriter(object):
             aggregate_loss_curve.set("lossType", self._loss_type)
 
             poes = etree.SubElement(aggregate_loss_curve, "poEs")
-            poes.text = " ".join([str(p) for p in data.poes])
+            poes.text = format_output('poes', data.poes, self._float_format)
 
             losses = etree.SubElement(aggregate_loss_curve, "losses")
-            losses.text = " ".join(["%.4f" % p for p in data.losses])
+            losses.text = format_output(
+                'aggregate_losses', data.losses, self._float_format)
 
             losses = etree.SubElement(aggregate_loss_curve, "averageLoss")
-            losses.text = "%.4e" % data.average_loss
+            losses.text = format_output(
+                'average_losses', [data.average_loss], self._float_format)
 
             if data.stddev_loss is not None:
                 losses = etree.SubElement(aggregate_loss_curve, "stdDevLoss")
-                losses.text = "%.4e" % data.stddev_loss
+                losses.text = format_output(
+                    'average_losses', [data.stddev_loss], self._float_format)
 
             output.write(etree.tostring(
                 root, pretty_print=True, xml_declaration=True,
@@ -474,26 +493,56 @@ class LossMapGeoJSONWriter(LossMapWriter):
     FeatureCollection artifacts with additional loss map metadata.
 
     See :class:`LossMapWriter` for information about constructor parameters.
+
+    :param bool compact:
+        If True, the GeoJSON is written without indentation.
+    :param str float_format:
+        If given, a format string like '%.5E' used to round the floats;
+        see :class:`openquake.nrmllib.writers.StreamingGeoJSONWriter`.
     """
 
+    def __init__(self, dest, investigation_time, poe, loss_type,
+                 source_model_tree_path=None, gsim_tree_path=None,
+                 statistics=None, quantile_value=None, unit=None,
+                 loss_category=None, compact=False, float_format=None):
+        super(LossMapGeoJSONWriter, self).__init__(
+            dest, investigation_time, poe, loss_type,
+            source_model_tree_path, gsim_tree_path, statistics,
+            quantile_value, unit, loss_category)
+        self._compact = compact
+        self._float_format = writers.check_geojson_float_format(float_format)
+
     def serialize(self, data):
         """
         Serialize loss map data to a file as a GeoJSON feature collection.
+        The losses are written as soon as they are consumed from `data`,
+        which can be any iterable.
 
         See :meth:`LossMapWriter.serialize` for expected input.
         """
-        _assert_valid_input(data)
-
-        feature_coll = {
-            'type': 'FeatureCollection',
-            'features': [],
-            'oqtype': 'LossMap',
-            # TODO(LB): should we instead use the
-            # openquake.nrmllib.__version__?
-            'oqnrmlversion': '0.4',
-            'oqmetadata': self._create_oqmetadata(),
-        }
+        data = iter(data or ())
+        try:
+            first = next(data)
+        except StopIteration:
+            _assert_valid_input([])
 
+        with NRMLFile(self._dest, 'w') as fh:
+            writer = writers.StreamingGeoJSONWriter(
+                fh, indent=None if self._compact else 4,
+                float_format=self._float_format)
+            writer.serialize(
+                self._gen_features(itertools.chain([first], data)),
+                oqtype='LossMap',
+                # TODO(LB): should we instead use the
+                # openquake.nrmllib.__version__?
+                oqnrmlversion='0.4',
+                oqmetadata=self._create_oqmetadata())
+
+    @staticmethod
+    def _gen_features(data):
+        """
+        Generate the GeoJSON features of the given losses.
+        """
         for loss in data:
             loc = loss.location
 
@@ -506,14 +555,11 @@ class LossMapGeoJSONWriter(LossMapWriter):
                 'properties': {'loss': float(loss.value),
                                'asset_ref': loss.asset_ref},
             }
-            feature_coll['features'].append(loss_node)
 
             if loss.std_dev is not None:
                 loss_node['properties']['std_dev'] = float(loss.std_dev)
 
-        with NRMLFile(self._dest, 'w') as fh:
-            json.dump(feature_coll, fh, sort_keys=True, indent=4,
-                      separators=(',', ': '))
+            yield loss_node
 
     def _create_oqmetadata(self):
         """
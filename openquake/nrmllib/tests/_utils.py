@@ -14,6 +14,8 @@
 # along with NRML.  If not, see <http://www.gnu.org/licenses/>.
 
 import collections
+import itertools
+import numpy
 from nose import tools
 from lxml import etree
 from xml.etree.ElementTree import parse
@@ -23,7 +25,8 @@ from openquake.nrmllib.writers import tostring
 
 
 def deep_eq(a, b):
-    """Deep compare two objects for equality by traversing __dict__s.
+    """Deep compare two objects for equality by traversing __dict__s (or
+    __slots__).
 
     :returns:
         Returns a tuple of (True/False, and an error message if an assertion
@@ -40,7 +43,9 @@ def _deep_eq(a, b):
     """Do the actual deep comparison. If two items up for comparison is not
     equal, a :exception:`AssertionError` is raised (to :function:`deep_eq`).
     """
-    if isinstance(a, (list, tuple)):
+    if isinstance(a, numpy.ndarray):
+        assert numpy.array_equal(a, b), 'Expected %s, got %s' % (a, b)
+    elif isinstance(a, (list, tuple)):
         _test_seq(a, b)
     elif isinstance(a, dict):
         _test_dict(a, b)
@@ -49,6 +54,12 @@ def _deep_eq(a, b):
             'Class mismatch. Expected %s, got %s' % (a.__class__, b.__class__)
         )
         _test_dict(a.__dict__, b.__dict__)
+    elif hasattr(a, '__getstate__'):
+        # objects with __slots__, see `openquake.nrmllib.node.with_slots`
+        assert a.__class__ == b.__class__, (
+            'Class mismatch. Expected %s, got %s' % (a.__class__, b.__class__)
+        )
+        _test_dict(a.__getstate__(), b.__getstate__())
     elif isinstance(a, collections.Iterable) and not isinstance(a, str):
         # If there's a generator or another type of iterable, treat it as a
         # `list`. NOTE: Generators will be exhausted if you do this.
@@ -74,6 +85,21 @@ def _test_seq(a, b):
         _deep_eq(item, b[i])
 
 
+class SyntheticDocument(object):
+    """
+    File-like object generating a document chunk by chunk, without keeping
+    it in memory. Subclasses define the HEAD and the TAIL of the document
+    and pass an iterable over the chunks of the body.
+    """
+    HEAD = TAIL = ''
+
+    def __init__(self, body):
+        self.chunks = itertools.chain([self.HEAD], body, [self.TAIL])
+
+    def read(self, _size):
+        return next(self.chunks, '')
+
+
 def assert_xml_equal(a, b):
     """
     Compare two XML artifacts for equality.
@@ -0,0 +1,82 @@
+# Copyright (c) 2010-2014, GEM Foundation.
+#
+# NRML is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NRML is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with NRML.  If not, see <http://www.gnu.org/licenses/>.
+
+import tempfile
+import unittest
+
+import numpy
+
+from openquake.nrmllib import floatformat
+from openquake.nrmllib.models import HazardCurveData, Location
+from openquake.nrmllib.hazard import writers
+
+
+class FloatFormatTestCase(unittest.TestCase):
+    values = [0.1, 1.0 / 3, 1E-9, 1.0]
+
+    def test_str(self):
+        self.assertEqual(
+            ' '.join([str(x) for x in self.values]),
+            floatformat.format_floats(self.values))
+        self.assertEqual(
+            ' '.join([str(x) for x in numpy.array(self.values)]),
+            floatformat.format_floats(numpy.array(self.values)))
+
+    def test_repr(self):
+        text = floatformat.format_floats(numpy.array(self.values), 'repr')
+        self.assertEqual(self.values, map(float, text.split()))
+
+    def test_printf(self):
+        for values in (self.values, tuple(self.values), iter(self.values),
+                       numpy.array(self.values)):
+            self.assertEqual(
+                '1.000E-01,3.333E-01,1.000E-09,1.000E+00',
+                floatformat.format_floats(values, '%.3E', ','))
+        self.assertEqual('', floatformat.format_floats([], '%.3E'))
+        self.assertEqual('0.1% 0.3', floatformat.format_floats(
+            [0.1, 0.3], '%.1f', '% '))
+
+    def test_float32(self):
+        # the default format is the str of the NumPy scalars
+        values = numpy.array(self.values, numpy.float32)
+        self.assertEqual(' '.join([str(x) for x in values]),
+                         floatformat.format_floats(values))
+        self.assertEqual('0.1', floatformat.format_floats(values[:1]))
+
+    def test_check_float_format(self):
+        self.assertIsNone(floatformat.check_float_format(None))
+        self.assertEqual('%.3E', floatformat.check_float_format('%.3E'))
+        self.assertRaises(ValueError, floatformat.check_float_format,
+                          '%s %s')
+        self.assertRaises(ValueError, floatformat.check_float_format, 'E')
+
+    def test_writer(self):
+        # a writer uses its own format, or the default ones
+        data = [HazardCurveData(Location(1.0, 2.0), numpy.array([0.5, 0.2]))]
+        metadata = dict(investigation_time=50.0, imt='PGA',
+                        imls=[0.1, 0.30000000000000004], statistics='mean')
+        with tempfile.NamedTemporaryFile() as out:
+            writers.HazardCurveXMLWriter(
+                out.name, float_format='%.2E', **metadata).serialize(data)
+            xml = open(out.name).read()
+        self.assertIn('<IMLs>1.00E-01 3.00E-01</IMLs>', xml)
+        self.assertIn('<poEs>5.00E-01 2.00E-01</poEs>', xml)
+        with tempfile.NamedTemporaryFile() as out:
+            writers.HazardCurveXMLWriter(out.name, **metadata).serialize(data)
+            xml = open(out.name).read()
+        self.assertIn('<IMLs>0.1 0.3</IMLs>', xml)
+        self.assertIn('<poEs>0.5 0.2</poEs>', xml)
+        self.assertRaises(ValueError, writers.HazardCurveXMLWriter,
+                          out.name, float_format='%d %d', **metadata)
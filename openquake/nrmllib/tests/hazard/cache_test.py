@@ -0,0 +1,125 @@
+# Copyright (c) 2010-2014, GEM Foundation.
+#
+# NRML is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NRML is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with NRML.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from openquake.nrmllib.tests import _utils
+from openquake.nrmllib.hazard import cache
+from openquake.nrmllib.hazard import parsers
+
+SAMPLE_FILE = 'examples/source_model/mixed.xml'
+
+
+class SourceModelCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = cache.SourceModelCache(self.cache_dir)
+        # a copy of the sample file, to be modified by the tests
+        fd, self.fname = tempfile.mkstemp(suffix='.xml')
+        with os.fdopen(fd, 'w') as f:
+            f.write(open(SAMPLE_FILE).read())
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        os.remove(self.fname)
+
+    def test_parse_cached(self):
+        expected = parsers.SourceModelParser(SAMPLE_FILE).parse()
+        parser = parsers.SourceModelParser(self.fname, self.cache)
+        self.assertIsNone(self.cache.get(self.fname))
+        self.assertTrue(*_utils.deep_eq(expected, parser.parse()))
+        self.assertEqual(1, len(self.cache.entries()))
+
+        # the second time the XML file is not parsed
+        with mock.patch.object(parser, '_parse') as parse:
+            src_model = parser.parse()
+        self.assertEqual(0, parse.call_count)
+        expected = parsers.SourceModelParser(SAMPLE_FILE).parse()
+        self.assertTrue(*_utils.deep_eq(expected, src_model))
+
+    def test_file_like_not_cached(self):
+        with open(self.fname) as f:
+            parsers.SourceModelParser(f, self.cache).parse()
+        self.assertEqual([], self.cache.entries())
+
+    def test_changed_content(self):
+        parsers.SourceModelParser(self.fname, self.cache).parse()
+        with open(self.fname, 'a') as f:
+            f.write('<!-- changed -->\n')
+        self.assertIsNone(self.cache.get(self.fname))
+
+    def test_changed_version(self):
+        parsers.SourceModelParser(self.fname, self.cache).parse()
+        with mock.patch('openquake.nrmllib.__version__', '99.0'):
+            self.assertIsNone(self.cache.get(self.fname))
+
+    def test_changed_format_version(self):
+        parsers.SourceModelParser(self.fname, self.cache).parse()
+        with mock.patch.object(cache, 'CACHE_FORMAT_VERSION', '0'):
+            self.assertIsNone(self.cache.get(self.fname))
+
+    def test_key_computed_once(self):
+        parser = parsers.SourceModelParser(self.fname, self.cache)
+        with mock.patch.object(
+                self.cache, 'key', wraps=self.cache.key) as key:
+            parser.parse()
+        self.assertEqual(1, key.call_count)
+
+    def test_broken_entry(self):
+        parser = parsers.SourceModelParser(self.fname, self.cache)
+        parser.parse()
+        [(_, _, path)] = self.cache.entries()
+        with open(path, 'wb') as f:
+            f.write('not a pickle')
+        # the broken entry is discarded and the file is parsed again
+        with mock.patch.object(
+                parser, '_parse', wraps=parser._parse) as parse:
+            src_model = parser.parse()
+        self.assertEqual(1, parse.call_count)
+        expected = parsers.SourceModelParser(SAMPLE_FILE).parse()
+        self.assertTrue(*_utils.deep_eq(expected, src_model))
+        with open(path, 'rb') as f:
+            self.assertNotEqual('not a pickle', f.read())
+
+    def test_invalidate(self):
+        parsers.SourceModelParser(self.fname, self.cache).parse()
+        self.cache.invalidate(self.fname)
+        self.assertIsNone(self.cache.get(self.fname))
+        self.cache.invalidate(self.fname)  # no error
+
+    def test_lru_eviction(self):
+        parsers.SourceModelParser(self.fname, self.cache).parse()
+        [(_, size, first)] = self.cache.entries()
+        os.utime(first, (0, 0))  # least recently used
+        with open(self.fname, 'a') as f:
+            f.write('<!-- changed -->\n')
+        self.cache.max_size = size
+        parsers.SourceModelParser(self.fname, self.cache).parse()
+        [(_, _, second)] = self.cache.entries()
+        self.assertNotEqual(first, second)
+        self.assertFalse(os.path.exists(first))
+
+    def test_clear(self):
+        parsers.SourceModelParser(self.fname, self.cache).parse()
+        self.cache.clear()
+        self.assertEqual([], self.cache.entries())
+        self.assertEqual(0, self.cache.size())
@@ -15,13 +15,17 @@
 
 
 import StringIO
+import cPickle
 import decimal
+import json
 import os
 import tempfile
 import unittest
 
+import numpy
 from lxml import etree
 
+import openquake.nrmllib
 from openquake.nrmllib import models
 
 from openquake.nrmllib.tests import _utils
@@ -264,6 +268,44 @@ m?ml version='1.0' encoding='utf-8'?>
 
         self.assertTrue(*_utils.deep_eq(exp_src_model, src_model))
 
+    def test_pickle(self):
+        src_model = parsers.SourceModelParser(self.SAMPLE_FILE).parse()
+        sources = list(src_model)
+        for src in sources:
+            self.assertFalse(hasattr(src, '__dict__'))
+        unpickled = cPickle.loads(
+            cPickle.dumps(sources, cPickle.HIGHEST_PROTOCOL))
+        self.assertEqual(sources, unpickled)
+        self.assertTrue(*_utils.deep_eq(
+            list(self._expected_source_model()), unpickled))
+
+    def test_compare_other_types(self):
+        [point] = [src for src in parsers.SourceModelParser(
+            self.SAMPLE_FILE).parse() if type(src) is models.PointSource]
+        for other in (None, 'point', models.AreaSource(), point.geometry):
+            self.assertFalse(point == other)
+            self.assertTrue(point != other)
+        self.assertFalse(models.PointSource() == None)
+        self.assertTrue(models.NodalPlane() != object())
+
+    def test_parse_parallel(self):
+        parser = parsers.SourceModelParser(self.SAMPLE_FILE)
+
+        exp_src_model = self._expected_source_model()
+        src_model = parser.parse_parallel(processes=2, shard_size=2)
+
+        self.assertTrue(*_utils.deep_eq(exp_src_model, src_model))
+
+    def test_parse_parallel_unordered(self):
+        parser = parsers.SourceModelParser(self.SAMPLE_FILE)
+
+        exp_ids = [src.id for src in self._expected_source_model()]
+        src_model = parser.parse_parallel(
+            processes=2, shard_size=3, ordered=False)
+
+        self.assertEqual('Some Source Model', src_model.name)
+        self.assertEqual(exp_ids, sorted(src.id for src in src_model))
+
     def test_probs_sum_to_1(self):
         # We want to test that distribution probabilities sum to 1.
         # Example source model with an area and a point source.
@@ -350,6 +392,85 @@ m?ml version='1.0' encoding='utf-8'?>
             self.assertEqual(
                 1.0, sum([x.probability for x in src.nodal_plane_dist]))
 
+    def test_float_probabilities(self):
+        parser = parsers.SourceModelParser(
+            self.SAMPLE_FILE, probabilities='float')
+        [area, point] = list(parser.parse())[:2]
+        for src in (area, point):
+            self.assertEqual([0.3, 0.7], [x.probability
+                                          for x in src.nodal_plane_dist])
+            self.assertEqual([0.5, 0.5], [x.probability
+                                          for x in src.hypo_depth_dist])
+            self.assertIsInstance(src.nodal_plane_dist[0].probability, float)
+
+    def test_array_probabilities(self):
+        parser = parsers.SourceModelParser(
+            self.SAMPLE_FILE, probabilities='array')
+        point = list(parser.parse())[1]
+        numpy.testing.assert_equal(
+            numpy.array([(0.3, 0.0, 90.0, 0.0), (0.7, 90.0, 45.0, 90.0)],
+                        point.nodal_plane_dist.dtype),
+            point.nodal_plane_dist)
+        self.assertEqual(('probability', 'strike', 'dip', 'rake'),
+                         point.nodal_plane_dist.dtype.names)
+        self.assertEqual([4.0, 8.0], list(point.hypo_depth_dist['depth']))
+        self.assertEqual([0.5, 0.5],
+                         list(point.hypo_depth_dist['probability']))
+
+    def test_float_probabilities_not_summing_to_1(self):
+        source_xml = open(self.SAMPLE_FILE).read().replace(
+            'probability="0.7"', 'probability="0.6"', 1)
+        for probabilities in ('float', 'array'):
+            parser = parsers.SourceModelParser(
+                StringIO.StringIO(source_xml), probabilities=probabilities)
+            with self.assertRaises(ValueError) as ctx:
+                list(parser.parse())
+            self.assertIn('NodalPlane distribution of source 1 sum to 0.9',
+                          str(ctx.exception))
+
+    def test_array_geometry(self):
+        parser = parsers.SourceModelParser(self.SAMPLE_FILE, geometry='array')
+        area, point, simple, complx, char_simple, char_complex, _ = list(
+            parser.parse())
+
+        numpy.testing.assert_equal(
+            [[-122.5, 37.5], [-121.5, 37.5], [-121.5, 38.5], [-122.5, 38.5]],
+            area.geometry.coords)
+        self.assertEqual(
+            'POLYGON((-122.5 37.5, -121.5 37.5, -121.5 38.5, -122.5 38.5, '
+            '-122.5 37.5))', area.geometry.wkt)
+
+        numpy.testing.assert_equal([-122.0, 38.0], point.geometry.coords)
+        self.assertEqual('POINT(-122.0 38.0)', point.geometry.wkt)
+
+        numpy.testing.assert_equal([[-121.8229, 37.7301],
+                                    [-122.0388, 37.8771]],
+                                   simple.geometry.coords)
+        self.assertEqual('LINESTRING(-121.8229 37.7301, -122.0388 37.8771)',
+                         simple.geometry.wkt)
+        self.assertEqual(simple.geometry, char_simple.surface)
+
+        self.assertEqual((3, 3), complx.geometry.top_edge_coords.shape)
+        self.assertEqual(2, len(complx.geometry.int_edges_coords))
+        self.assertEqual(
+            'LINESTRING(-124.704 40.363 5.49326, -124.977 41.214 4.98856, '
+            '-125.14 42.096 4.89734)', complx.geometry.top_edge_wkt)
+        self.assertEqual(2, len(complx.geometry.int_edges))
+        self.assertEqual(complx.geometry, char_complex.surface)
+
+        # setting the WKT discards the coordinates
+        point.geometry.wkt = 'POINT(1.0 2.0)'
+        self.assertIsNone(point.geometry.coords)
+        self.assertEqual('POINT(1.0 2.0)', point.geometry.wkt)
+
+    def test_invalid_geometry(self):
+        self.assertRaises(ValueError, parsers.SourceModelParser,
+                          self.SAMPLE_FILE, geometry='shapely')
+
+    def test_invalid_probabilities(self):
+        self.assertRaises(ValueError, parsers.SourceModelParser,
+                          self.SAMPLE_FILE, probabilities='double')
+
 
 class SiteModelParserTestCase(unittest.TestCase):
     """Tests for :class:`parsers.SiteModelParser`."""
@@ -397,6 +518,23 @@ class SiteModelParserTestCase(unittest.TestCase):
 
         self.assertTrue(*_utils.deep_eq(expected, actual))
 
+    def test_parse_array_geometry(self):
+        parser = parsers.SiteModelParser(self.SAMPLE_FILE, geometry='array')
+        sites = list(parser.parse())
+        numpy.testing.assert_equal([-122.5, 37.5], sites[0].coords)
+        self.assertEqual(['POINT(-122.5 37.5)', 'POINT(-122.6 37.6)',
+                          'POINT(-122.7 37.7)', 'POINT(-122.8 37.8)',
+                          'POINT(-122.9 37.9)'],
+                         [site.wkt for site in sites])
+
+    def test_parse_sub_schema(self):
+        # the site model is validated against site_model.xsd only
+        registry = openquake.nrmllib.SCHEMA_REGISTRY
+        list(parsers.SiteModelParser(self.SAMPLE_FILE).parse())
+        misses = registry.stats()['misses']
+        registry.get('hazard/site_model.xsd')  # already compiled
+        self.assertEqual(misses, registry.stats()['misses'])
+
 
 class RuptureModelParserTestCase(unittest.TestCase):
     SAMPLE_FILES = ['examples/simple-fault-rupture.xml',
@@ -477,6 +615,7 @@ class RuptureModelParserTestCase(unittest.TestCase):
     </bcrMap>
 </nrml>
 '''  # you are trying to parse a bcrMap with a RuptureParser!
+    # the document is valid NRML, but it is rejected by rupture.xsd
 
     def test_parse(self):
         for fname, expected_model in zip(
@@ -491,10 +630,37 @@ class RuptureModelParserTestCase(unittest.TestCase):
                           parsers.RuptureModelParser(inv1).parse)
 
         inv2 = StringIO.StringIO(self.INVALID_2)
-        self.assertRaises(ValueError,
+        self.assertRaises(etree.XMLSyntaxError,
                           parsers.RuptureModelParser(inv2).parse)
 
 
+class SyntheticGMFScenario(_utils.SyntheticDocument):
+    """
+    File-like object generating a scenario GMF document with `num_gmfs`
+    realizations of the PGA on `num_sites` sites, without keeping it in
+    memory.
+    """
+    HEAD = """\
+<?xml version="1.0" encoding="utf-8"?>
+<nrml xmlns="http://openquake.org/xmlns/nrml/0.4">
+  <gmfSet>
+"""
+    TAIL = """\
+  </gmfSet>
+</nrml>
+"""
+
+    def __init__(self, num_gmfs, num_sites):
+        super(SyntheticGMFScenario, self).__init__(
+            self._gen_gmfs(num_gmfs, num_sites))
+
+    def _gen_gmfs(self, num_gmfs, num_sites):
+        for i in xrange(num_gmfs):
+            yield '    <gmf IMT="PGA">\n%s    </gmf>\n' % ''.join(
+                '      <node gmv="%s" lon="%s" lat="45.0"/>\n'
+                % (i * 1E-3, j * 1E-3) for j in xrange(num_sites))
+
+
 class GMFScenarioParserTestCase(unittest.TestCase):
     SAMPLE_FILE = 'examples/gmf-scenario.xml'
     EXPECTED = [
@@ -512,6 +678,250 @@ class GMFScenarioParserTestCase(unittest.TestCase):
         parser = parsers.GMFScenarioParser(self.SAMPLE_FILE)
         self.assertEqual(list(parser.parse()), self.EXPECTED)
 
+    def test_parse_arrays(self):
+        # the same values of the legacy output
+        gmfs = parsers.GMFScenarioParser(self.SAMPLE_FILE).parse_arrays()
+        self.assertEqual(['SA(0.025)', 'PGA', 'PGV'], gmfs.keys())
+        expected = []
+        for imt, (sites, gmvs) in gmfs.iteritems():
+            self.assertEqual(numpy.float64, gmvs.dtype)
+            for (lon, lat), values in zip(sites, gmvs):
+                expected.append((imt, '{%s}' % ','.join(map(str, values)),
+                                 'POINT(%s %s)' % (lon, lat)))
+        self.assertEqual(self.EXPECTED, expected)
+
+        gmfs = parsers.GMFScenarioParser(self.SAMPLE_FILE).parse_arrays(
+            numpy.float32)
+        sites, gmvs = gmfs['PGA']
+        self.assertEqual(numpy.float32, gmvs.dtype)
+        numpy.testing.assert_equal(
+            numpy.array([[0.2, 0.3], [1.4, 1.5], [0.6, 0.7]], numpy.float32),
+            gmvs)
+
+    def test_parse_arrays_missing_sites(self):
+        # the sites are numbered in order of appearance, per IMT, and
+        # the missing values are zeros
+        gmfs = parsers.GMFScenarioParser(StringIO.StringIO(
+            GMF_EVENT_BASED)).parse_arrays()
+        sites, gmvs = gmfs['PGA']
+        numpy.testing.assert_equal([[1, 2], [2, 1], [3, 3]], sites)
+        numpy.testing.assert_equal([[0.1, 0.6], [0.2, 0.5], [0, 0.4]], gmvs)
+        sites, gmvs = gmfs['SA(0.1)']
+        numpy.testing.assert_equal([[2, 1]], sites)
+        numpy.testing.assert_equal([[0.3]], gmvs)
+
+    def test_parse_arrays_memory(self):
+        # the memory occupation is essentially the one of the matrix,
+        # since the parsed elements are discarded
+        try:
+            import psutil
+        except ImportError:
+            raise unittest.SkipTest('psutil not installed')
+        proc = psutil.Process(os.getpid())
+        rss = proc.memory_info().rss
+        gmfs = parsers.GMFScenarioParser(
+            SyntheticGMFScenario(100, 2000)).parse_arrays(numpy.float32)
+        allocated = proc.memory_info().rss - rss
+        sites, gmvs = gmfs['PGA']
+        self.assertEqual((2000, 100), gmvs.shape)
+        numpy.testing.assert_allclose(numpy.arange(2000) * 1E-3, sites[:, 0])
+        self.assertLess(allocated, 10 * 1024 * 1024)  # < 10 MB
+
+
+GMF_EVENT_BASED = """\
+<?xml version='1.0' encoding='UTF-8'?>
+<nrml xmlns="http://openquake.org/xmlns/nrml/0.4">
+  <gmfCollection sourceModelTreePath="b1" gsimTreePath="b2">
+    <gmfSet investigationTime="50.0" stochasticEventSetId="1">
+      <gmf IMT="PGA" ruptureId="r1">
+        <node gmv="0.1" lon="1.0" lat="2.0"/>
+        <node gmv="0.2" lon="2.0" lat="1.0"/>
+      </gmf>
+      <gmf IMT="SA" saPeriod="0.1" saDamping="5.0">
+        <node gmv="0.3" lon="2.0" lat="1.0"/>
+      </gmf>
+    </gmfSet>
+    <gmfSet investigationTime="50.0" stochasticEventSetId="2">
+      <gmf IMT="PGA" ruptureId="r2">
+        <node gmv="0.4" lon="3.0" lat="3.0"/>
+        <node gmv="0.5" lon="2.0" lat="1.0"/>
+        <node gmv="0.6" lon="1.0" lat="2.0"/>
+      </gmf>
+    </gmfSet>
+  </gmfCollection>
+</nrml>
+"""
+
+
+class GMFEventBasedParserTestCase(unittest.TestCase):
+
+    def test_parse(self):
+        parser = parsers.GMFEventBasedParser('examples/gmf-event-based.xml')
+        gmfs = list(parser.parse())
+        self.assertEqual(['SA(0.025)', 'PGA', 'PGV'] * 2,
+                         [gmf.imt for gmf in gmfs])
+        self.assertEqual('rlz=00|ses=0002|src=1|i=0', gmfs[3].rupture_id)
+        for gmf in gmfs:
+            numpy.testing.assert_equal([0.0, 1.0, 0.0], gmf.lons)
+            numpy.testing.assert_equal([0.0, 0.0, 1.0], gmf.lats)
+            numpy.testing.assert_equal([0.2, 1.4, 0.6], gmf.gmvs)
+
+    def test_parse_arrays(self):
+        # the sites are numbered in order of appearance and the missing
+        # ground motion values are zeros
+        parser = parsers.GMFEventBasedParser(
+            StringIO.StringIO(GMF_EVENT_BASED))
+        sites, gmfs = parser.parse_arrays()
+        numpy.testing.assert_equal([[1, 2], [2, 1], [3, 3]], sites)
+        self.assertEqual(['PGA', 'SA(0.1)'], gmfs.keys())
+        rupture_ids, gmvs = gmfs['PGA']
+        self.assertEqual(['r1', 'r2'], rupture_ids)
+        numpy.testing.assert_equal([[0.1, 0.6], [0.2, 0.5], [0, 0.4]], gmvs)
+        rupture_ids, gmvs = gmfs['SA(0.1)']
+        self.assertEqual([None], rupture_ids)
+        numpy.testing.assert_equal([[0], [0.3], [0]], gmvs)
+
+    def test_site_index(self):
+        site_index = parsers._SiteIndex()
+        lons = numpy.random.random(1000).round(1)
+        lats = numpy.random.random(1000).round(1)
+        indices = site_index.indices(lons, lats)
+        sites = site_index.sites()
+        self.assertEqual(len(sites), len(site_index))
+        numpy.testing.assert_equal(numpy.column_stack([lons, lats]),
+                                   sites[indices])
+        # the sites are in order of first appearance
+        first = [indices[:i + 1].max() for i in range(len(indices))]
+        self.assertEqual(range(len(sites)), sorted(set(first)))
+        numpy.testing.assert_equal(
+            indices[::-1], site_index.indices(lons[::-1], lats[::-1]))
+
+
+MULTI_HAZARD_CURVES = """\
+<?xml version='1.0' encoding='UTF-8'?>
+<nrml xmlns:gml="http://www.opengis.net/gml"
+      xmlns="http://openquake.org/xmlns/nrml/0.4">
+  <hazardCurves sourceModelTreePath="b1_b2_b4"
+                gsimTreePath="b1_b4_b5" IMT="SA" investigationTime="50"
+                saPeriod="0.025" saDamping="5.0">
+    <IMLs>0.005 0.007 0.0098</IMLs>
+    <hazardCurve>
+      <gml:Point>
+        <gml:pos>38.0 -20.1</gml:pos>
+      </gml:Point>
+      <poEs>0.1 0.2 0.3</poEs>
+    </hazardCurve>
+    <hazardCurve>
+      <gml:Point>
+        <gml:pos>38.1 -20.2</gml:pos>
+      </gml:Point>
+      <poEs>0.4 0.5 0.6</poEs>
+    </hazardCurve>
+  </hazardCurves>
+  <hazardCurves statistics="mean" IMT="PGA" investigationTime="30">
+    <IMLs>0.05 0.07</IMLs>
+    <hazardCurve>
+      <gml:Point>
+        <gml:pos>38.0 -20.1</gml:pos>
+      </gml:Point>
+      <poEs>0.01 0.02</poEs>
+    </hazardCurve>
+    <hazardCurve>
+      <gml:Point>
+        <gml:pos>38.1 -20.2</gml:pos>
+      </gml:Point>
+      <poEs>0.04 0.05</poEs>
+    </hazardCurve>
+  </hazardCurves>
+</nrml>
+"""
+
+
+class MultiHazardCurveXMLParserTestCase(unittest.TestCase):
+
+    def test_parse(self):
+        parser = parsers.MultiHazardCurveXMLParser(
+            StringIO.StringIO(MULTI_HAZARD_CURVES))
+        sa, pga = [(model.metadata, list(model)) for model in parser.parse()]
+        self.assertEqual('SA', sa[0]['imt'])
+        self.assertEqual('0.025', sa[0]['sa_period'])
+        self.assertEqual('b1_b4_b5', sa[0]['gsimlt_path'])
+        self.assertEqual([0.005, 0.007, 0.0098], sa[0]['imls'])
+        self.assertEqual(
+            [models.HazardCurveData(models.Location(38.0, -20.1),
+                                    [0.1, 0.2, 0.3]),
+             models.HazardCurveData(models.Location(38.1, -20.2),
+                                    [0.4, 0.5, 0.6])], sa[1])
+        self.assertEqual('PGA', pga[0]['imt'])
+        self.assertEqual('mean', pga[0]['statistics'])
+        self.assertEqual([0.05, 0.07], pga[0]['imls'])
+        self.assertEqual([[0.01, 0.02], [0.04, 0.05]],
+                         [curve.poes for curve in pga[1]])
+
+    def test_parse_skip_curves(self):
+        # the curves not consumed are skipped when moving to the next block
+        parser = parsers.MultiHazardCurveXMLParser(
+            StringIO.StringIO(MULTI_HAZARD_CURVES))
+        models_ = parser.parse()
+        sa = next(models_)
+        next(iter(sa))  # consume only the first curve
+        pga = next(models_)
+        self.assertEqual('PGA', pga.imt)
+        self.assertEqual(2, len(list(pga)))
+        self.assertEqual([], list(sa))
+
+    def test_parse_arrays(self):
+        parser = parsers.MultiHazardCurveXMLParser(
+            StringIO.StringIO(MULTI_HAZARD_CURVES))
+        arrays = parser.parse_arrays()
+        self.assertEqual(['SA(0.025)', 'PGA'], arrays.keys())
+        imls, poes = arrays['SA(0.025)']
+        numpy.testing.assert_equal([0.005, 0.007, 0.0098], imls)
+        numpy.testing.assert_equal([[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]], poes)
+        imls, poes = arrays['PGA']
+        numpy.testing.assert_equal([0.05, 0.07], imls)
+        numpy.testing.assert_equal([[0.01, 0.02], [0.04, 0.05]], poes)
+
+    def test_parse_arrays_duplicated_imt(self):
+        xml = MULTI_HAZARD_CURVES.replace('IMT="SA"', 'IMT="PGA"').replace(
+            'saPeriod="0.025" saDamping="5.0"', '')
+        parser = parsers.MultiHazardCurveXMLParser(StringIO.StringIO(xml))
+        self.assertRaises(ValueError, parser.parse_arrays)
+
+
+class SyntheticHazardCurves(_utils.SyntheticDocument):
+    """
+    File-like object generating a hazard curves document with `n` curves,
+    without keeping it in memory.
+    """
+    HEAD = """\
+<?xml version="1.0" encoding="utf-8"?>
+<nrml xmlns:gml="http://www.opengis.net/gml"
+      xmlns="http://openquake.org/xmlns/nrml/0.4">
+  <hazardCurves statistics="mean" IMT="PGA" investigationTime="50.0">
+    <IMLs>0.005 0.007 0.0137</IMLs>
+"""
+    CURVE = """\
+    <hazardCurve>
+      <gml:Point>
+        <gml:pos>%s 37.5</gml:pos>
+      </gml:Point>
+      <poEs>0.98728 0.98266 0.94957</poEs>
+    </hazardCurve>
+"""
+    TAIL = """\
+  </hazardCurves>
+</nrml>
+"""
+
+    def __init__(self, n):
+        super(SyntheticHazardCurves, self).__init__(self._gen_curves(n))
+
+    def _gen_curves(self, n, block=1000):
+        for start in xrange(0, n, block):
+            yield ''.join(self.CURVE % (i * 1E-6)
+                          for i in xrange(start, min(start + block, n)))
+
 
 class HazardCurveParserTestCase(unittest.TestCase):
     EXPECTED_CURVE_1 = models.HazardCurveData(
@@ -598,6 +1008,46 @@ class HazardCurveParserTestCase(unittest.TestCase):
             finally:
                 os.unlink(outfile)
 
+    def test_parse_memory(self):
+        # make sure the memory occupation does not grow while iterating
+        # over the curves (to protect against removing the pruning)
+        try:
+            import psutil
+        except ImportError:
+            raise unittest.SkipTest('psutil not installed')
+        proc = psutil.Process(os.getpid())
+        curves = iter(parsers.HazardCurveXMLParser(
+            SyntheticHazardCurves(1000000)).parse())
+        for _ in xrange(1000):
+            next(curves)
+        rss = proc.memory_info().rss
+        n = 1000 + sum(1 for _ in curves)
+        allocated = proc.memory_info().rss - rss
+        self.assertEqual(1000000, n)
+        self.assertLess(allocated, 10 * 1024 * 1024)  # < 10 MB
+
+    def test_parse_arrays(self):
+        for example in ('hazard-curves-mean.xml', 'hazard-curves-pga.xml',
+                        'hazard-curves-quantile.xml', 'hazard-curves-sa.xml'):
+            infile = os.path.join(DATADIR, example)
+            model = parsers.HazardCurveXMLParser(infile).parse()
+            curves = list(model)
+            imls, lons, lats, poes = parsers.HazardCurveXMLParser(
+                infile).parse_arrays()
+            numpy.testing.assert_equal(model.imls, imls)
+            numpy.testing.assert_equal([c.location.x for c in curves], lons)
+            numpy.testing.assert_equal([c.location.y for c in curves], lats)
+            numpy.testing.assert_equal([c.poes for c in curves], poes)
+            self.assertEqual((len(curves), len(imls)), poes.shape)
+
+    def test_parse_arrays_wrong_poes(self):
+        with open(os.path.join(DATADIR, 'hazard-curves-sa.xml')) as f:
+            xml = f.read().replace('0.94957', '', 1)
+        parser = parsers.HazardCurveXMLParser(StringIO.StringIO(xml))
+        with self.assertRaises(ValueError) as ctx:
+            parser.parse_arrays()
+        self.assertIn('Expected 3 poEs, got 2', str(ctx.exception))
+
     def test_geojson_parsing(self):
         # Test geojson parsing by comparing the
         # parsed values from the xml and geojson parsers.
@@ -621,3 +1071,262 @@ class HazardCurveParserTestCase(unittest.TestCase):
 
             equal, err = _utils.deep_eq(xp.parse(), gp.parse())
             self.assertTrue(equal, err)
+
+    def test_geojson_iter_feature_collection(self):
+        # read the document with a tiny chunk size, so that numbers and
+        # strings are split across chunks
+        geo = 'examples/hazard-curves-sa.geojson'
+        expected = json.load(open(geo))
+        with open(geo) as fh:
+            members = list(parsers._iter_feature_collection(fh, 7))
+        features = [value for name, value in members if name == 'feature']
+        self.assertEqual(expected['features'], features)
+        self.assertEqual(expected['oqmetadata'], dict(members)['oqmetadata'])
+
+    def test_geojson_lazy(self):
+        # the curves are generated one at the time from a file-like
+        # object, also when the metadata come before the features
+        geo = 'examples/hazard-curves-sa.geojson'
+        expected = list(parsers.HazardCurveGeoJSONParser(geo).parse())
+        data = json.load(open(geo))
+        features = data.pop('features')
+        text = json.dumps(data)[:-1] + ', "features": %s}' % (
+            json.dumps(features))
+        model = parsers.HazardCurveGeoJSONParser(
+            StringIO.StringIO(text)).parse()
+        self.assertEqual('SA', model.imt)
+        curves = iter(model)
+        self.assertEqual(expected[0], curves.next())
+        self.assertEqual(expected[1:], list(curves))
+
+    def test_geojson_parse_arrays(self):
+        for geo in ('examples/hazard-curves-pga.geojson',
+                    'examples/hazard-curves-quantile.geojson'):
+            model = parsers.HazardCurveGeoJSONParser(geo).parse()
+            metadata, locations, poes = parsers.HazardCurveGeoJSONParser(
+                geo).parse_arrays()
+            self.assertEqual(model.metadata, metadata)
+            curves = list(model)
+            self.assertEqual((len(curves), 2), locations.shape)
+            self.assertEqual((len(curves), len(model.imls)), poes.shape)
+            numpy.testing.assert_equal(
+                [tuple(c.location) for c in curves], locations)
+            numpy.testing.assert_equal([c.poes for c in curves], poes)
+
+    def test_geojson_not_seekable(self):
+        # a pipe cannot be rewound, so it is read in a single pass
+        geo = 'examples/hazard-curves-sa.geojson'
+        model = parsers.HazardCurveGeoJSONParser(geo).parse()
+        curves = list(model)
+        for method in ('parse', 'parse_arrays'):
+            read_fd, write_fd = os.pipe()
+            with os.fdopen(write_fd, 'w') as f:
+                f.write(open(geo).read())
+            with os.fdopen(read_fd) as pipe:
+                result = getattr(
+                    parsers.HazardCurveGeoJSONParser(pipe), method)()
+                if method == 'parse':
+                    self.assertEqual(model.metadata, result.metadata)
+                    self.assertEqual(curves, list(result))
+                else:
+                    self.assertEqual(model.metadata, result[0])
+                    numpy.testing.assert_equal(
+                        [c.poes for c in curves], result[2])
+
+    def test_geojson_parse_arrays_no_imls(self):
+        data = json.load(open('examples/hazard-curves-sa.geojson'))
+        del data['oqmetadata']['IMLs']
+        parser = parsers.HazardCurveGeoJSONParser(
+            StringIO.StringIO(json.dumps(data)))
+        with self.assertRaises(ValueError) as ctx:
+            parser.parse_arrays()
+        self.assertIn('Missing IMLs', str(ctx.exception))
+
+
+class DisaggXMLParserTestCase(unittest.TestCase):
+
+    def setUp(self):
+        _, self.path = tempfile.mkstemp()
+        self.metadata = dict(
+            investigation_time=50.0, imt='SA', lon=8.33, lat=47.22,
+            sa_period=0.1, sa_damping=5.0, smlt_path='b1', gsimlt_path='b2',
+            mag_bin_edges=[5, 6, 7], dist_bin_edges=[0, 20, 40, 60],
+            lon_bin_edges=[6, 7], lat_bin_edges=[46, 47],
+            eps_bin_edges=[-0.5, 0.5],
+            tectonic_region_types=['active shallow crust',
+                                   'stable continental'])
+        matrix = numpy.arange(6 * 1.0).reshape(2, 3) / 10
+        self.data = [
+            models.DisaggMatrix(matrix, ['Mag', 'Dist'], 0.1, 0.2),
+            models.DisaggMatrix(matrix[1], ['Dist'], 0.1, 0.3),
+            models.DisaggMatrix(matrix.reshape(2, 3, 1),
+                                ['Mag', 'Dist', 'Eps'], 0.1, 0.4),
+        ]
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_parse(self):
+        model = parsers.DisaggXMLParser('examples/disaggregation.xml').parse()
+        self.assertEqual('SA', model.imt)
+        self.assertEqual('0.1', model.sa_period)
+        self.assertEqual('b1_b7', model.gsimlt_path)
+        self.assertIsNone(model.statistics)
+        self.assertIsNone(model.lon_bin_edges)
+        self.assertIsNone(model.tectonic_region_types)
+        numpy.testing.assert_equal([3, 4, 5], model.mag_bin_edges)
+        numpy.testing.assert_equal([-3, 3], model.eps_bin_edges)
+        mag, mag_dist_eps = list(model)
+        numpy.testing.assert_equal([0.57, 0.29], mag.matrix)
+        self.assertEqual(['Mag'], mag.dim_labels)
+        self.assertEqual((0.1, 0.5), (mag.poe, mag.iml))
+        numpy.testing.assert_equal(
+            [[[0.33], [0.21]], [[0.45], [0.001]]], mag_dist_eps.matrix)
+        self.assertEqual(['Mag', 'Dist', 'Eps'], mag_dist_eps.dim_labels)
+
+    def test_round_trip(self):
+        # the cells missing in a sparse matrix are zeros
+        for threshold in (None, 0.0):
+            writers.DisaggXMLWriter(
+                self.path, threshold=threshold, **self.metadata
+            ).serialize(self.data)
+            model = parsers.DisaggXMLParser(self.path).parse()
+            self.assertEqual(
+                self.metadata['tectonic_region_types'],
+                model.tectonic_region_types)
+            numpy.testing.assert_equal(
+                self.metadata['dist_bin_edges'], model.dist_bin_edges)
+            matrices = list(model)
+            self.assertEqual(self.data, [
+                m._replace(matrix=d.matrix)
+                for m, d in zip(matrices, self.data)])
+            for matrix, expected in zip(matrices, self.data):
+                numpy.testing.assert_equal(expected.matrix, matrix.matrix)
+
+    def test_invalid_index(self):
+        xml = open('examples/disaggregation.xml').read().replace(
+            'index="1,1,0"', 'index="1,2,0"')
+        with open(self.path, 'w') as f:
+            f.write(xml)
+        model = parsers.DisaggXMLParser(self.path).parse()
+        with self.assertRaises(ValueError):
+            list(model)
+
+
+class SESXMLParserTestCase(unittest.TestCase):
+
+    def setUp(self):
+        _, self.path = tempfile.mkstemp()
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def _gen_ruptures(self, num_ruptures):
+        # mesh, planar and multi surface ruptures
+        lons = numpy.arange(12.0).reshape(3, 4) / 7
+        corners = dict(top_left_corner=(1.1, 1.01, 10.0),
+                       top_right_corner=(2.1, 2.01, 20.0),
+                       bottom_left_corner=(4.1, 4.01, 40.0),
+                       bottom_right_corner=(3.1, 3.01, 30.0))
+        multi = dict(
+            lons=numpy.array([-1.0, 1.0, -1.0, 1.0, 0.0, 1.1, 0.9, 2.0]),
+            lats=numpy.array([1.0, 1.0, -1.0, -1.0, 1.1, 2.0, 0.0, 0.9]),
+            depths=numpy.array([21., 21., 59., 59., 20., 20., 80., 80.]))
+        for i in xrange(num_ruptures):
+            geometry = dict.fromkeys(models.SESRupture.GEOMETRY_ATTRS)
+            geometry.update([
+                dict(lons=lons, lats=lons + 45, depths=lons * 10),
+                corners, multi][i % 3])
+            yield models.SESRupture(
+                'TAG%d' % i, 5.0 + i % 30 / 10., 10.0, 40.0, 90.0, 'Active',
+                i % 3 == 0, i % 3 == 2, lambda g=geometry: g, seed=i)
+
+    def _write(self, num_ruptures):
+        sess = [models.SES(1, 50.0, self._gen_ruptures(num_ruptures)),
+                models.SES(2, 50.0),  # empty, not written
+                models.SES(3, 40.0, self._gen_ruptures(2))]
+        writers.SESXMLWriter(self.path, 'b1').serialize(sess)
+
+    def test_parse_example(self):
+        collection = parsers.SESXMLParser('examples/ses.xml').parse()
+        self.assertEqual('foo', collection.sm_lt_path)
+        sess = iter(collection)
+        ses1 = sess.next()
+        self.assertEqual((1, 50.0), (ses1.ordinal, ses1.investigation_time))
+        planar, mesh = ses1
+        self.assertEqual('rlz=00,ses=0001,src=231,i=1', planar.tag)
+        self.assertEqual((5.5, 0.0, 45.0, 0.0, 'Active Shallow Crust'),
+                         (planar.magnitude, planar.strike, planar.dip,
+                          planar.rake, planar.tectonic_region_type))
+        self.assertIsNone(planar.seed)
+        self.assertFalse(planar.is_from_fault_source)
+        self.assertFalse(planar.is_multi_surface)
+        self.assertEqual((1.3, 1.3, 1.4), planar.bottom_left_corner)
+        self.assertIsNone(planar.lons)
+        self.assertTrue(mesh.is_from_fault_source)
+        numpy.testing.assert_equal([[0.0, 0.1], [-0.1, -0.2]], mesh.lats)
+        numpy.testing.assert_equal([[0.0, 0.1], [0.2, 0.3]], mesh.depths)
+        self.assertIsNone(mesh.top_left_corner)
+        self.assertEqual(2, len(list(sess.next())))
+        self.assertEqual([], list(sess))
+
+    def test_round_trip(self):
+        self._write(10)
+        expected = open(self.path).read()
+        collection = parsers.SESXMLParser(self.path).parse()
+        sess = list(collection)  # the ruptures are consumed in order
+        self.assertEqual([1, 3], [ses.ordinal for ses in sess])
+        self.assertEqual([], list(sess[0]))
+
+        collection = parsers.SESXMLParser(self.path).parse()
+        writers.SESXMLWriter(self.path, collection.sm_lt_path).serialize(
+            collection)
+        self.assertEqual(expected, open(self.path).read())
+
+    def test_lazy_geometry(self):
+        self._write(30)
+        collection = parsers.SESXMLParser(self.path).parse()
+        ruptures = [rup for ses in collection for rup in ses
+                    if rup.magnitude >= 7.5]
+        self.assertEqual([25, 26, 27, 28, 29],
+                         [rup.seed for rup in ruptures])
+        # the geometry is decoded only when accessed
+        self.assertEqual([None] * 5, [rup._geometry for rup in ruptures])
+        expected = list(self._gen_ruptures(30))
+        for rup in ruptures:
+            exp = expected[rup.seed]
+            numpy.testing.assert_equal(exp.lons, rup.lons)
+            numpy.testing.assert_equal(exp.depths, rup.depths)
+            self.assertEqual(exp.top_right_corner, rup.top_right_corner)
+            self.assertEqual(exp.is_multi_surface, rup.is_multi_surface)
+            self.assertIsNone(rup._load_geometry)
+
+    def test_invalid_mesh(self):
+        self._write(1)
+        xml = open(self.path).read().replace('row="2" col="3"',
+                                             'row="3" col="3"')
+        with open(self.path, 'w') as f:
+            f.write(xml)
+        ses = iter(parsers.SESXMLParser(self.path).parse()).next()
+        [rup] = ses
+        with self.assertRaises(ValueError):
+            rup.lons
+
+    def test_parse_memory(self):
+        # the memory occupation must not grow with the number of ruptures
+        try:
+            import psutil
+        except ImportError:
+            raise unittest.SkipTest('psutil not installed')
+        proc = psutil.Process(os.getpid())
+        num_ruptures = 30000
+        self._write(num_ruptures)
+        rss = []
+        magnitudes = []
+        for ses in parsers.SESXMLParser(self.path).parse():
+            for i, rup in enumerate(ses):
+                if i in (num_ruptures // 10, num_ruptures - 1):
+                    rss.append(proc.memory_info().rss)
+                magnitudes.append(rup.magnitude)
+        self.assertLess(rss[1] - rss[0], 4 * 1024 * 1024)
+        self.assertEqual(num_ruptures + 2, len(magnitudes))
@@ -22,7 +22,10 @@ import tempfile
 import unittest
 
 from collections import namedtuple
+from lxml import etree
 
+from openquake import nrmllib
+from openquake.nrmllib import floatformat
 from openquake.nrmllib.hazard import writers
 from openquake.nrmllib.hazard import parsers
 
@@ -287,6 +290,49 @@ class HazardCurveWriterSerializeTestCase(HazardCurveWriterTestCase):
         utils.assert_xml_equal(expected, self.path)
         self.assertTrue(utils.validates_against_xml_schema(self.path))
 
+    def test_serialize_same_as_tree(self):
+        # the streaming writer must produce exactly the same bytes of
+        # the serialization of the whole lxml tree
+        metadata = dict(
+            investigation_time=self.TIME, imt='SA', imls=self.IMLS,
+            sa_period=0.025, sa_damping=5.0, smlt_path='b1_b2_b4',
+            gsimlt_path='b1_b4_b5'
+        )
+        for data in (self.data, []):
+            writer = writers.HazardCurveXMLWriter(self.path, **metadata)
+            writer.serialize(data)
+
+            root = etree.Element('nrml', nsmap=nrmllib.SERIALIZE_NS_MAP)
+            writer.add_hazard_curves(root, metadata, data)
+            expected = etree.tostring(root, pretty_print=True,
+                                      xml_declaration=True, encoding='UTF-8')
+            self.assertEqual(expected, open(self.path).read())
+
+    def test_serialize_memory(self):
+        # the memory occupation must not grow with the number of curves
+        try:
+            import psutil
+        except ImportError:
+            raise unittest.SkipTest('psutil not installed')
+        proc = psutil.Process(os.getpid())
+        rss = []
+        num_curves = 100000
+
+        def gen_curves():
+            poes = [0.1] * 20
+            for i in xrange(num_curves):
+                if i in (num_curves // 10, num_curves - 1):
+                    rss.append(proc.memory_info().rss)
+                yield HazardCurveData(Location(i * 1E-3, 45.0), poes)
+
+        writer = writers.HazardCurveXMLWriter(
+            self.path, investigation_time=self.TIME, imt='PGA',
+            imls=[0.1] * 20, statistics='mean')
+        writer.serialize(gen_curves())
+        self.assertLess(rss[1] - rss[0], 4 * 1024 * 1024)
+        self.assertEqual(num_curves, open(self.path).read().count(
+            '<hazardCurve>'))
+
     def test_serialize_geojson(self):
         expected = {
             u'features': [
@@ -325,6 +371,13 @@ class HazardCurveWriterSerializeTestCase(HazardCurveWriterTestCase):
         actual = json.load(open(self.path))
         self.assertEqual(expected, actual)
 
+        # compact output, with the curves consumed from a generator
+        writer = writers.HazardCurveGeoJSONWriter(
+            self.path, compact=True, **metadata)
+        writer.serialize(hc for hc in self.data)
+        text = open(self.path).read()
+        self.assertNotIn('\n', text)
+        self.assertEqual(expected, json.loads(text))
 
     def test_serialize_quantile(self):
         # Test serialization of qunatile curves.
@@ -506,6 +559,58 @@ class MultiHazardCurveXMLWriterSerializeTestCase(unittest.TestCase):
         utils.assert_xml_equal(expected, self.path)
         self.assertTrue(utils.validates_against_xml_schema(self.path))
 
+    def test_serialize_same_as_tree(self):
+        # the streaming writer must produce exactly the same bytes of
+        # the serialization of the whole lxml tree
+        metadata1 = dict(
+            investigation_time=50, imt='SA', imls=[0.005, 0.007, 0.0098],
+            sa_period=0.025, sa_damping=5.0, statistics='quantile',
+            quantile_value=0.15)
+        metadata2 = dict(
+            investigation_time=30, imt='PGA', imls=[0.05, 0.07, 0.8],
+            smlt_path='b1_b2_b4', gsimlt_path='b1_b4_b5')
+        for curve_set in ([self.data1, self.data2], [self.data1, []]):
+            writer = writers.MultiHazardCurveXMLWriter(
+                self.path, [metadata1, metadata2])
+            writer.serialize(iter(curve_set))
+
+            root = etree.Element('nrml', nsmap=nrmllib.SERIALIZE_NS_MAP)
+            for metadata, data in zip([metadata1, metadata2], curve_set):
+                writers.HazardCurveXMLWriter(
+                    self.path, **metadata).add_hazard_curves(
+                        root, metadata, data)
+            expected = etree.tostring(root, pretty_print=True,
+                                      xml_declaration=True, encoding='UTF-8')
+            self.assertEqual(expected, open(self.path).read())
+
+    def test_serialize_memory(self):
+        # the memory occupation must not grow with the number of curves
+        try:
+            import psutil
+        except ImportError:
+            raise unittest.SkipTest('psutil not installed')
+        proc = psutil.Process(os.getpid())
+        rss = []
+        num_curves = 50000
+
+        def gen_curves(imt):
+            poes = [0.1] * 20
+            for i in xrange(num_curves):
+                if (imt, i) in (('PGA', 0), ('SA', num_curves - 1)):
+                    rss.append(proc.memory_info().rss)
+                yield HazardCurveData(Location(i * 1E-3, 45.0), poes)
+
+        metadata_set = [
+            dict(investigation_time=50, imt='PGA', imls=[0.1] * 20,
+                 statistics='mean'),
+            dict(investigation_time=50, imt='SA', imls=[0.1] * 20,
+                 sa_period=0.1, sa_damping=5.0, statistics='mean')]
+        writer = writers.MultiHazardCurveXMLWriter(self.path, metadata_set)
+        writer.serialize(gen_curves(md['imt']) for md in metadata_set)
+        self.assertLess(rss[1] - rss[0], 4 * 1024 * 1024)
+        self.assertEqual(2 * num_curves, open(self.path).read().count(
+            '<hazardCurve>'))
+
 
 class EventBasedGMFXMLWriterTestCase(unittest.TestCase):
 
@@ -722,6 +827,154 @@ class SESXMLWriterTestCase(unittest.TestCase):
         finally:
             os.unlink(path)
 
+    def _gen_ses(self, num_ses, num_ruptures):
+        # the odd SES are empty
+        for i in xrange(num_ses):
+            yield SES(i + 1, 50.0, self._gen_ruptures(
+                0 if i % 2 else num_ruptures))
+
+    def _gen_ruptures(self, num_ruptures):
+        lons = numpy.arange(12.0).reshape(3, 4) / 10
+        for i in xrange(num_ruptures):
+            if i % 3 == 0:
+                rup = ProbabilisticRupture(
+                    i, 5.5, 1.0, 40.0, 10.0, 'Active Shallow Crust',
+                    False, False,
+                    top_left_corner=(1.1, 1.01, 10.0),
+                    top_right_corner=(2.1, 2.01, 20.0),
+                    bottom_right_corner=(3.1, 3.01, 30.0),
+                    bottom_left_corner=(4.1, 4.01, 40.0))
+            elif i % 3 == 1:
+                rup = ProbabilisticRupture(
+                    i, 6.5, 0.0, 41.0, 0.0, 'Active Shallow Crust',
+                    True, False, lons=lons, lats=lons + 45, depths=lons * 10)
+            else:
+                rup = ProbabilisticRupture(
+                    i, 7.4, 4.0, 44.0, 14.0, 'Stable Shallow Crust',
+                    False, True,
+                    lons=[-1.0, 1.0, -1.0, 1.0, 0.0, 1.1, 0.9, 2.0],
+                    lats=[1.0, 1.0, -1.0, -1.0, 1.1, 2.0, 0.0, 0.9],
+                    depths=[21.0, 21.0, 59.0, 59.0, 20.0, 20.0, 80.0, 80.0])
+            yield SESRupture(rup, 1, seed=i, tag='TAG%d' % i)
+
+    def test_serialize_same_as_tree(self):
+        # the streaming writer must produce exactly the same bytes of
+        # the serialization of the whole lxml tree
+        _, path = tempfile.mkstemp()
+        try:
+            writers.SESXMLWriter(path, 'b1').serialize(self._gen_ses(4, 7))
+
+            root = etree.Element('nrml', nsmap=nrmllib.SERIALIZE_NS_MAP)
+            ses_container = etree.SubElement(
+                root, 'stochasticEventSetCollection')
+            ses_container.set(writers.SM_TREE_PATH, 'b1')
+            for ses in self._gen_ses(4, 7):
+                ruptures = list(ses)
+                if not ruptures:
+                    continue
+                ses_elem = etree.SubElement(
+                    ses_container, 'stochasticEventSet')
+                ses_elem.set('id', str(ses.ordinal))
+                ses_elem.set('investigationTime', str(ses.investigation_time))
+                for rupture in ruptures:
+                    writers.rupture_to_element(rupture, ses_elem)
+            expected = etree.tostring(root, pretty_print=True,
+                                      xml_declaration=True, encoding='UTF-8')
+            self.assertEqual(expected, open(path).read())
+            self.assertTrue(utils.validates_against_xml_schema(path))
+
+            # no ruptures at all
+            writers.SESXMLWriter(path, 'b1').serialize(self._gen_ses(1, 0))
+            ses_container[:] = []
+            expected = etree.tostring(root, pretty_print=True,
+                                      xml_declaration=True, encoding='UTF-8')
+            self.assertEqual(expected, open(path).read())
+        finally:
+            os.unlink(path)
+
+    def test_rupture_mesh(self):
+        # the vectorized mesh nodes are the same built one by one, both
+        # from NumPy arrays (str gives all the digits) and from lists
+        lons = numpy.random.random((3, 5)) * 360 - 180
+        lats = numpy.random.random((3, 5)) * 180 - 90
+        depths = numpy.random.random((3, 5)) * 100
+        for coords in [(lons, lats, depths),
+                       (lons.tolist(), lats.tolist(), depths.tolist())]:
+            rupture = SESRupture(ProbabilisticRupture(
+                1, 6.5, 0.0, 41.0, 0.0, 'Active Shallow Crust', True, False,
+                *coords), 1, seed=42)
+
+            expected = etree.Element('rupture')
+            expected.append(etree.Comment('rupture seed=42'))
+            for name, value in [('id', 'TAG'), ('magnitude', '6.5'),
+                                ('strike', '0.0'), ('dip', '41.0'),
+                                ('rake', '0.0'),
+                                ('tectonicRegion', 'Active Shallow Crust')]:
+                expected.set(name, value)
+            mesh = etree.SubElement(expected, 'mesh')
+            for i, row in enumerate(coords[0]):
+                for j in range(len(row)):
+                    node = etree.SubElement(mesh, 'node')
+                    node.set('row', str(i))
+                    node.set('col', str(j))
+                    node.set('lon', str(coords[0][i][j]))
+                    node.set('lat', str(coords[1][i][j]))
+                    node.set('depth', str(coords[2][i][j]))
+            mesh.set('rows', '3')
+            mesh.set('cols', '5')
+            expected = etree.tostring(expected, pretty_print=True)
+
+            self.assertEqual(expected, etree.tostring(
+                writers.rupture_to_element(rupture), pretty_print=True))
+            self.assertEqual(expected, writers._rupture_to_xml(rupture))
+
+        rupture.rupture.lons = []
+        self.assertRaises(ValueError, writers.rupture_to_element, rupture)
+        rupture.rupture.lons = lons[:2]
+        self.assertRaises(ValueError, writers._rupture_to_xml, rupture)
+
+    def test_serialize_coords_format(self):
+        _, path = tempfile.mkstemp()
+        try:
+            writers.SESXMLWriter(path, 'b1', float_format='%.3f').serialize(
+                self._gen_ses(1, 3))
+            self.assertTrue(utils.validates_against_xml_schema(path))
+            xml = open(path).read()
+            self.assertIn(
+                '<topLeft lon="1.100" lat="1.010" depth="10.000"/>', xml)
+            self.assertIn('<node row="2" col="3" lon="1.100" lat="46.100" '
+                          'depth="11.000"/>', xml)
+            self.assertIn(
+                '<bottomRight lon="2.000" lat="0.900" depth="80.000"/>', xml)
+        finally:
+            os.unlink(path)
+
+    def test_serialize_memory(self):
+        # the memory occupation must not grow with the number of ruptures
+        try:
+            import psutil
+        except ImportError:
+            raise unittest.SkipTest('psutil not installed')
+        proc = psutil.Process(os.getpid())
+        rss = []
+        num_ruptures = 30000
+
+        def gen_ruptures():
+            for i, rupture in enumerate(self._gen_ruptures(num_ruptures)):
+                if i in (num_ruptures // 10, num_ruptures - 1):
+                    rss.append(proc.memory_info().rss)
+                yield rupture
+
+        _, path = tempfile.mkstemp()
+        try:
+            writers.SESXMLWriter(path, 'b1').serialize(
+                [SES(1, 50.0, gen_ruptures())])
+            self.assertLess(rss[1] - rss[0], 4 * 1024 * 1024)
+            self.assertEqual(num_ruptures, open(path).read().count(
+                '<rupture '))
+        finally:
+            os.unlink(path)
+
 
 class HazardMapWriterTestCase(unittest.TestCase):
 
@@ -872,6 +1125,32 @@ class HazardMapWriterTestCase(unittest.TestCase):
         actual = json.load(open(self.path))
         self.assertEqual(expected, actual)
 
+    def test_serialize_geojson_float_format(self):
+        writer = writers.HazardMapGeoJSONWriter(
+            self.path, compact=True, float_format='%.3E',
+            investigation_time=50.0, imt='PGA', poe=0.1, statistics='mean')
+        writer.serialize([(1.0, 2.0, 0.123456789), (3.0, 4.0, 0.1 + 0.2)])
+        actual = json.load(open(self.path))
+        self.assertEqual([0.123500, 0.3],
+                         [f['properties']['iml'] for f in actual['features']])
+
+    def test_geojson_float_format_checked(self):
+        metadata = dict(investigation_time=50.0, imt='PGA', poe=0.1,
+                        statistics='mean')
+        for fmt in ('%d %d', '%.3E%%'):
+            self.assertRaises(ValueError, writers.HazardMapGeoJSONWriter,
+                              self.path, float_format=fmt, **metadata)
+        curve_metadata = dict(investigation_time=50.0, imt='PGA',
+                              imls=[0.1, 0.2], statistics='mean')
+        self.assertRaises(ValueError, writers.HazardCurveGeoJSONWriter,
+                          self.path, float_format='%d %d', **curve_metadata)
+
+        # 'repr' keeps the floats as they are
+        writers.HazardMapGeoJSONWriter(
+            self.path, float_format='repr', **metadata).serialize(
+            [(1.0, 2.0, 0.1 + 0.2)])
+        [feature] = json.load(open(self.path))['features']
+        self.assertEqual(0.1 + 0.2, feature['properties']['iml'])
 
 
 class DisaggXMLWriterTestCase(unittest.TestCase):
@@ -1087,21 +1366,21 @@ class DisaggXMLWriterTestCase(unittest.TestCase):
 
         matrices = [
             # mag
-            numpy.array([x * 0.01 for x in range(2)]),
+            numpy.arange(2) / 100.0,
             # dist
-            numpy.array([x * 0.01 for x in range(3)]),
+            numpy.arange(3) / 100.0,
             # TRT
-            numpy.array([x * 0.01 for x in range(2)]),
+            numpy.arange(2) / 100.0,
             # mag, dist
-            numpy.array([x * 0.01 for x in range(6)]).reshape((2, 3)),
+            (numpy.arange(6) / 100.0).reshape((2, 3)),
             # mag, dist, eps
-            numpy.array([x * 0.01 for x in range(24)]).reshape((2, 3, 4)),
+            (numpy.arange(24) / 100.0).reshape((2, 3, 4)),
             # lon, lat
-            numpy.array([x * 0.01 for x in range(25)]).reshape((5, 5)),
+            (numpy.arange(25) / 100.0).reshape((5, 5)),
             # mag, lon, lat
-            numpy.array([x * 0.01 for x in range(50)]).reshape((2, 5, 5)),
+            (numpy.arange(50) / 100.0).reshape((2, 5, 5)),
             # lon, lat, trt
-            numpy.array([x * 0.01 for x in range(50)]).reshape((5, 5, 2)),
+            (numpy.arange(50) / 100.0).reshape((5, 5, 2)),
         ]
 
         class DissMatrix(object):
@@ -1152,6 +1431,99 @@ class DisaggXMLWriterTestCase(unittest.TestCase):
         utils.assert_xml_equal(expected, self.path)
         self.assertTrue(utils.validates_against_xml_schema(self.path))
 
+    def test_serialize_same_as_tree(self):
+        # the streaming writer must produce exactly the same bytes of
+        # the serialization of the whole lxml tree
+        writer = writers.DisaggXMLWriter(self.path, **self.metadata)
+        writer.serialize(iter(self.data))
+
+        root = etree.Element('nrml', nsmap=nrmllib.SERIALIZE_NS_MAP)
+        matrices = etree.SubElement(root, 'disaggMatrices')
+        writers._set_metadata(matrices, self.metadata, writers._ATTR_MAP)
+        writers._set_metadata(
+            matrices, self.metadata, writer.BIN_EDGE_ATTR_MAP,
+            transform=lambda val: ', '.join([str(x) for x in val]))
+        for result in self.data:
+            matrix = etree.SubElement(matrices, 'disaggMatrix')
+            matrix.set('type', ','.join(result.dim_labels))
+            matrix.set('dims', ','.join(map(str, result.matrix.shape)))
+            matrix.set('poE', str(result.poe))
+            matrix.set('iml', str(result.iml))
+            for idxs, value in numpy.ndenumerate(result.matrix):
+                prob = etree.SubElement(matrix, 'prob')
+                prob.set('index', ','.join(map(str, idxs)))
+                prob.set('value', str(float(value)))
+        expected = etree.tostring(root, pretty_print=True,
+                                  xml_declaration=True, encoding='UTF-8')
+        self.assertEqual(expected, open(self.path).read())
+
+    def test_serialize_sparse(self):
+        writer = writers.DisaggXMLWriter(
+            self.path, threshold=0.0, **self.metadata)
+        writer.serialize(self.data)
+        self.assertTrue(utils.validates_against_xml_schema(self.path))
+        tree = etree.parse(self.path)
+        probs = tree.xpath('//nrml:prob', namespaces=nrmllib.PARSE_NS_MAP)
+        # the first cell of each of the 8 matrices is zero
+        self.assertEqual(sum(r.matrix.size - 1 for r in self.data),
+                         len(probs))
+        self.assertNotIn('value="0.0"', open(self.path).read())
+
+        # with a high threshold only the first cell of each matrix
+        # is written, to keep the document valid
+        writer = writers.DisaggXMLWriter(
+            self.path, threshold=0.475, **self.metadata)
+        writer.serialize(self.data)
+        self.assertTrue(utils.validates_against_xml_schema(self.path))
+        tree = etree.parse(self.path)
+        values = [(prob.get('index'), prob.get('value')) for prob in tree.xpath(
+            '//nrml:disaggMatrix[@type="Mag,Lon,Lat"]/nrml:prob',
+            namespaces=nrmllib.PARSE_NS_MAP)]
+        self.assertEqual([('1,4,3', '0.48'), ('1,4,4', '0.49')], values)
+        values = [(prob.get('index'), prob.get('value')) for prob in tree.xpath(
+            '//nrml:disaggMatrix[@type="Mag,Dist,Eps"]/nrml:prob',
+            namespaces=nrmllib.PARSE_NS_MAP)]
+        self.assertEqual([('0,0,0', '0.0')], values)
+
+    def test_serialize_chunks(self):
+        # the output does not depend on the number of <prob> elements
+        # formatted at once
+        for threshold in (None, 0.1):
+            for result in self.data:
+                self.assertEqual(
+                    ''.join(writers._gen_probs(result.matrix, threshold, '')),
+                    ''.join(writers._gen_probs(result.matrix, threshold, '',
+                                               chunk_size=7)))
+
+    def test_serialize_float32(self):
+        # the values keep the dtype of the matrix
+        matrix = numpy.array([[0.1, 0.0], [0.25, 1.0 / 3]], numpy.float32)
+        self.assertEqual(
+            '<prob index="0,0" value="0.1"/>\n'
+            '<prob index="1,0" value="0.25"/>\n'
+            '<prob index="1,1" value="0.33333334"/>\n',
+            ''.join(writers._gen_probs(matrix, 0, '')))
+        self.assertEqual(
+            '<prob index="0,0" value="1.000E-01"/>\n',
+            ''.join(writers._gen_probs(matrix, 0.5, '', '%.3E')))
+
+    def test_serialize_full_precision(self):
+        # the values are written as the str of the NumPy scalars, like in
+        # the other writers (with NumPy >= 1.14 the full repr, not the 12
+        # significant digits of the str of a Python float)
+        matrix = numpy.array([0.123456789012345, 0.5])
+        xml = ''.join(writers._gen_probs(matrix, None, ''))
+        self.assertEqual('<prob index="0" value="%s"/>\n'
+                         '<prob index="1" value="0.5"/>\n' % matrix[0], xml)
+        self.assertEqual('%s 0.5' % matrix[0],
+                         floatformat.format_output('poes', matrix))
+
+    def test_serialize_empty_matrix(self):
+        matrix = numpy.zeros((2, 0))
+        for threshold in (None, 0):
+            self.assertEqual(
+                [], list(writers._gen_probs(matrix, threshold, '')))
+
 
 class ScenarioGMFXMLWriterTestCase(unittest.TestCase):
 
@@ -1561,15 +1933,19 @@ class SourceModelXMLWriterTestCase(unittest.TestCase):
   </sourceModel>
 </nrml>"""
 
-        parser = parsers.SourceModelParser(StringIO.StringIO(test_xml))
-        source_model = parser.parse()
+        for probabilities, geometry in zip(parsers.PROBABILITY_TYPES,
+                                           ('wkt', 'array', 'array')):
+            parser = parsers.SourceModelParser(
+                StringIO.StringIO(test_xml), probabilities=probabilities,
+                geometry=geometry)
+            source_model = parser.parse()
 
-        _, path = tempfile.mkstemp()
-        try:
-            writer = writers.SourceModelXMLWriter(path)
-            writer.serialize(source_model)
-
-            utils.assert_xml_equal(StringIO.StringIO(test_xml), path)
-        finally:
-            # cleanup temp files
-            os.unlink(path)
+            _, path = tempfile.mkstemp()
+            try:
+                writer = writers.SourceModelXMLWriter(path)
+                writer.serialize(source_model)
+
+                utils.assert_xml_equal(StringIO.StringIO(test_xml), path)
+            finally:
+                # cleanup temp files
+                os.unlink(path)
@@ -15,9 +15,12 @@
 # along with OpenQuake.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import tempfile
 import unittest
 import StringIO
 
+import numpy
+
 from openquake.nrmllib.risk import parsers
 from openquake.nrmllib import InvalidFile
 
@@ -43,6 +46,25 @@ class ExposureModelParserTestCase(unittest.TestCase):
         self.assertRaises(InvalidFile, parsers.ExposureModelParser,
                           StringIO.StringIO(invalid_exposure))
 
+        # in streaming mode the error is raised while iterating
+        parser = parsers.ExposureModelParser(
+            StringIO.StringIO(invalid_exposure), validation='streaming')
+        self.assertRaises(InvalidFile, list, parser)
+
+        # without validation the invalid file is not even noticed
+        parser = parsers.ExposureModelParser(
+            StringIO.StringIO(invalid_exposure), validation=None)
+        self.assertEqual([], list(parser))
+
+    def test_validation_modes(self):
+        fname = get_example('exposure-portfolio.xml')
+        expected = list(parsers.ExposureModelParser(fname))
+        for validation in ('streaming', None):
+            parser = parsers.ExposureModelParser(fname, validation=validation)
+            self.assertEqual(expected, list(parser))
+        self.assertRaises(ValueError, parsers.ExposureModelParser,
+                          fname, validation='lazy')
+
     def test_parsing(self):
         exposure = """\
 <?xml version='1.0' encoding='utf-8'?>
@@ -141,6 +163,102 @@ class ExposureModelParserTestCase(unittest.TestCase):
                       parsers.Occupancy(50, "night")]][i],
                 asset_data.occupancy)
 
+    def test_to_arrays(self):
+        fname = get_example('exposure-portfolio.xml')
+        assets = list(parsers.ExposureModelParser(fname))
+        for chunk_size in (1, 2, 10):
+            arrays = parsers.ExposureModelParser(fname).to_arrays(chunk_size)
+            self.assertEqual(assets[0].exposure_metadata,
+                             arrays.exposure_metadata)
+            self.assertEqual(['RC/DMRF-D/LR', 'RC/DMRF-D/HR'],
+                             arrays.taxonomies)
+            self.assertEqual(
+                ['day', 'night', 'transit', 'early morning',
+                 'late afternoon'], arrays.occupancy_periods)
+            self.assertEqual(len(assets), len(arrays.assets))
+            for asset, row in zip(assets, arrays.assets):
+                self.assertEqual(asset.asset_ref, row['asset_ref'])
+                self.assertEqual(asset.taxonomy,
+                                 arrays.taxonomies[row['taxonomy']])
+                self.assertEqual(asset.site, (row['lon'], row['lat']))
+                self.assertEqual(asset.number, row['number'])
+                self.assertEqual(asset.area, row['area'])
+                for cost in asset.costs:
+                    self.assertEqual(
+                        cost.value, row['value-%s' % cost.cost_type])
+                    if cost.deductible is None:
+                        self.assertTrue(numpy.isnan(
+                            row['deductible-%s' % cost.cost_type]))
+                    else:
+                        self.assertEqual(
+                            cost.deductible,
+                            row['deductible-%s' % cost.cost_type])
+                for occ in asset.occupancy:
+                    self.assertEqual(
+                        occ.occupants, row['occupants-%s' % occ.period])
+            # asset_03 has no occupants during the day
+            self.assertTrue(numpy.isnan(arrays.assets['occupants-day'][2]))
+
+    def test_iter_chunks(self):
+        fname = get_example('exposure-portfolio.xml')
+        assets = list(parsers.ExposureModelParser(fname))
+        chunks = list(parsers.ExposureModelParser(fname).iter_chunks(2))
+        self.assertEqual([2, 1], map(len, chunks))
+        self.assertEqual(assets, chunks[0] + chunks[1])
+
+    def test_iter_chunks_memory(self):
+        # the memory must not grow with the number of parsed assets
+        try:
+            import psutil
+        except ImportError:
+            raise unittest.SkipTest('psutil not installed')
+        proc = psutil.Process(os.getpid())
+        try:
+            proc.memory_info()
+        except psutil.AccessDenied:
+            raise unittest.SkipTest('Memory info not accessible')
+        with tempfile.NamedTemporaryFile(suffix='.xml') as fh:
+            _write_exposure(fh, 50000)
+            fh.flush()
+            parser = parsers.ExposureModelParser(
+                fh.name, validation='streaming')
+            for i, chunk in enumerate(parser.iter_chunks(1000)):
+                if i == 25:  # measure after the warm up
+                    rss = proc.memory_info().rss
+        allocated = proc.memory_info().rss - rss
+        self.assertLess(allocated, 4 * 1024 * 1024)  # < 4 MB
+
+
+def _write_exposure(fh, n):
+    """
+    Write a synthetic exposure with `n` assets on the given file
+    """
+    fh.write("""\
+<?xml version='1.0' encoding='utf-8'?>
+<nrml xmlns="http://openquake.org/xmlns/nrml/0.4">
+  <exposureModel id="ep" category="buildings" taxonomySource="source">
+    <conversions>
+      <costTypes>
+        <costType name="structural" type="aggregated" unit="USD"/>
+      </costTypes>
+    </conversions>
+    <description>Synthetic exposure</description>
+    <assets>
+""")
+    for i in xrange(n):
+        fh.write("""\
+      <asset id="a%d" number="%d" taxonomy="RC/DMRF-D/LR">
+        <location lon="%.5f" lat="45.0"/>
+        <costs><cost type="structural" value="1000"/></costs>
+        <occupancies><occupancy period="day" occupants="10"/></occupancies>
+      </asset>
+""" % (i, i % 10 + 1, i * 1E-5))
+    fh.write("""\
+    </assets>
+  </exposureModel>
+</nrml>
+""")
+
 
 class VulnerabilityModelParserTestCase(unittest.TestCase):
 
@@ -156,6 +274,12 @@ class VulnerabilityModelParserTestCase(unittest.TestCase):
         self.assertRaises(InvalidFile, parsers.VulnerabilityModelParser,
                           StringIO.StringIO(invalid_vulnerability_model))
 
+    def test_no_validation(self):
+        fname = get_example('vulnerability-model-discrete.xml')
+        self.assertEqual(
+            list(parsers.VulnerabilityModelParser(fname)),
+            list(parsers.VulnerabilityModelParser(fname, validation=None)))
+
     def test_parsing(self):
         vulnerability_model = """\
 <?xml version='1.0' encoding='utf-8'?>
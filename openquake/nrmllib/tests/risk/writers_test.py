@@ -294,6 +294,20 @@ class AggregateLossCurveXMLWriterTestCase(unittest.TestCase):
         _utils.assert_xml_equal(expected, self.filename)
         self.assertTrue(_utils.validates_against_xml_schema(self.filename))
 
+    def test_serialize_float_format(self):
+        writer = writers.AggregateLossCurveXMLWriter(
+            self.filename, investigation_time=10.0, statistics="mean",
+            loss_type="structural", float_format='%.2f')
+        writer.serialize(AGGREGATE_LOSS_CURVE(
+            poes=[1.0, 0.5, 0.1], losses=[10.0, 20.0, 30.0],
+            average_loss=3., stddev_loss=None))
+
+        xml = open(self.filename).read()
+        self.assertIn('<poEs>1.00 0.50 0.10</poEs>', xml)
+        self.assertIn('<losses>10.00 20.00 30.00</losses>', xml)
+        self.assertIn('<averageLoss>3.00</averageLoss>', xml)
+        self.assertTrue(_utils.validates_against_xml_schema(self.filename))
+
     def test_serialize_statistics_metadata(self):
         expected = StringIO.StringIO("""\
 <?xml version='1.0' encoding='UTF-8'?>
@@ -428,6 +442,32 @@ class LossMapWriterTestCase(unittest.TestCase):
         actual = json.load(open(self.filename))
         self.assertEqual(expected, actual)
 
+    def test_serialize_a_model_geojson_compact(self):
+        # the compact output has the same content of the indented one
+        metadata = dict(investigation_time=10.0, poe=0.8,
+                        statistics="mean", loss_type="structural")
+        writers.LossMapGeoJSONWriter(
+            self.filename, **metadata).serialize(self.data)
+        expected = json.load(open(self.filename))
+        self.assertEqual(3, len(expected['features']))
+
+        writer = writers.LossMapGeoJSONWriter(
+            self.filename, compact=True, **metadata)
+        # the losses can be consumed from a generator
+        writer.serialize(loss for loss in self.data)
+        text = open(self.filename).read()
+        self.assertNotIn('\n', text)
+        self.assertEqual(expected, json.loads(text))
+
+        # an empty generator is not supported either
+        self.assertRaises(ValueError, writer.serialize, iter([]))
+
+    def test_geojson_float_format_checked(self):
+        self.assertRaises(
+            ValueError, writers.LossMapGeoJSONWriter, self.filename,
+            investigation_time=10.0, poe=0.8, loss_type="structural",
+            statistics="mean", float_format='%d %d')
+
     def test_serialize_optional_metadata_xml(self):
         expected = StringIO.StringIO("""\
 <?xml version='1.0' encoding='UTF-8'?>
@@ -0,0 +1,76 @@
+# Copyright (c) 2010-2014, GEM Foundation.
+#
+# NRML is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NRML is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with NRML.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import unittest
+
+from lxml import etree
+
+import openquake.nrmllib
+from openquake.nrmllib import SchemaRegistry
+
+
+class SchemaRegistryTestCase(unittest.TestCase):
+    """Tests for :class:`openquake.nrmllib.SchemaRegistry`."""
+
+    def setUp(self):
+        self.registry = SchemaRegistry()
+
+    def test_full_schema_compiled_once(self):
+        schema = self.registry.get()
+        self.assertIs(schema, self.registry.get())
+        stats = self.registry.stats()
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['schemas'])
+        self.assertGreater(stats['compile_time'], 0)
+
+    def test_sub_schema(self):
+        schema = self.registry.get('hazard/site_model.xsd')
+        self.assertIsNot(schema, self.registry.get())
+        self.assertTrue(
+            schema.validate(etree.parse('examples/site_model.xml')))
+        # the hazard curves are not part of the sub-schema
+        self.assertFalse(
+            schema.validate(etree.parse('examples/hazard-curves-pga.xml')))
+
+    def test_sub_schema_key_is_order_independent(self):
+        schema = self.registry.get(
+            'hazard/hazard_curve.xsd', 'hazard/site_model.xsd')
+        self.assertIs(schema, self.registry.get(
+            'hazard/site_model.xsd', 'hazard/hazard_curve.xsd'))
+
+    def test_clear(self):
+        self.registry.get()
+        self.registry.clear()
+        self.assertEqual(dict(hits=0, misses=0, compile_time=0., schemas=0),
+                         self.registry.stats())
+
+    def test_threads(self):
+        schemas = []
+
+        def get():
+            schemas.append(self.registry.get())
+        threads = [threading.Thread(target=get) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, self.registry.stats()['misses'])
+        self.assertEqual(1, len(set(map(id, schemas))))
+
+    def test_shared_registry(self):
+        schema = openquake.nrmllib.get_schema()
+        self.assertIs(schema, openquake.nrmllib.SCHEMA_REGISTRY.get())
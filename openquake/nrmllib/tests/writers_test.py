@@ -1,6 +1,9 @@
 import os
+import json
 import unittest
-from openquake.nrmllib.writers import tostring, StreamingXMLWriter
+import StringIO
+from openquake.nrmllib.writers import (
+    tostring, StreamingXMLWriter, StreamingGeoJSONWriter)
 from lxml import etree
 
 
@@ -62,3 +65,62 @@ xmlns="http://openquake.org/xmlns/nrml/0.4"
                 writer.serialize(asset)
         allocated = proc.get_memory_info().rss - rss
         self.assertLess(allocated, 102400)  # < 100 KB
+
+
+def featuregen(n):
+    "Generate n GeoJSON features for testing purposes"
+    for i in xrange(n):
+        yield {'type': 'Feature',
+               'geometry': {'type': 'Point', 'coordinates': [10.1, 40.9]},
+               'properties': {'poEs': [0.1, 0.30000000000000004],
+                              'id': str(i)}}
+
+
+class StreamingGeoJSONWriterTestCase(unittest.TestCase):
+    members = dict(oqtype='HazardCurve', oqnrmlversion='0.4',
+                   oqmetadata={'IMT': 'PGA', 'IMLs': [0.005, 0.007]})
+
+    def expected(self, features, **kw):
+        coll = dict(self.members, type='FeatureCollection',
+                    features=list(features))
+        return json.dumps(coll, sort_keys=True, **kw)
+
+    def test_same_as_json_dump(self):
+        for n in (0, 1, 3):
+            out = StringIO.StringIO()
+            StreamingGeoJSONWriter(out).serialize(
+                featuregen(n), **self.members)
+            self.assertEqual(
+                self.expected(featuregen(n), indent=4,
+                              separators=(',', ': ')),
+                out.getvalue())
+
+    def test_compact(self):
+        for n in (0, 1, 3):
+            out = StringIO.StringIO()
+            StreamingGeoJSONWriter(out, indent=None).serialize(
+                featuregen(n), **self.members)
+            self.assertEqual(
+                json.loads(self.expected(featuregen(n))),
+                json.loads(out.getvalue()))
+            self.assertNotIn('\n', out.getvalue())
+
+    def test_float_format(self):
+        out = StringIO.StringIO()
+        StreamingGeoJSONWriter(out, float_format='%.5E').serialize(
+            featuregen(1), **self.members)
+        [feature] = json.loads(out.getvalue())['features']
+        self.assertEqual([0.1, 0.3], feature['properties']['poEs'])
+        self.assertNotIn('0.30000000000000004', out.getvalue())
+
+        out = StringIO.StringIO()
+        StreamingGeoJSONWriter(out, float_format='repr').serialize(
+            featuregen(1), **self.members)
+        self.assertEqual(
+            self.expected(featuregen(1), indent=4, separators=(',', ': ')),
+            out.getvalue())
+
+    def test_invalid_float_format(self):
+        for fmt in ('%d %d', 'E', '%.3E%%'):
+            self.assertRaises(ValueError, StreamingGeoJSONWriter,
+                              StringIO.StringIO(), float_format=fmt)
@@ -78,3 +78,35 @@ def coords_to_linestr_wkt(coords, dims):
     points = _group_point_coords(coords, dims)
 
     return _make_wkt(_LINESTRING_FMT, points)
+
+
+def array_to_point_wkt(coords):
+    """
+    Given a 1D numpy array of coordinates, generate POINT WKT.
+
+    :param coords:
+        numpy array with the longitude, latitude and optionally the depth.
+    """
+    return 'POINT(%s)' % ' '.join([str(x) for x in coords.tolist()])
+
+
+def array_to_poly_wkt(coords):
+    """
+    Given a 2D numpy array of coordinates, generate POLYGON WKT.
+
+    :param coords:
+        numpy array of shape (N, dims), where dims is the number of
+        dimensions for the geometry (typically 2 or 3).
+    """
+    return coords_to_poly_wkt(coords.ravel().tolist(), coords.shape[1])
+
+
+def array_to_linestr_wkt(coords):
+    """
+    Given a 2D numpy array of coordinates, generate LINESTRING WKT.
+
+    :param coords:
+        numpy array of shape (N, dims), where dims is the number of
+        dimensions for the geometry (typically 2 or 3).
+    """
+    return coords_to_linestr_wkt(coords.ravel().tolist(), coords.shape[1])
@@ -13,9 +13,12 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with NRML.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
 import cStringIO
 from xml.sax.saxutils import escape, quoteattr
 
+from openquake.nrmllib.floatformat import check_float_format
+
 
 class StreamingXMLWriter(object):
     """
@@ -96,6 +99,126 @@ class StreamingXMLWriter(object):
         pass
 
 
+class StreamingGeoJSONWriter(object):
+    """
+    A stream-based GeoJSON writer for FeatureCollections. The members of
+    the collection are written first, then the features one at the time,
+    as soon as they are consumed from the input iterable, so that the
+    collection is never kept in memory. The typical usage is::
+
+        writer = StreamingGeoJSONWriter(output_file)
+        writer.serialize(featuregenerator(), oqtype='HazardMap', ...)
+
+    With the default indentation the output is the same produced by
+    `json.dump(collection, stream, sort_keys=True, indent=4,
+    separators=(',', ': '))`.
+    """
+    def __init__(self, stream, indent=4, float_format=None):
+        """
+        :param stream: the stream or a file where to write the GeoJSON
+        :param int indent:
+            the indentation to use (default 4 spaces); if None, the output
+            is compact, without newlines nor spaces, and the keys of the
+            features are not sorted, so that the C accelerated encoder of
+            the json module can be used, which is much faster
+        :param str float_format:
+            if given, a format string like '%.5E' used to round the floats
+            in the features; the shortest representation of the rounded
+            value is written. 'repr' is accepted too, and means no rounding
+            as in the default case, since JSON floats are always written
+            with their repr.
+        :raises ValueError:
+            if `float_format` is invalid or does not produce a number
+        """
+        self.stream = stream
+        self.indent = indent
+        self.float_format = check_geojson_float_format(float_format)
+        if indent is None:
+            self.separators = (',', ':')
+        else:
+            self.separators = (',', ': ')
+        self._feature_encoder = json.JSONEncoder(
+            sort_keys=indent is not None, indent=indent,
+            separators=self.separators)
+
+    def _dumps(self, obj):
+        """Convert an object into a JSON string"""
+        return json.dumps(obj, sort_keys=True, indent=self.indent,
+                          separators=self.separators)
+
+    def serialize(self, features, **members):
+        """
+        Write a FeatureCollection.
+
+        :param features:
+            an iterable over features, i.e. dictionaries with keys 'type',
+            'geometry' and 'properties'
+        :param members:
+            other members of the FeatureCollection (like oqtype, oqmetadata)
+        """
+        members['type'] = 'FeatureCollection'
+        members['features'] = []
+        empty = '"features"%s[]' % self.separators[1]
+        head, tail = self._dumps(members).split(empty, 1)
+        if self.indent is None:
+            sep, end = ',', ''
+        else:
+            sep = '\n' + ' ' * (2 * self.indent)
+            end = '\n' + ' ' * self.indent
+        self.stream.write(head + empty[:-1])
+        first = True
+        for feature in features:
+            if self.float_format not in (None, 'repr'):
+                feature = _round_floats(feature, self.float_format)
+            feature = self._feature_encoder.encode(feature)
+            if self.indent is not None:
+                feature = feature.replace('\n', sep)
+                self.stream.write(sep if first else ',' + sep)
+            elif not first:
+                self.stream.write(sep)
+            self.stream.write(feature)
+            first = False
+        if not first:
+            self.stream.write(end)
+        self.stream.write(']' + tail)
+
+
+def check_geojson_float_format(fmt):
+    """
+    :param fmt: None, 'repr' or a printf-style format like '%.5E'
+    :returns: `fmt`
+    :raises ValueError:
+        if the format is invalid or does not produce a number, and then
+        cannot be used to round the floats of a GeoJSON document
+    """
+    check_float_format(fmt)
+    if fmt not in (None, 'repr'):
+        try:
+            float(fmt % 1.0)
+        except ValueError:
+            raise ValueError('Invalid float format %r for GeoJSON, '
+                             'it must produce a number' % fmt)
+    return fmt
+
+
+def _round_floats(obj, float_format):
+    """
+    Round the floats contained in a JSON-serializable object.
+
+    :param obj: a float, list, tuple or dictionary (other objects are
+                returned unchanged)
+    :param str float_format: a format string like '%.5E'
+    """
+    if isinstance(obj, float):
+        return float(float_format % obj)
+    elif isinstance(obj, dict):
+        return dict((k, _round_floats(v, float_format))
+                    for k, v in obj.iteritems())
+    elif isinstance(obj, (list, tuple)):
+        return [_round_floats(v, float_format) for v in obj]
+    return obj
+
+
 def tostring(node, indent=4):
     """
     Convert a node into an XML string by using the StreamingXMLWriter.
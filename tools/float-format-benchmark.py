@@ -0,0 +1,45 @@
+#! /usr/bin/env python
+"""
+This script measures the throughput of the formatting of sequences of
+floats with :func:`openquake.nrmllib.floatformat.format_floats`, compared
+with the per-element `str` previously used by the writers, both for lists
+of floats and for NumPy arrays.
+
+Usage: float-format-benchmark.py [values per sequence] [sequences]
+"""
+
+import sys
+import timeit
+
+import numpy
+
+from openquake.nrmllib.floatformat import format_floats
+
+
+def old_format(values):
+    return ' '.join([str(x) for x in values])
+
+
+def main(size=20, number=50000):
+    array = numpy.random.random(size)
+    values = array.tolist()
+    tests = [
+        ('str (old)', old_format, None),
+        ('format_floats', format_floats, None),
+        ('format_floats repr', format_floats, 'repr'),
+        ('format_floats %.5E', format_floats, '%.5E'),
+    ]
+    print '%d sequences of %d floats' % (number, size)
+    for input_name, data in [('list', values), ('array', array)]:
+        for name, func, fmt in tests:
+            if fmt is None:
+                call = lambda: func(data)
+            else:
+                call = lambda: func(data, fmt)
+            secs = timeit.timeit(call, number=number)
+            print '%-6s %-20s %8.2f Mfloats/s' % (
+                input_name, name, size * number / secs / 1E6)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,67 @@
+#! /usr/bin/env python
+"""
+This script compares the serial and the parallel parsing of a large
+source model, built by replicating the sources of a given source model
+(by default examples/source_model/mixed.xml) with unique ids.
+
+Usage: source-model-benchmark.py [copies] [processes] [shard_size]
+"""
+
+import os
+import re
+import sys
+import time
+import tempfile
+
+from openquake.nrmllib.hazard.parsers import SourceModelParser
+
+SOURCE_MODEL = 'examples/source_model/mixed.xml'
+SOURCE_RE = re.compile(
+    r'(<(pointSource|areaSource|simpleFaultSource|complexFaultSource|'
+    r'characteristicFaultSource)\b.*?</\2\s*>)', re.DOTALL)
+
+
+def replicate(source_model, copies, dest):
+    """
+    Write in `dest` a source model containing `copies` copies of each
+    source of the original source model
+    """
+    with open(source_model) as f:
+        content = f.read()
+    sources = [m.group(1) for m in SOURCE_RE.finditer(content)]
+    start = content.index(sources[0])
+    end = content.rindex(sources[-1]) + len(sources[-1])
+    dest.write(content[:start])
+    for i in xrange(copies):
+        for src in sources:
+            dest.write(re.sub(r'\bid="([^"]*)"', r'id="\1-%d"' % i, src, 1))
+            dest.write('\n')
+    dest.write(content[end:])
+
+
+def timeit(func):
+    t0 = time.time()
+    n = sum(1 for _ in func().sources)
+    return n, time.time() - t0
+
+
+def main(copies=1000, processes=None, shard_size=1000):
+    fd, fname = tempfile.mkstemp(suffix='.xml')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            replicate(SOURCE_MODEL, copies, f)
+        parser = SourceModelParser(fname)
+        n, serial = timeit(parser.parse)
+        print 'serial:    %d sources in %.2fs' % (n, serial)
+        for ordered in (True, False):
+            n, parallel = timeit(lambda: parser.parse_parallel(
+                processes, shard_size, ordered))
+            print 'parallel (ordered=%s): %d sources in %.2fs, ' \
+                'speedup %.2fx' % (ordered, n, parallel, serial / parallel)
+    finally:
+        os.remove(fname)
+
+
+if __name__ == '__main__':
+    args = map(int, sys.argv[1:])
+    main(*args)
@@ -0,0 +1,59 @@
+#! /usr/bin/env python
+"""
+This script manages the on-disk cache of parsed source models used by
+the SourceModelParser (see openquake.nrmllib.hazard.cache).
+
+Usage:
+    source-model-cache.py prewarm source_model.xml [source_model.xml ...]
+    source-model-cache.py invalidate source_model.xml [...]
+    source-model-cache.py info
+    source-model-cache.py clear
+"""
+
+import time
+import argparse
+
+from openquake.nrmllib.hazard import cache
+from openquake.nrmllib.hazard.parsers import SourceModelParser
+
+
+def prewarm(smcache, fnames):
+    for fname in fnames:
+        t0 = time.time()
+        src_model = SourceModelParser(fname, smcache).parse()
+        print '%s: %d sources cached in %.2fs' % (
+            fname, len(src_model.sources), time.time() - t0)
+
+
+def invalidate(smcache, fnames):
+    for fname in fnames:
+        smcache.invalidate(fname)
+
+
+def info(smcache, fnames):
+    entries = smcache.entries()
+    print '%s: %d entries, %d/%d bytes' % (
+        smcache.cache_dir, len(entries), smcache.size(), smcache.max_size)
+    for mtime, size, path in reversed(entries):
+        print '%s %10d %s' % (time.ctime(mtime), size, path)
+
+
+def clear(smcache, fnames):
+    smcache.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('command',
+                        choices=['prewarm', 'invalidate', 'info', 'clear'])
+    parser.add_argument('fnames', nargs='*', metavar='source_model.xml')
+    parser.add_argument('--cache-dir', default=cache.DEFAULT_CACHE_DIR)
+    parser.add_argument('--max-size', type=int, default=cache.DEFAULT_MAX_SIZE,
+                        help='maximum size of the cache in bytes')
+    args = parser.parse_args()
+    smcache = cache.SourceModelCache(args.cache_dir, args.max_size)
+    globals()[args.command](smcache, args.fnames)
+
+
+if __name__ == '__main__':
+    main()
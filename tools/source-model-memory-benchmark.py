@@ -0,0 +1,72 @@
+#! /usr/bin/env python
+"""
+This script measures the memory occupied by a large parsed source model,
+made of point sources with nodal plane and hypocentral depth
+distributions, kept in memory as a list of model objects.
+
+Usage: source-model-memory-benchmark.py [num_sources]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+import psutil
+
+from openquake.nrmllib.hazard.parsers import SourceModelParser
+
+POINT_SOURCE = '''\
+<pointSource id="%(id)d" name="point" tectonicRegion="Active Shallow Crust">
+    <pointGeometry>
+        <gml:Point><gml:pos>%(lon)s %(lat)s</gml:pos></gml:Point>
+        <upperSeismoDepth>0.0</upperSeismoDepth>
+        <lowerSeismoDepth>10.0</lowerSeismoDepth>
+    </pointGeometry>
+    <magScaleRel>WC1994</magScaleRel>
+    <ruptAspectRatio>1.5</ruptAspectRatio>
+    <truncGutenbergRichterMFD aValue="-3.5" bValue="1.0" minMag="5.0"
+                              maxMag="6.5" />
+    <nodalPlaneDist>
+        <nodalPlane probability="0.3" strike="0.0" dip="90.0" rake="0.0" />
+        <nodalPlane probability="0.7" strike="90.0" dip="45.0" rake="90.0" />
+    </nodalPlaneDist>
+    <hypoDepthDist>
+        <hypoDepth probability="0.5" depth="4.0" />
+        <hypoDepth probability="0.5" depth="8.0" />
+    </hypoDepthDist>
+</pointSource>
+'''
+
+
+def write_source_model(dest, num_sources):
+    dest.write('''<?xml version='1.0' encoding='utf-8'?>
+<nrml xmlns:gml="http://www.opengis.net/gml"
+      xmlns="http://openquake.org/xmlns/nrml/0.4">
+<sourceModel name="benchmark">
+''')
+    for i in xrange(num_sources):
+        dest.write(POINT_SOURCE % dict(
+            id=i, lon=-180 + i % 3600 * .1, lat=-90 + i // 3600 * .1))
+    dest.write('</sourceModel>\n</nrml>\n')
+
+
+def main(num_sources=100000):
+    proc = psutil.Process(os.getpid())
+    fd, fname = tempfile.mkstemp(suffix='.xml')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            write_source_model(f, num_sources)
+        rss = proc.memory_info().rss
+        t0 = time.time()
+        sources = list(SourceModelParser(fname).parse())
+        dt = time.time() - t0
+        mem = proc.memory_info().rss - rss
+        print '%d point sources parsed in %.1fs, %.1f MB (%d bytes/source)' \
+            % (len(sources), dt, mem / 1024. ** 2, mem / len(sources))
+    finally:
+        os.remove(fname)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
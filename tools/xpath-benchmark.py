@@ -0,0 +1,53 @@
+#! /usr/bin/env python
+"""
+This script measures the cost of parsing a single seismic source element
+with the precompiled XPath evaluators used by the SourceModelParser,
+compared with the string XPath queries on descendants used previously,
+which were recompiled by lxml at each call.
+
+Usage: xpath-benchmark.py [source_model.xml] [repetitions]
+"""
+
+import sys
+import timeit
+
+from lxml import etree
+
+from openquake import nrmllib
+from openquake.nrmllib.hazard.parsers import SourceModelParser
+
+SOURCE_MODEL = 'examples/source_model/mixed.xml'
+
+# the queries previously performed on each point/area source
+OLD_QUERIES = ['./nrml:magScaleRel', './nrml:ruptAspectRatio',
+               './/nrml:truncGutenbergRichterMFD | .//nrml:incrementalMFD',
+               './/nrml:nodalPlane', './/nrml:hypoDepth',
+               './/gml:posList', './/gml:pos',
+               './/nrml:upperSeismoDepth', './/nrml:lowerSeismoDepth']
+
+
+def old_queries(elem):
+    for expr in OLD_QUERIES:
+        elem.xpath(expr, namespaces=nrmllib.PARSE_NS_MAP)
+
+
+def main(source_model=SOURCE_MODEL, number=2000):
+    parser = SourceModelParser(source_model)
+    tree = etree.parse(source_model)
+    [sm_elem] = tree.getroot()
+    for src_elem in sm_elem.iterchildren(tag=etree.Element):
+        parse = parser._parse_fn_map[src_elem.tag]
+        tag = src_elem.tag.split('}')[1]
+        new = timeit.timeit(lambda: parse(src_elem), number=number)
+        print '%-26s %6.1f us per source' % (tag, new / number * 1E6)
+        if tag in ('pointSource', 'areaSource'):
+            old = timeit.timeit(lambda: old_queries(src_elem), number=number)
+            print '%-26s %6.1f us of string XPath queries per source' % (
+                '', old / number * 1E6)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if len(args) > 1:
+        args[1] = int(args[1])
+    main(*args)